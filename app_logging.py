@@ -0,0 +1,176 @@
+# app_logging.py
+"""
+Логирование без блокировки event loop: записи уходят в очередь (QueueHandler), в stdout
+(systemd -> /var/log/*.log) их пишет фоновый поток (QueueListener).
+
+- Уровень отсекается до форматирования: logger.debug("... %s", Redacted(payload)) при LOG_LEVEL=INFO
+  не сериализует payload вообще. Сообщение собирается (%-подстановка, json.dumps) в фоновом потоке;
+  в вызывающем — только снимок с маскировкой для аргументов Redacted, их могут изменить дальше.
+- Частые события (по каждому товару/запросу) — с extra=sampled(): пишется доля LOG_SAMPLE_RATE;
+  WARNING и выше не сэмплируются.
+- Переполненная очередь не тормозит обработчики: лишние записи выбрасываются и считаются.
+- Данные платежей и пользователей маскируются (REDACT_KEYS), длинные дампы обрезаются.
+- LOG_FORMAT=json — одна JSON-строка на запись, с trace_id текущей трассы (tracing.py).
+"""
+import os
+import sys
+import json
+import queue
+import random
+import atexit
+import logging
+import logging.handlers
+from typing import Any, Dict, Optional
+
+from tracing import current_span
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# text — как раньше, человекочитаемо; json — для сборщиков логов
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text")
+LOG_QUEUE_MAX = int(os.getenv("LOG_QUEUE_MAX", "10000"))
+# Доля сэмплируемых событий (extra=sampled()), которые всё-таки пишем
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", "0.1"))
+# Дамп структуры (Redacted) длиннее этого обрезается
+LOG_MAX_DUMP = int(os.getenv("LOG_MAX_DUMP", "2000"))
+
+# Ключи, значения которых не попадают в логи (сравнение без учёта регистра)
+REDACT_KEYS = frozenset({
+    "phone", "phone_number", "email", "customer", "payment_method", "card", "authorization_details",
+    "confirmation_url", "provider_token", "provider_data", "parse_token", "token", "secret", "password",
+    "auth", "authorization", "receipt",
+})
+REDACTED = "***"
+
+
+def redact(obj: Any, depth: int = 0) -> Any:
+    """Копия dict/list, где значения чувствительных ключей заменены на ***."""
+    if depth > 8:
+        return "…"
+    if isinstance(obj, dict):
+        return {
+            k: REDACTED if isinstance(k, str) and k.lower() in REDACT_KEYS else redact(v, depth + 1)
+            for k, v in obj.items()
+        }
+    if isinstance(obj, (list, tuple)):
+        return [redact(v, depth + 1) for v in obj]
+    return obj
+
+
+class Redacted:
+    """Аргумент лога: структура сериализуется (с маскировкой) только если запись действительно пишется."""
+
+    __slots__ = ("obj", "frozen")
+
+    def __init__(self, obj: Any, frozen: bool = False):
+        self.obj = obj
+        self.frozen = frozen
+
+    def freeze(self) -> "Redacted":
+        """Маскированная копия на момент вызова — её уже безопасно сериализовать в другом потоке."""
+        if self.frozen:
+            return self
+        obj = self.obj.to_dict() if hasattr(self.obj, "to_dict") else self.obj
+        return Redacted(redact(obj), frozen=True)
+
+    def __str__(self) -> str:
+        obj = self.freeze().obj
+        text = json.dumps(obj, ensure_ascii=False, default=str)
+        if len(text) > LOG_MAX_DUMP:
+            return f"{text[:LOG_MAX_DUMP]}… (+{len(text) - LOG_MAX_DUMP} симв.)"
+        return text
+
+
+def sampled(rate: Optional[float] = None) -> Dict[str, float]:
+    """extra для частых событий: logger.info("...", x, extra=sampled())."""
+    return {"sample_rate": LOG_SAMPLE_RATE if rate is None else rate}
+
+
+class _SamplingFilter(logging.Filter):
+    def filter(self, record: logging.LogRecord) -> bool:
+        rate = getattr(record, "sample_rate", None)
+        if rate is None or record.levelno >= logging.WARNING:
+            return True
+        return random.random() < rate
+
+
+class _NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """
+    Не ждёт места в очереди и не форматирует: сообщение собирает фоновый поток.
+    trace_id берём здесь, пока мы ещё в контексте вызывающей корутины.
+    """
+
+    dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        s = current_span()
+        record.trace_id = s.root.trace_id if s is not None else None
+        if isinstance(record.args, tuple) and record.args:
+            record.args = tuple(a.freeze() if isinstance(a, Redacted) else a for a in record.args)
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            _NonBlockingQueueHandler.dropped += 1
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        if getattr(record, "trace_id", None):
+            data["trace_id"] = record.trace_id
+        if getattr(record, "sample_rate", None) is not None:
+            data["sample_rate"] = record.sample_rate
+        return json.dumps(data, ensure_ascii=False)
+
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def setup_logging(level: str = LOG_LEVEL) -> None:
+    """Корневой логгер -> очередь -> фоновый поток -> stdout. Повторный вызов ничего не делает."""
+    global _listener
+    root = logging.getLogger()
+    root.setLevel(level)
+    # DEBUG/INFO httpx/httpcore — это каждый запрос к Bot API, только явно
+    for name in ("httpx", "httpcore"):
+        logging.getLogger(name).setLevel(max(logging.WARNING, root.level))
+    if _listener is not None:
+        return
+
+    output = logging.StreamHandler(sys.stdout)
+    if LOG_FORMAT == "json":
+        output.setFormatter(JsonFormatter())
+    else:
+        output.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+
+    log_queue: "queue.Queue[logging.LogRecord]" = queue.Queue(maxsize=LOG_QUEUE_MAX)
+    handler = _NonBlockingQueueHandler(log_queue)
+    handler.addFilter(_SamplingFilter())
+    for old in list(root.handlers):
+        root.removeHandler(old)
+    root.addHandler(handler)
+
+    _listener = logging.handlers.QueueListener(log_queue, output, respect_handler_level=True)
+    _listener.start()
+    atexit.register(shutdown_logging)
+
+
+def shutdown_logging() -> None:
+    """Дописать очередь и остановить фоновый поток."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+    if _NonBlockingQueueHandler.dropped:
+        print(f"⚠️ Логи: выброшено {_NonBlockingQueueHandler.dropped} записей (очередь переполнена)")
+
+
+def dropped_records() -> int:
+    return _NonBlockingQueueHandler.dropped
@@ -1,45 +1,92 @@
-from fastapi import FastAPI, Request, Depends, Query
+from fastapi import FastAPI, Request, Depends, Query, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import Response
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.date import DateTrigger
 from sqlalchemy.future import select
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.exc import OperationalError, InterfaceError
-from sqlalchemy import text
-from datetime import datetime, timezone
+from sqlalchemy import text, update
+from datetime import datetime, timezone, timedelta
 import httpx, uuid, hashlib, json
-from yookassa import Configuration, Payment
-from telegram import Bot
+import pytz
 import os
 import re
-from database.db import get_session, AsyncSessionLocal
-from database.models import Product, User, ProductStatus
-from new_parser import parse_wb_product_api
+import importlib
+import hmac
+from database.db import get_session, session_scope, pool_status, POOL_STATS
+from database.models import Product, User, ProductStatus, to_tg_id
+from database import queries
+from metrics import (
+    MetricsMiddleware, UpstreamMetricsTransport, instrument_scheduler, instrument_db_pool,
+    instrument_loop_monitor, instrument_memory_monitor, render_metrics,
+)
+from loop_monitor import MONITOR as LOOP_MONITOR
+from memory_monitor import MONITOR as MEMORY_MONITOR
+from tracing import (
+    TracingMiddleware, set_service, set_attrs, join_trace, current_traceparent, traced, detach_scheduler,
+)
+from app_logging import setup_logging, Redacted, sampled
+from json_codec import FastJSONResponse, loads
 import html  
 from dotenv import load_dotenv
 import time
 import asyncio
+import logging
 
 
 load_dotenv()
+setup_logging()
+logger = logging.getLogger("backend")
 
 BOT_TOKEN = os.getenv("BOT_TOKEN")
-bot = Bot(BOT_TOKEN)
 
 CHANNEL_ID = "@wbsupervygoda" 
 TELEGRAM_PROVIDER_TOKEN=os.getenv("TELEGRAM_PROVIDER_TOKEN")
+# Базовые адреса API (для нагрузочных прогонов — на локальные заглушки standin.py)
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL", "https://api.telegram.org").rstrip("/")
+YOOKASSA_API_URL = os.getenv("YOOKASSA_API_URL", "https://api.yookassa.ru/v3").rstrip("/")
 PENDING_MESSAGES: dict[str, dict] = {}
 YK_PENDING: dict[str, dict] = {}
 PROCESSED_PAYMENTS: dict[str, dict] = {} 
+# 🔐 Диагностика воркера (/metrics, /api/admin/loop, db_pool, memory) отдаёт стеки, внутреннее состояние и может
+# надолго занять воркер: только с заголовком X-Admin-Token; пока ADMIN_API_TOKEN не задан, эндпоинты закрыты
+ADMIN_API_TOKEN = os.getenv("ADMIN_API_TOKEN", "")
+ADMIN_TOKEN_HEADER = "X-Admin-Token"
 
-bot = Bot(token=BOT_TOKEN)
+# 🧊 Модули, нужные не каждому запросу (парсер WB на aiohttp, история цен и правила на numpy):
+# импортируются там, где используются, и прогреваются в фоне после старта воркера
+DEFERRED_IMPORTS = ("new_parser", "parse_snapshots", "price_history", "change_rules", "product_refresh")
 
-app = FastAPI() 
+_bot = None
+_deferred_startup_task = None
 
-scheduler = AsyncIOScheduler()
-scheduler.start()
 
+def get_bot():
+    """Bot для постов и уведомлений; python-telegram-bot импортируется при первой отправке, а не при старте воркера."""
+    global _bot
+    if _bot is None:
+        from telegram import Bot
+        from metrics import MetricsHTTPXRequest
+        _bot = Bot(token=BOT_TOKEN, base_url=f"{TELEGRAM_API_URL}/bot", request=MetricsHTTPXRequest())
+    return _bot
+
+
+set_service("backend")
+
+# ответы — через json_codec (orjson); крупные отдаются FastJSONResponse напрямую, минуя jsonable_encoder
+app = FastAPI(default_response_class=FastJSONResponse)
+
+# Запускается и наполняется фоновыми задачами в startup_event (нужен работающий event loop)
+scheduler = AsyncIOScheduler()
+instrument_scheduler(scheduler)
+detach_scheduler(scheduler)
+instrument_db_pool(POOL_STATS)
+instrument_loop_monitor(LOOP_MONITOR)
+instrument_memory_monitor(MEMORY_MONITOR)
+
+app.add_middleware(MetricsMiddleware)
+app.add_middleware(TracingMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],  # можно указать ["http://localhost:5173"] если хочешь строго
@@ -57,16 +104,80 @@ def _sanitize_meta_field(value: any, max_len: int = 128) -> str:
         return s[:max_len]
     return s
 
+def require_admin(request: Request) -> None:
+    """Зависимость диагностических эндпоинтов: 403 без верного X-Admin-Token."""
+    token = request.headers.get(ADMIN_TOKEN_HEADER, "")
+    if not ADMIN_API_TOKEN or not hmac.compare_digest(token.encode(), ADMIN_API_TOKEN.encode()):
+        raise HTTPException(status_code=403)
+
 @app.on_event("startup")
 async def startup_event():
+    global _deferred_startup_task
     from database.db import test_connection
+    from database.partitions import ensure_partitions_job
     await test_connection()
+    # 📈 партиция текущего месяца нужна первой же записи истории цен (DEFAULT-партиции нет) — до первого запроса
+    await ensure_partitions_job()
+    scheduler.add_job(
+        ensure_partitions_job,
+        "interval",
+        days=1,
+        id="price_history_partitions",
+        replace_existing=True,
+        coalesce=True,
+    )
+    scheduler.start()
+    # 🩺 лаг event loop и стеки блокирующего кода этого воркера
+    LOOP_MONITOR.start("backend")
+    # 🧮 размеры реестров этого воркера, RSS и (MEMORY_TRACE=1) рост аллокаций
+    MEMORY_MONITOR.register("backend.PENDING_MESSAGES", PENDING_MESSAGES)
+    MEMORY_MONITOR.register("backend.YK_PENDING", YK_PENDING)
+    MEMORY_MONITOR.register("backend.PROCESSED_PAYMENTS", PROCESSED_PAYMENTS)
+    MEMORY_MONITOR.register(
+        "backend.scheduler_jobs", lambda: [(job.id, job.args, job.kwargs) for job in scheduler.get_jobs()],
+    )
+    MEMORY_MONITOR.start("backend")
+    # ⏳ периодические задачи и тяжёлые импорты — не задерживая первый запрос воркера
+    _deferred_startup_task = asyncio.create_task(deferred_startup())
+
+
+async def deferred_startup():
+    started = time.perf_counter()
+    try:
+        # импорт в отдельном потоке: event loop продолжает обслуживать запросы
+        for name in DEFERRED_IMPORTS:
+            await asyncio.to_thread(importlib.import_module, name)
+        from product_refresh import refresh_due_products_job, REFRESH_INTERVAL_MINUTES
+
+        # 🔄 Свежие цены/остатки для товаров, которые скоро выйдут
+        scheduler.add_job(
+            refresh_due_products_job,
+            "interval",
+            minutes=REFRESH_INTERVAL_MINUTES,
+            id="refresh_due_products",
+            replace_existing=True,
+            max_instances=1,
+            coalesce=True,
+        )
+        logger.info("🧊 Отложенный старт завершён за %.0f мс", (time.perf_counter() - started) * 1000)
+    except Exception as e:
+        logger.error("❌ Отложенный старт не удался: %s", e)
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    if _deferred_startup_task is not None and not _deferred_startup_task.done():
+        _deferred_startup_task.cancel()
+    if scheduler.running:
+        scheduler.shutdown(wait=False)
+    LOOP_MONITOR.stop()
+    MEMORY_MONITOR.stop()
 
 
 @app.post("/api/payments/create")
 async def create_payment(request: Request):
     try:
-        data = await request.json()
+        data = loads(await request.body())
     except Exception:
         data = {}
 
@@ -78,6 +189,8 @@ async def create_payment(request: Request):
     meta = data.get("meta", {}) or {}
 
     order_id = str(uuid.uuid4())
+    # 🧵 этот запрос — начало трассы заказа; её traceparent едет дальше в metadata платежа
+    set_attrs(order_id=order_id)
 
     title = "Оплата размещения товара"
     description = f"Размещение товара: {meta.get('name', 'Товар')}"
@@ -95,9 +208,12 @@ async def create_payment(request: Request):
         "price": _sanitize_meta_field(meta.get("price", ""), 32),
         "scheduled_date": _sanitize_meta_field(meta.get("scheduled_date", ""), 64),
         "category": _sanitize_meta_field(meta.get("category", ""), 64),
+        # снимок превью-парсинга — чтобы после оплаты не парсить WB заново
+        "parse_token": _sanitize_meta_field(meta.get("parse_token", ""), 128),
+        "traceparent": current_traceparent() or "",
     }
 
-    print("🧾 SAFE META:", safe_meta)
+    logger.debug("🧾 SAFE META: %s", Redacted(safe_meta))
 
     # ⚙️ Создаём платёж в YooKassa (тест или боевой режим)
     yookassa_secret = os.getenv("YOOKASSA_SECRET_KEY")
@@ -109,11 +225,11 @@ async def create_payment(request: Request):
     yookassa_payment = {}
     
     if not yookassa_secret or not yookassa_account:
-        print("⚠️ Не удалось получить ключи YooKassa")
+        logger.warning("⚠️ Не удалось получить ключи YooKassa")
     else:
-        async with httpx.AsyncClient() as client:
+        async with httpx.AsyncClient(transport=UpstreamMetricsTransport("yookassa")) as client:
             yookassa_payment = await client.post(
-                "https://api.yookassa.ru/v3/payments",
+                f"{YOOKASSA_API_URL}/payments",
                 auth=(yookassa_account, yookassa_secret),
                 headers={"Idempotence-Key": order_id},
                 json={
@@ -149,7 +265,7 @@ async def create_payment(request: Request):
                 },
                 timeout=10.0,
             )
-            yookassa_payment = yookassa_payment.json()
+            yookassa_payment = loads(yookassa_payment.content)
 
     # 🧠 Возвращаем данные для Telegram Bot API
     payment_id = yookassa_payment.get("id")
@@ -171,11 +287,14 @@ async def create_payment(request: Request):
         "yookassa_payment_id": payment_id,
     }
 
-async def publish_product(product_id: int, max_retries: int = 3):
+@traced("publish_product")
+async def publish_product(product_id: int, max_retries: int = 3, traceparent: str = None):
     """Публикует товар в канал с автопереподключением к БД при обрывах.
     Если категория = 18+, фото скрывается (спойлерится).
+    traceparent — трасса заказа, в которой товар был добавлен.
     """
-    from database.db import AsyncSessionLocal
+    join_trace(traceparent, product_id=product_id)
+    from database.db import session_scope
     from database.models import Product
     import html
     from sqlalchemy.exc import OperationalError, InterfaceError
@@ -183,12 +302,12 @@ async def publish_product(product_id: int, max_retries: int = 3):
 
     for attempt in range(max_retries):
         try:
-            async with AsyncSessionLocal() as session:
-                result = await session.execute(select(Product).where(Product.id == product_id))
-                product = result.scalar_one_or_none()
+            async with session_scope() as session:
+                # чтение — быстрым путём (запись со __slots__), статус — ORM-апдейтом ниже
+                product = await queries.get_product_post(await session.connection(), product_id)
 
                 if not product:
-                    print(f"❌ Товар с id={product_id} не найден")
+                    logger.error("❌ Товар с id=%s не найден", product_id)
                     return
 
                 # 🧮 Извлекаем данные
@@ -215,7 +334,7 @@ async def publish_product(product_id: int, max_retries: int = 3):
                 # 📨 Отправляем пост
                 try:
                     if product.image_url:
-                        await bot.send_photo(
+                        await get_bot().send_photo(
                             chat_id=CHANNEL_ID,
                             photo=product.image_url,
                             caption=caption[:1024],
@@ -223,35 +342,37 @@ async def publish_product(product_id: int, max_retries: int = 3):
                             has_spoiler=is_adult  # 👈 вот тут магия
                         )
                     else:
-                        await bot.send_message(
+                        await get_bot().send_message(
                             chat_id=CHANNEL_ID,
                             text=caption[:1024],
                             parse_mode="HTML",
                         )
 
-                    print(f"✅ Сообщение о товаре {product.id} отправлено в Telegram")
+                    logger.info("✅ Сообщение о товаре %s отправлено в Telegram", product.id)
                 except Exception as tg_err:
-                    print(f"⚠️ Ошибка Telegram API при публикации {product_id}: {tg_err}")
+                    logger.warning("⚠️ Ошибка Telegram API при публикации %s: %s", product_id, tg_err)
 
                 # 🧾 Обновляем статус
-                product.status = "posted"
+                await session.execute(
+                    update(Product).where(Product.id == product_id).values(status=ProductStatus.posted)
+                )
                 await session.commit()
 
-                print(f"✅ Товар опубликован: {product.name}")
+                logger.info("✅ Товар опубликован: %s", product.name)
                 return
 
         except (OperationalError, InterfaceError) as db_err:
-            print(f"⚠️ Ошибка соединения с БД при публикации {product_id}: {db_err}")
+            logger.warning("⚠️ Ошибка соединения с БД при публикации %s: %s", product_id, db_err)
             if attempt < max_retries - 1:
                 await asyncio.sleep(3)
-                print(f"🔁 Повтор попытки ({attempt + 2}/{max_retries})...")
+                logger.info("🔁 Повтор попытки (%s/%s)...", attempt + 2, max_retries)
                 continue
             else:
-                print(f"❌ Не удалось подключиться к БД после {max_retries} попыток")
+                logger.error("❌ Не удалось подключиться к БД после %s попыток", max_retries)
                 return
 
         except Exception as e:
-            print(f"❌ Неожиданная ошибка при публикации {product_id}: {e}")
+            logger.error("❌ Неожиданная ошибка при публикации %s: %s", product_id, e)
             return
 
        
@@ -260,27 +381,37 @@ async def parse_product(request: Request):
     """
     Парсит карточку товара по URL, но НЕ сохраняет её в базу.
     """
-    data = await request.json()
+    data = loads(await request.body())
     url = data.get("url")
 
     if not url:
         return {"success": False, "error": "Не передан url"}
 
-    print(f"📩 Запрос на парсинг товара: {url}")
+    logger.info("📩 Запрос на парсинг товара: %s", url, extra=sampled())
+    from new_parser import parse_wb_product_api
+    from parse_snapshots import save_snapshot
 
     # 🧩 Парсим карточку товара
     product_data = await parse_wb_product_api(url)
     if not product_data or not product_data.get("success"):
-        print(f"⚠️ Не удалось распарсить товар: {url}")
+        logger.warning("⚠️ Не удалось распарсить товар: %s", url)
         return {"success": False, "error": "Не удалось получить данные с Wildberries"}
 
-    print(f"✅ Товар успешно распарсен: {product_data.get('name')}")
-    return product_data
+    logger.info("✅ Товар успешно распарсен: %s", product_data.get('name'), extra=sampled())
+    # точку истории цен пишет парсер при реальном запросе в WB (new_parser.record_prices), не на попаданиях в кэш
+    parse_token = await save_snapshot(product_data)
+    if parse_token:
+        product_data = {**product_data, "parse_token": parse_token}
+    return FastJSONResponse(product_data)
 
 @app.post("/api/products/add")
 async def add_product(request: Request):
-    data = await request.json()
-    tg_id = data.get("user_id")
+    data = loads(await request.body())
+    return await add_product_from_data(data)
+
+async def add_product_from_data(data: dict) -> dict:
+    """Добавляет оплаченный товар в очередь на выкладку (общая логика для HTTP и in-process вызова)."""
+    tg_id = to_tg_id(data.get("user_id"))
     url = data.get("url")
     name = data.get("name")
     description = data.get("description")
@@ -289,14 +420,14 @@ async def add_product(request: Request):
     scheduled_date = data.get("scheduled_date")
     category = data.get("category")
     
-    print(f"📩 Запрос на добавление товара: {data}")
+    logger.info("📩 Запрос на добавление товара: %s", Redacted(data))
 
     if not all([tg_id, url, name, scheduled_date]):
         return {"success": False, "error": "Отсутствуют обязательные поля"}
 
-    async for session in get_session():
+    async with session_scope() as session:
         # Проверяем пользователя
-        result = await session.execute(select(User).where(User.tg_id == str(tg_id)))
+        result = await session.execute(select(User).where(User.tg_id == tg_id))
         user = result.scalar_one_or_none()
         if not user:
             return {"success": False, "error": "Пользователь не найден"}
@@ -307,13 +438,14 @@ async def add_product(request: Request):
             return {"success": False, "error": "Некорректная дата (невозможно обработать)"}
 
 
-        # 🧩 Парсим товар
-        parsed = await parse_wb_product_api(url)
+        # 🧩 Данные товара: снимок превью-парсинга или (если нет/устарел) парсинг заново
+        from parse_snapshots import get_parsed_for_checkout
+        parsed = await get_parsed_for_checkout(url, data.get("parse_token"))
         if not parsed or not parsed.get("success"):
             parsed = {}
-            print(f"⚠️ Не удалось распарсить товар: {url}")
+            logger.warning("⚠️ Не удалось распарсить товар: %s", url)
         else:
-            print(f"✅ Товар распарсен: {parsed.get('name')}")
+            logger.info("✅ Товар распарсен: %s", parsed.get('name'))
 
         # 🖼 Основное изображение
         main_image = image_url or (parsed.get("images") or [None])[0]
@@ -327,11 +459,11 @@ async def add_product(request: Request):
             or parsed.get("subject_name")
             or "Не указана"
         )
-        print(f"📦 CATEGORY SELECTED: {categoryTry}")
+        logger.debug("📦 CATEGORY SELECTED: %s", categoryTry)
 
         # 🧱 Создаём товар
         product = Product(
-            user_id=str(tg_id),
+            user_id=tg_id,
             url=url,
             name=name or parsed.get("name"),
             description=description or parsed.get("description"),
@@ -348,38 +480,42 @@ async def add_product(request: Request):
             stocks=int(parsed.get("stocks")) if parsed.get("stocks") is not None else None,
             stocks_by_size=parsed.get("stocks_by_size"),
             images=parsed.get("images"),
-            info={"parsed_raw": parsed},
             status=ProductStatus.pending,
             category=final_category,  # ✅ теперь переменная определена
             scheduled_date=scheduled_dt,
         )
 
+        # копия parsed без полей, уже разложенных по колонкам
+        product.set_parsed_raw(parsed)
+
         # 💾 Сохраняем в БД
         session.add(product)
         await session.commit()
         await session.refresh(product)
 
-        print(f"✅ Товар сохранён (ID={product.id}, Категория={product.category})")
+        logger.info("✅ Товар сохранён (ID=%s, Категория=%s)", product.id, product.category)
+        set_attrs(product_id=product.id)
 
         # ⏰ Планируем публикацию
-        print(f"🕒 Серверное время сейчас: {datetime.now()}")
-        print(f"🕒 scheduled_dt (для job): {scheduled_dt}")
+        logger.debug("🕒 Серверное время сейчас: %s", datetime.now())
+        logger.debug("🕒 scheduled_dt (для job): %s", scheduled_dt)
 
         try:
             scheduler.add_job(
                 publish_product,
                 trigger=DateTrigger(run_date=scheduled_dt),
                 args=[product.id],
+                kwargs={"traceparent": current_traceparent()},
                 id=f"publish_{product.id}",
                 replace_existing=True,  # 👈 чтобы не падало, если такая задача уже есть
                 misfire_grace_time=300,
             )
-            print(f"🗓 Задача добавлена: publish_{product.id}")
+            logger.info("🗓 Задача добавлена: publish_%s", product.id)
         except Exception as e:
-            print(f"⚠️ Не удалось добавить задачу publish_{product.id}: {e}")
+            logger.warning("⚠️ Не удалось добавить задачу publish_%s: %s", product.id, e)
 
 
-        print(f"🗓 Публикация запланирована на {scheduled_dt}")
+        logger.info("🗓 Публикация запланирована на %s", scheduled_dt)
 
         return {
             "success": True,
@@ -390,54 +526,60 @@ async def add_product(request: Request):
 
 @app.post("/api/users/register")
 async def register_user(request: Request):
-    data = await request.json()
-    tg_id = data.get("tg_id")
+    data = loads(await request.body())
+    return await register_user_from_data(data)
+
+async def register_user_from_data(data: dict) -> dict:
+    tg_id = to_tg_id(data.get("tg_id"))
     name = data.get("name")
     phone = data.get("phone")
 
     if not tg_id or not phone:
         return {"success": False, "error": "Не переданы tg_id или телефон"}
 
-    async for session in get_session():
+    async with session_scope() as session:
         # Проверяем, существует ли уже пользователь
-        result = await session.execute(select(User).where(User.tg_id == str(tg_id)))
+        result = await session.execute(select(User).where(User.tg_id == tg_id))
         user = result.scalars().first()
 
         if not user:
             # Создаём нового
-            user = User(tg_id=str(tg_id), name=name, phone=phone)
+            user = User(tg_id=tg_id, name=name, phone=phone)
             session.add(user)
             await session.commit()
             await session.refresh(user)
-            print(f"✅ Новый пользователь зарегистрирован: {user.name} ({user.phone})")
+            logger.info("✅ Новый пользователь зарегистрирован: %s (tg_id=%s)", user.name, user.tg_id)
         else:
-            print(f"ℹ️ Пользователь уже есть: {user.name} ({user.phone})")
+            logger.info("ℹ️ Пользователь уже есть: %s (tg_id=%s)", user.name, user.tg_id)
 
         return {"success": True, "user_id": user.id}
     
     
 @app.get("/api/users/{tg_id}")
 async def check_user_exists(tg_id: str, session: AsyncSession = Depends(get_session)):
-    result = await session.execute(select(User).where(User.tg_id == tg_id))
-    user = result.scalar_one_or_none()
-    return {"exists": user is not None}
+    return {"exists": await user_exists(session, tg_id)}
+
+async def user_exists(session: AsyncSession, tg_id) -> bool:
+    tg_id = to_tg_id(tg_id)
+    if tg_id is None:
+        return False
+    return await queries.user_exists(await session.connection(), tg_id)
 
 @app.get("/api/products/{tg_id}")
 async def get_user_products(tg_id: str, session: AsyncSession = Depends(get_session)):
     """Возвращает список товаров пользователя по его Telegram ID"""
-    result = await session.execute(select(User).where(User.tg_id == tg_id))
-    user = result.scalar_one_or_none()
-    if not user:
+    user_tg_id = to_tg_id(tg_id)
+    if user_tg_id is None:
+        return {"success": False, "error": "Пользователь не найден"}
+    # пользователь и его товары — одним запросом (LEFT JOIN), без ORM-сущностей
+    products = await queries.get_user_products(await session.connection(), user_tg_id)
+    if products is None:
         return {"success": False, "error": "Пользователь не найден"}
 
-    # ✅ теперь ищем по строковому user_id (tg_id)
-    result = await session.execute(select(Product).where(Product.user_id == user.tg_id))
-    products = result.scalars().all()
-
-    return {
+    return FastJSONResponse({
         "success": True,
         "tg_id": tg_id,
-        "user_id": user.tg_id,  # тоже исправляем, чтобы всё было консистентно
+        "user_id": str(user_tg_id),  # WebApp ждёт строку, как до перехода на BIGINT
         "products": [
             {
                 "id": p.id,
@@ -450,32 +592,66 @@ async def get_user_products(tg_id: str, session: AsyncSession = Depends(get_sess
             }
             for p in products
         ],
-    }
+    })
+
+@app.get("/api/prices/drops")
+async def price_drops(
+    session: AsyncSession = Depends(get_session),
+    min_pct: float = Query(5.0, description="Минимальное снижение цены, %"),
+    hours: int = Query(24, description="За сколько последних часов"),
+    limit: int = Query(100, le=1000),
+):
+    """Товары, подешевевшие минимум на min_pct% — по сводной таблице price_latest, без сканирования истории."""
+    from price_history import get_price_drops
+    return FastJSONResponse({"success": True, "drops": await get_price_drops(session, min_pct, hours, limit)})
+
+@app.get("/api/prices/changes")
+async def price_changes(
+    session: AsyncSession = Depends(get_session),
+    hours: int = Query(24, description="Товары, наблюдавшиеся за последние N часов"),
+):
+    """Срабатывания правил изменений (CHANGE_RULES) по всем отслеживаемым товарам: {правило: [wb_id]}."""
+    from change_rules import evaluate_latest
+    return FastJSONResponse({"success": True, "matches": await evaluate_latest(session, hours)})
+
+@app.get("/api/prices/{wb_id}")
+async def price_series(
+    wb_id: int,
+    session: AsyncSession = Depends(get_session),
+    days: int = Query(30, ge=1, le=366),
+    bucket: str = Query("day", description="hour|day|week"),
+):
+    """История цены и остатков товара: min/max/last по корзинам."""
+    from price_history import get_price_series, BUCKETS
+    if bucket not in BUCKETS:
+        return FastJSONResponse(content={"success": False, "error": "Некорректный bucket"}, status_code=400)
+    return FastJSONResponse({"success": True, **await get_price_series(session, wb_id, days, bucket)})
 
 @app.post("/api/payments/callback")
 async def yookassa_callback(request: Request):
     try:
-        payload = await request.json()
+        payload = loads(await request.body())
     except Exception:
         payload = {}
     event = payload.get("event")
     obj = payload.get("object", {})  
 
-    print("💳 YooKassa callback:", event)
-    print("💳 CALLBACK RAW:", json.dumps(payload, ensure_ascii=False))
+    logger.info("💳 YooKassa callback: %s", event)
+    logger.debug("💳 CALLBACK RAW: %s", Redacted(payload))
 
     metadata = obj.get("metadata", {}) or {}
     user_id = metadata.get("user_id") or metadata.get("tg_id")
     order_id = metadata.get("order_id")
     pid = obj.get("id")
+    join_trace(metadata.get("traceparent"), order_id=order_id, payment_id=pid, event=event)
 
     # Safety: если нет pid — просто ответим ok
     if not pid:
-        print("⚠️ Callback без id -> игнорируем")
+        logger.warning("⚠️ Callback без id -> игнорируем")
         return {"success": True}
     
     if pid in PROCESSED_PAYMENTS and PROCESSED_PAYMENTS[pid]["status"] == "succeeded":
-        print(f"⚠️ Payment {pid} already succeeded, ignoring cancellation")
+        logger.warning("⚠️ Payment %s already succeeded, ignoring cancellation", pid)
         return {"success": True}
 
     # Если уже обработано — не делать лишних действий (идемпотентность)
@@ -483,12 +659,12 @@ async def yookassa_callback(request: Request):
     if processed:
         # если уже помечено как succeeded и мы получили canceled — игнорируем cancel
         if event == "payment.canceled" and processed.get("status") == "succeeded":
-            print(f"ℹ️ Ignoring payment.canceled for {pid} because we've already processed succeeded")
+            logger.info("ℹ️ Ignoring payment.canceled for %s because we've already processed succeeded", pid)
             return {"success": True}
         # если уже помечено как canceled и пришёл succeeded — всё ещё обрабатывать succeeded (в редких race-условиях),
         # но если уже succeeded — просто вернуть OK.
         if event in ("payment.succeeded", "payment.captured", "payment.paid") and processed.get("status") == "succeeded":
-            print(f"ℹ️ Duplicate succeeded callback for {pid} — игнорируем")
+            logger.info("ℹ️ Duplicate succeeded callback for %s — игнорируем", pid)
             return {"success": True}
 
 
@@ -525,7 +701,7 @@ async def yookassa_callback(request: Request):
 
     # ==== Обработка успешной оплаты ====
     if event in ("payment.succeeded", "payment.captured", "payment.paid"):
-        print(f"✅ Payment succeeded for id={pid}")
+        logger.info("✅ Payment succeeded for id=%s", pid)
         # пометим как успешно обработанный
         PROCESSED_PAYMENTS[pid] = {"status": "succeeded", "ts": time.time()}
 
@@ -543,29 +719,29 @@ async def yookassa_callback(request: Request):
         # уведомляем пользователя
         if user_id:
             try:
-                await bot.send_message(
+                await get_bot().send_message(
                     chat_id=int(user_id),
                     text="✅ <b>Оплата получена</b>\nТовар добавлен в очередь на выкладку.",
                     parse_mode="HTML"
                 )
             except Exception as e:
-                print("⚠️ Не получилось уведомить пользователя:", e)
+                logger.warning("⚠️ Не получилось уведомить пользователя: %s", e)
 
         # удаляем кнопку оплаты (если есть)
         if order_id and order_id in PENDING_MESSAGES:
             info = PENDING_MESSAGES.pop(order_id, None)
             if info:
                 try:
-                    await bot.delete_message(chat_id=info["chat_id"], message_id=info["message_id"])
+                    await get_bot().delete_message(chat_id=info["chat_id"], message_id=info["message_id"])
                 except Exception as e:
-                    print("⚠️ Ошибка удаления pending message:", e)
+                    logger.warning("⚠️ Ошибка удаления pending message: %s", e)
 
         # добавляем товар в базу асинхронно
         if metadata:
             try:
                 asyncio.create_task(
                     add_product_to_db(
-                        user_id=str(user_id),
+                        user_id=user_id,
                         url=metadata.get("url"),
                         name=metadata.get("name"),
                         description=metadata.get("description") or "",
@@ -573,10 +749,11 @@ async def yookassa_callback(request: Request):
                         price=float(metadata.get("price") or 0),
                         scheduled_date=metadata.get("scheduled_date"),
                         category=metadata.get("category"),
+                        parse_token=metadata.get("parse_token"),
                     )
                 )
             except Exception as e:
-                print("⚠️ Ошибка при планировании add_product_to_db:", e)
+                logger.warning("⚠️ Ошибка при планировании add_product_to_db: %s", e)
 
         return {"success": True}
 
@@ -584,7 +761,7 @@ async def yookassa_callback(request: Request):
     return {"success": True}
 
 async def add_product_to_db(
-    user_id: str,
+    user_id,
     url: str,
     name: str,
     description: str,
@@ -592,38 +769,37 @@ async def add_product_to_db(
     price: float,
     scheduled_date: str,
     category: str = None, 
+    parse_token: str = None,
 ):
-    from new_parser import parse_wb_product_api  # локальный импорт
 
-    async for session in get_session():
-        result = await session.execute(select(User).where(User.tg_id == str(user_id)))
-        user = result.scalar_one_or_none()
+    async with session_scope() as session:
+        tg_id = to_tg_id(user_id)
+        user = None
+        if tg_id is not None:
+            result = await session.execute(select(User).where(User.tg_id == tg_id))
+            user = result.scalar_one_or_none()
         if not user:
-            print(f"❌ Пользователь {user_id} не найден при добавлении товара в DB")
+            logger.error("❌ Пользователь %s не найден при добавлении товара в DB", user_id)
             return {"success": False, "error": "Пользователь не найден"}
 
         scheduled_dt = normalize_datetime(scheduled_date)
         if not scheduled_dt:
-            print(f"❌ Некорректная дата: {scheduled_date}")
+            logger.error("❌ Некорректная дата: %s", scheduled_date)
             return {"success": False, "error": "Некорректная дата"}
 
 
-        # Парсим ещё раз, чтобы получить все поля (или можно принимать parsed из frontend)
-        parsed = await parse_wb_product_api(url)
+        # Снимок превью-парсинга; парсим ещё раз, только если его нет или он устарел
+        from parse_snapshots import get_parsed_for_checkout
+        parsed = await get_parsed_for_checkout(url, parse_token)
         if not parsed or not parsed.get("success"):
-            print(f"⚠️ Не удалось дополнительно распарсить товар {url}")
+            logger.warning("⚠️ Не удалось дополнительно распарсить товар %s", url)
             parsed = {}
 
         # Берём основную картинку - приоритет: image_url (переданный) -> parsed.images[0] -> parsed['images'] -> None
         main_image = image_url or (parsed.get("images") or [None])[0] or parsed.get("image") or None
 
-        # Собираем extra info (оставляем копию parsed в info)
-        extra_info = {
-            "parsed_raw": parsed,  # можно убрать/сжать при желании
-        }
-
         product = Product(
-            user_id=str(user.tg_id),
+            user_id=user.tg_id,
             url=url,
             name=name or parsed.get("name"),
             description=description or parsed.get("description"),
@@ -642,10 +818,11 @@ async def add_product_to_db(
             stocks_by_size=parsed.get("stocks_by_size"),
             images=parsed.get("images"),
             category=category,
-            info=extra_info,
             status=ProductStatus.pending,
             scheduled_date=scheduled_dt,
         )
+        # копия parsed без полей, уже разложенных по колонкам
+        product.set_parsed_raw(parsed)
 
         session.add(product)
         await session.commit()
@@ -657,17 +834,53 @@ async def add_product_to_db(
                 publish_product,
                 trigger=DateTrigger(run_date=scheduled_dt),
                 args=[product.id],
+                kwargs={"traceparent": current_traceparent()},
                 id=f"publish_{product.id}",
             )
         except Exception as e:
-            print(f"⚠️ Не удалось добавить задачу в scheduler: {e}")
+            logger.warning("⚠️ Не удалось добавить задачу в scheduler: %s", e)
 
-        print(f"✅ Товар '{product.name}' сохранён и запланирован на {scheduled_dt}")
+        logger.info("✅ Товар '%s' сохранён и запланирован на %s", product.name, scheduled_dt)
         return {"success": True, "product_id": product.id}
 
 
-from datetime import timedelta
-import pytz
+@app.get("/metrics", include_in_schema=False, dependencies=[Depends(require_admin)])
+async def metrics_endpoint():
+    """Метрики Prometheus (в multiprocess-режиме — по всем воркерам gunicorn). Prometheus шлёт X-Admin-Token."""
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
+
+
+@app.get("/api/admin/db_pool", dependencies=[Depends(require_admin)])
+async def admin_db_pool():
+    """Насыщение пула соединений этого воркера: ждущие корутины, время выдачи соединения, занятость пула."""
+    return {"success": True, "pid": os.getpid(), "db_pool": pool_status()}
+
+
+@app.get("/api/admin/loop", dependencies=[Depends(require_admin)])
+async def admin_loop(top: int = Query(10, ge=1, le=50)):
+    """Лаг event loop этого воркера и места, где он блокировался дольше LOOP_BLOCK_MS (со стеками)."""
+    return {"success": True, "pid": os.getpid(), "loop": LOOP_MONITOR.snapshot(top)}
+
+
+@app.get("/api/admin/memory", dependencies=[Depends(require_admin)])
+async def admin_memory(
+    top: int = Query(15, ge=1, le=100),
+    objects: bool = Query(False, description="Гистограмма типов объектов кучи: обход всей кучи под GIL, воркер на это время стоит"),
+):
+    """Память этого воркера: RSS, размеры реестров, топ аллокаций tracemalloc (если включён)."""
+    return {"success": True, "memory": await MEMORY_MONITOR.heap_summary(top, objects)}
+
+
+@app.post("/api/admin/memory/trace", dependencies=[Depends(require_admin)])
+async def admin_memory_trace(enabled: bool = Query(...)):
+    """Включить/выключить tracemalloc в этом воркере без перезапуска."""
+    if enabled:
+        MEMORY_MONITOR.start_tracing()
+    else:
+        MEMORY_MONITOR.stop_tracing()
+    return {"success": True, "pid": os.getpid(), "tracing": MEMORY_MONITOR.tracing}
+
 
 @app.get("/api/admin/stats")
 async def admin_stats(
@@ -685,68 +898,61 @@ async def admin_stats(
     - type=all → за всё время
     """
     try:
-        tz = pytz.timezone("Europe/Moscow")
-        now = datetime.now(tz)
-
-        # 🧮 Определяем временные границы
-        if type == "day":
-            start_date = now.replace(hour=0, minute=0, second=0, microsecond=0)
-            end_date = start_date + timedelta(days=1)
-
-        elif type == "month" and year and month:
-            start_date = datetime(year, month, 1, tzinfo=tz)
-            # следующий месяц минус 1 секунда
-            if month == 12:
-                end_date = datetime(year + 1, 1, 1, tzinfo=tz)
-            else:
-                end_date = datetime(year, month + 1, 1, tzinfo=tz)
+        stats = await compute_stats(session, type, year, month, week)
+        return FastJSONResponse(content={"success": True, "stats": stats})
 
-        elif type == "week" and year and month and week:
-            month_start = datetime(year, month, 1, tzinfo=tz)
-            # считаем недельные интервалы от начала месяца
-            week_start = month_start + timedelta(days=(week - 1) * 7)
-            week_end = week_start + timedelta(days=7)
-            start_date, end_date = week_start, week_end
-
-        elif type == "all":
-            start_date, end_date = None, None
+    except ValueError as e:
+        return FastJSONResponse(content={"success": False, "error": str(e)}, status_code=400)
 
+    except Exception as e:
+        logger.error("❌ Ошибка при вычислении статистики: %s", e)
+        return FastJSONResponse(content={"success": False, "error": str(e)}, status_code=500)
+
+async def compute_stats(session: AsyncSession, type: str = "day", year: int = None, month: int = None, week: int = None) -> dict:
+    """Считает статистику постов за период. ValueError — некорректные параметры периода."""
+    tz = pytz.timezone("Europe/Moscow")
+    now = datetime.now(tz)
+
+    # 🧮 Определяем временные границы
+    if type == "day":
+        start_date = now.replace(hour=0, minute=0, second=0, microsecond=0)
+        end_date = start_date + timedelta(days=1)
+
+    elif type == "month" and year and month:
+        start_date = datetime(year, month, 1, tzinfo=tz)
+        # следующий месяц минус 1 секунда
+        if month == 12:
+            end_date = datetime(year + 1, 1, 1, tzinfo=tz)
         else:
-            return JSONResponse(
-                content={"success": False, "error": "Некорректные параметры периода"},
-                status_code=400,
-            )
+            end_date = datetime(year, month + 1, 1, tzinfo=tz)
 
-        # 🧩 Запрос к БД
-        query = select(Product)
-        if start_date and end_date:
-            query = query.where(Product.created_at >= start_date, Product.created_at < end_date)
-        elif start_date:
-            query = query.where(Product.created_at >= start_date)
-
-        result = await session.execute(query)
-        products = result.scalars().all()
-
-        posted = [p for p in products if str(p.status) in ("posted", "ProductStatus.posted")]
-        pending = [p for p in products if str(p.status) in ("pending", "ProductStatus.pending")]
-
-        stats = {
-            "type": type,
-            "year": year,
-            "month": month,
-            "week": week,
-            "total_posts": len(products),
-            "posted_count": len(posted),
-            "pending_count": len(pending),
-            "posted_amount": len(posted) * 300,
-            "pending_amount": len(pending) * 300,
-        }
+    elif type == "week" and year and month and week:
+        month_start = datetime(year, month, 1, tzinfo=tz)
+        # считаем недельные интервалы от начала месяца
+        week_start = month_start + timedelta(days=(week - 1) * 7)
+        week_end = week_start + timedelta(days=7)
+        start_date, end_date = week_start, week_end
 
-        return JSONResponse(content={"success": True, "stats": stats})
+    elif type == "all":
+        start_date, end_date = None, None
 
-    except Exception as e:
-        print(f"❌ Ошибка при вычислении статистики: {e}")
-        return JSONResponse(content={"success": False, "error": str(e)}, status_code=500)
+    else:
+        raise ValueError("Некорректные параметры периода")
+
+    # 🧩 Запрос к БД: один агрегат вместо загрузки всех товаров периода
+    total, posted, pending = await queries.count_products(await session.connection(), start_date, end_date)
+
+    return {
+        "type": type,
+        "year": year,
+        "month": month,
+        "week": week,
+        "total_posts": total,
+        "posted_count": posted,
+        "pending_count": pending,
+        "posted_amount": posted * 300,
+        "pending_amount": pending * 300,
+    }
 
 
 def normalize_datetime(value):
@@ -756,7 +962,7 @@ def normalize_datetime(value):
         try:
             value = datetime.fromisoformat(value)
         except Exception:
-            print(f"⚠️ Невозможно распарсить дату: {value}")
+            logger.warning("⚠️ Невозможно распарсить дату: %s", value)
             return None
     if isinstance(value, datetime):
         if value.tzinfo is None:
@@ -764,3 +970,23 @@ def normalize_datetime(value):
         else:
             return value.astimezone().replace(tzinfo=None)
     return value
+
+
+# 🤖 Бот в том же uvicorn-процессе: апдейты приходят webhook'ом на этот же app. В конце модуля — сервисные
+# функции уже определены и передаются клиенту напрямую (импорт backend из бота дал бы второй экземпляр модуля).
+# Только с одним воркером: каждый воркер gunicorn собрал бы свой Application, сам вызвал set_webhook и принимал
+# апдейты, а инвойсы, кэш парсинга и порядок апдейтов одного пользователя (KeyedUpdateProcessor) — в памяти воркера
+if os.getenv("BOT_WEBHOOK_IN_BACKEND", "0") == "1":
+    from database.pool import WEB_CONCURRENCY
+    if WEB_CONCURRENCY > 1:
+        raise RuntimeError(
+            f"❌ BOT_WEBHOOK_IN_BACKEND=1 при WEB_CONCURRENCY={WEB_CONCURRENCY}: бот в backend — только с одним "
+            "воркером; иначе запускайте его отдельным процессом (telegram_bot.service, BOT_MODE=webhook)"
+        )
+    from main import build_application
+    from bot_webhook import mount_bot_webhook
+    from backend_client import InProcessBackendClient
+    mount_bot_webhook(app, build_application(
+        with_updater=False,
+        backend=InProcessBackendClient(register_user_from_data, user_exists, add_product_from_data, compute_stats),
+    ))
@@ -0,0 +1,172 @@
+# backend_client.py
+import os
+import re
+import asyncio
+from abc import ABC, abstractmethod
+from typing import Awaitable, Callable, Optional
+import aiohttp
+from tracing import span, current_traceparent
+from json_codec import loads
+
+# Транспорт до backend: https | unix | inprocess
+#   https     — как раньше, через nginx (BACKEND_URL)
+#   unix      — напрямую в gunicorn через Unix-сокет (BACKEND_UNIX_SOCKET), без TLS и nginx
+#   inprocess — прямой вызов функций backend.py, когда бот и backend в одном процессе
+#               (BOT_WEBHOOK_IN_BACKEND=1); клиент создаёт сам backend.py и передаёт в build_application
+BACKEND_URL = os.getenv("BACKEND_URL", "https://api.zepovvv.ru")
+BACKEND_UNIX_SOCKET = os.getenv("BACKEND_UNIX_SOCKET", "/run/wbsellers/backend.sock")
+BACKEND_TRANSPORT = os.getenv(
+    "BACKEND_TRANSPORT",
+    "inprocess" if os.getenv("BOT_WEBHOOK_IN_BACKEND", "0") == "1" else "https",
+)
+BACKEND_TIMEOUT = float(os.getenv("BACKEND_TIMEOUT", "30"))
+_ID_IN_PATH = re.compile(r"/\d+")
+
+
+class BackendError(Exception):
+    """Backend недоступен или ответил не 200."""
+
+
+class BackendClient(ABC):
+    """Операции бота над backend. Ответы — те же dict, что отдают эндпоинты backend.py."""
+
+    @abstractmethod
+    async def register_user(self, tg_id: int, name: str, phone: str) -> dict:
+        ...
+
+    @abstractmethod
+    async def user_exists(self, tg_id: int) -> bool:
+        ...
+
+    @abstractmethod
+    async def add_product(self, data: dict) -> dict:
+        ...
+
+    @abstractmethod
+    async def admin_stats(self, type: str, year: int = None, month: int = None, week: int = None) -> dict:
+        ...
+
+    async def close(self):
+        pass
+
+
+class HttpBackendClient(BackendClient):
+    """HTTP-транспорт с переиспользуемой сессией: по TCP (https) или через Unix-сокет."""
+
+    def __init__(self, base_url: str = BACKEND_URL, unix_socket: Optional[str] = None):
+        # для Unix-сокета хост в URL не важен, но нужен для заголовка Host
+        self.base_url = "http://localhost" if unix_socket else base_url.rstrip("/")
+        self.unix_socket = unix_socket
+        self.session: Optional[aiohttp.ClientSession] = None
+
+    async def _get_session(self) -> aiohttp.ClientSession:
+        if self.session is None or self.session.closed:
+            connector = aiohttp.UnixConnector(path=self.unix_socket) if self.unix_socket else None
+            self.session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=BACKEND_TIMEOUT),
+            )
+        return self.session
+
+    async def _request(self, method: str, path: str, **kwargs) -> dict:
+        session = await self._get_session()
+        # имя спана — шаблон пути (/api/users/{id}), а не конкретный URL
+        with span(f"backend {method} {_ID_IN_PATH.sub('/{id}', path)}", kind="CLIENT"):
+            # 🧵 backend продолжит трассу бота (TracingMiddleware)
+            traceparent = current_traceparent()
+            if traceparent:
+                kwargs["headers"] = {**kwargs.get("headers", {}), "traceparent": traceparent}
+            try:
+                async with session.request(method, f"{self.base_url}{path}", **kwargs) as resp:
+                    if resp.status != 200:
+                        raise BackendError(f"{method} {path} -> {resp.status}")
+                    return await resp.json(loads=loads)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                raise BackendError(f"{method} {path}: {e}") from e
+
+    async def register_user(self, tg_id: int, name: str, phone: str) -> dict:
+        return await self._request("POST", "/api/users/register", json={"tg_id": tg_id, "name": name, "phone": phone})
+
+    async def user_exists(self, tg_id: int) -> bool:
+        data = await self._request("GET", f"/api/users/{tg_id}")
+        return data.get("exists", False)
+
+    async def add_product(self, data: dict) -> dict:
+        return await self._request("POST", "/api/products/add", json=data)
+
+    async def admin_stats(self, type: str, year: int = None, month: int = None, week: int = None) -> dict:
+        params = {k: v for k, v in {"type": type, "year": year, "month": month, "week": week}.items() if v is not None}
+        return await self._request("GET", "/api/admin/stats", params=params)
+
+    async def close(self):
+        if self.session and not self.session.closed:
+            await self.session.close()
+        self.session = None
+
+
+class InProcessBackendClient(BackendClient):
+    """
+    Прямой вызов сервисных функций backend.py — без HTTP вообще.
+    Функции передаёт backend.py: импорт backend отсюда под gunicorn (backend.backend:app) загрузил бы
+    второй экземпляр модуля со своим app и движком БД.
+    """
+
+    def __init__(
+        self,
+        register_user: Callable[[dict], Awaitable[dict]],
+        user_exists: Callable[..., Awaitable[bool]],
+        add_product: Callable[[dict], Awaitable[dict]],
+        compute_stats: Callable[..., Awaitable[dict]],
+    ):
+        self._register_user = register_user
+        self._user_exists = user_exists
+        self._add_product = add_product
+        self._compute_stats = compute_stats
+
+    @staticmethod
+    async def _call(coro):
+        # ошибки сервисов ведут себя как 500 у HTTP-транспорта
+        try:
+            return await coro
+        except Exception as e:
+            raise BackendError(f"in-process: {e}") from e
+
+    async def register_user(self, tg_id: int, name: str, phone: str) -> dict:
+        return await self._call(self._register_user({"tg_id": tg_id, "name": name, "phone": phone}))
+
+    async def user_exists(self, tg_id: int) -> bool:
+        from database.db import session_scope
+
+        async def _exists():
+            async with session_scope() as session:
+                return await self._user_exists(session, tg_id)
+
+        return await self._call(_exists())
+
+    async def add_product(self, data: dict) -> dict:
+        return await self._call(self._add_product(data))
+
+    async def admin_stats(self, type: str, year: int = None, month: int = None, week: int = None) -> dict:
+        from database.db import session_scope
+
+        async def _stats():
+            async with session_scope() as session:
+                return await self._compute_stats(session, type, year, month, week)
+
+        try:
+            stats = await _stats()
+        except ValueError as e:
+            # у HTTP-транспорта это 400
+            raise BackendError(str(e)) from e
+        except Exception as e:
+            raise BackendError(f"in-process: {e}") from e
+        return {"success": True, "stats": stats}
+
+
+def create_backend_client(transport: str = BACKEND_TRANSPORT) -> Optional[BackendClient]:
+    """HTTP-клиент по транспорту; для inprocess — None: InProcessBackendClient создаёт backend.py."""
+    if transport == "inprocess":
+        return None
+    if transport == "unix":
+        return HttpBackendClient(unix_socket=BACKEND_UNIX_SOCKET)
+    return HttpBackendClient(BACKEND_URL)
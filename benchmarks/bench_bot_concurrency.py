@@ -0,0 +1,78 @@
+# bench_bot_concurrency.py
+"""
+Пропускная способность обработки апдейтов бота при множестве одновременных пользователей.
+
+Сравнивает последовательную обработку (как было: SimpleUpdateProcessor(1))
+с KeyedUpdateProcessor и проверяет, что апдейты каждого пользователя выполнились по порядку.
+
+Запуск из корня репозитория:
+    python -m benchmarks.bench_bot_concurrency --users 200 --per-user 5 --latency 0.05
+"""
+import argparse
+import asyncio
+import random
+import time
+from types import SimpleNamespace
+from telegram.ext import SimpleUpdateProcessor
+
+from bot_concurrency import KeyedUpdateProcessor
+
+
+def make_updates(users: int, per_user: int):
+    updates = []
+    for seq in range(per_user):
+        for uid in range(users):
+            updates.append(SimpleNamespace(
+                effective_user=SimpleNamespace(id=uid),
+                effective_chat=SimpleNamespace(id=uid),
+                seq=seq,
+            ))
+    return updates
+
+
+async def run(processor, updates, latency: float, jitter: float):
+    seen: dict[int, list[int]] = {}
+
+    async def handler(update):
+        # имитация медленного хендлера (парсинг WB, запрос в YooKassa)
+        await asyncio.sleep(latency * random.uniform(1 - jitter, 1 + jitter))
+        seen.setdefault(update.effective_user.id, []).append(update.seq)
+
+    await processor.initialize()
+    started = time.perf_counter()
+    # как Application: каждый апдейт — отдельная задача через process_update
+    await asyncio.gather(*[processor.process_update(u, handler(u)) for u in updates])
+    elapsed = time.perf_counter() - started
+    await processor.shutdown()
+
+    ordered = all(seq == sorted(seq) for seq in seen.values())
+    return elapsed, ordered
+
+
+async def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--users", type=int, default=200)
+    ap.add_argument("--per-user", type=int, default=5)
+    ap.add_argument("--latency", type=float, default=0.05, help="средняя длительность хендлера, сек")
+    ap.add_argument("--jitter", type=float, default=0.5)
+    ap.add_argument("--workers", type=int, default=32)
+    ap.add_argument("--skip-sequential", action="store_true")
+    args = ap.parse_args()
+
+    updates = make_updates(args.users, args.per_user)
+    print(f"📊 {len(updates)} апдейтов от {args.users} пользователей, хендлер ~{args.latency * 1000:.0f} мс")
+
+    variants = [("keyed", KeyedUpdateProcessor(args.workers))]
+    if not args.skip_sequential:
+        variants.insert(0, ("sequential", SimpleUpdateProcessor(1)))
+
+    for name, processor in variants:
+        elapsed, ordered = await run(processor, updates, args.latency, args.jitter)
+        print(
+            f"{name:>10}: {elapsed:8.2f} s  {len(updates) / elapsed:9.1f} upd/s  "
+            f"порядок по пользователю: {'OK' if ordered else 'НАРУШЕН'}"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
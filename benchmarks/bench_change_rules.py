@@ -0,0 +1,82 @@
+# bench_change_rules.py
+"""
+Скорость векторной проверки правил изменений (change_rules.evaluate) на большом числе товаров,
+в сравнении с эквивалентным циклом по dict.
+
+Запуск из корня репозитория:
+    python -m benchmarks.bench_change_rules --products 50000
+"""
+import argparse
+import time
+import numpy as np
+
+from change_rules import to_arrays, evaluate, DEFAULT_CHANGE_RULES
+
+
+def make_data(n: int, seed: int = 42):
+    rng = np.random.default_rng(seed)
+    basic = rng.uniform(200, 20000, n).round(2)
+    prev_price = (basic * rng.uniform(0.3, 1.0, n)).round(2)
+    # у ~20% товаров цена меняется
+    change = np.where(rng.random(n) < 0.2, rng.uniform(0.7, 1.2, n), 1.0)
+    price = (prev_price * change).round(2)
+    prev_stocks = rng.integers(0, 500, n)
+    stocks = np.where(rng.random(n) < 0.05, 0, prev_stocks + rng.integers(-20, 20, n).clip(min=-prev_stocks))
+    ids = np.arange(10_000_000, 10_000_000 + n, dtype=np.int64)
+
+    prev = [{"price": float(a), "basic_price": float(b), "stocks": int(c)} for a, b, c in zip(prev_price, basic, prev_stocks)]
+    cur = [{"price": float(a), "basic_price": float(b), "stocks": int(c)} for a, b, c in zip(price, basic, stocks)]
+    return ids, prev, cur
+
+
+def loop_evaluate(ids, prev, cur):
+    """Тот же набор правил по умолчанию, но циклом по dict — как было бы в parse_api_detail-стиле."""
+    out = {r["name"]: [] for r in DEFAULT_CHANGE_RULES}
+    for pid, p, c in zip(ids.tolist(), prev, cur):
+        if p["price"] > 0 and (c["price"] - p["price"]) / p["price"] * 100 <= -10:
+            out["price_drop_10"].append(pid)
+        pd = int(100 - p["price"] / p["basic_price"] * 100) if p["basic_price"] else None
+        cd = int(100 - c["price"] / c["basic_price"] * 100) if c["basic_price"] else None
+        if cd is not None and cd >= 50 and not (pd is not None and pd >= 50):
+            out["discount_50"].append(pid)
+        if c["stocks"] == 0 and p["stocks"] > 0:
+            out["out_of_stock"].append(pid)
+        if c["stocks"] > 0 and p["stocks"] == 0:
+            out["back_in_stock"].append(pid)
+    return out
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--products", type=int, default=50_000)
+    ap.add_argument("--repeat", type=int, default=20)
+    args = ap.parse_args()
+
+    ids, prev, cur = make_data(args.products)
+
+    t0 = time.perf_counter()
+    prev_arr = to_arrays(*([r[f] for r in prev] for f in ("price", "basic_price", "stocks")))
+    cur_arr = to_arrays(*([r[f] for r in cur] for f in ("price", "basic_price", "stocks")))
+    load_ms = (time.perf_counter() - t0) * 1000
+
+    t0 = time.perf_counter()
+    for _ in range(args.repeat):
+        vec = evaluate(ids, prev_arr, cur_arr, DEFAULT_CHANGE_RULES)
+    vec_ms = (time.perf_counter() - t0) * 1000 / args.repeat
+
+    t0 = time.perf_counter()
+    loop = loop_evaluate(ids, prev, cur)
+    loop_ms = (time.perf_counter() - t0) * 1000
+
+    same = all(vec[name].tolist() == loop[name] for name in loop)
+    print(f"📊 {args.products} товаров, {len(DEFAULT_CHANGE_RULES)} правил")
+    print(f"   загрузка в массивы: {load_ms:8.2f} мс")
+    print(f"   numpy evaluate:     {vec_ms:8.2f} мс")
+    print(f"   цикл по dict:       {loop_ms:8.2f} мс")
+    print(f"   совпадение результатов: {'OK' if same else 'РАСХОЖДЕНИЕ'}")
+    for name, matched in vec.items():
+        print(f"   {name:>15}: {matched.size}")
+
+
+if __name__ == "__main__":
+    main()
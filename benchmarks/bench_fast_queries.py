@@ -0,0 +1,155 @@
+# bench_fast_queries.py
+"""
+CPU процесса на запрос: ORM-сущности (как было) против Core-запросов из database/queries.py.
+
+Меряем time.process_time() клиента — время сервера БД и ожидание сети сюда не входят.
+Данные — в отдельной схеме (по умолчанию bench_fast_queries) той же БД, что и DATABASE_URL;
+схема удаляется в конце.
+
+Запуск из корня репозитория:
+    python -m benchmarks.bench_fast_queries --requests 2000 --products-per-user 50
+"""
+import argparse
+import asyncio
+import time
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import text, pool
+from sqlalchemy.future import select
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+
+from database.db import DATABASE_URL, DB_STATEMENT_CACHE_SIZE, Base
+from database.models import Product, User, ProductStatus
+from database import queries
+
+FIRST_TG_ID = 100_000_000
+
+
+async def fill(conn, users: int, per_user: int):
+    await conn.execute(text(
+        f"INSERT INTO users (tg_id, name) SELECT {FIRST_TG_ID} + g, 'user ' || g FROM generate_series(1, {users}) g"
+    ))
+    await conn.execute(text(
+        "INSERT INTO products (user_id, url, name, description, price, basic_price, stocks, wb_id, "
+        "                      category, image_url, status, scheduled_date, created_at, info) "
+        f"SELECT {FIRST_TG_ID} + 1 + g % {users}, 'https://www.wildberries.ru/catalog/' || g || '/detail.aspx', "
+        "       'Товар ' || g, repeat('описание ', 100), 990, 1990, 15, 10000000 + g, 'Одежда', "
+        "       'https://basket-01.wbbasket.ru/vol1/part1/' || g || '/images/big/1.webp', "
+        "       (CASE WHEN g % 3 = 0 THEN 'pending' ELSE 'posted' END)::productstatus, "
+        "       now() + interval '1 day', now() - (g % 30) * interval '1 day', "
+        "       jsonb_build_object('parsed_raw', jsonb_build_object('sizes', repeat('x', 500))) "
+        f"FROM generate_series(1, {users * per_user}) g"
+    ))
+    await conn.execute(text("ANALYZE users, products"))
+
+
+# --- было: ORM-сущности ---
+
+async def orm_user_exists(session, tg_id):
+    result = await session.execute(select(User).where(User.tg_id == tg_id))
+    return result.scalar_one_or_none() is not None
+
+
+async def orm_user_products(session, tg_id):
+    result = await session.execute(select(User).where(User.tg_id == tg_id))
+    user = result.scalar_one_or_none()
+    result = await session.execute(select(Product).where(Product.user_id == user.tg_id))
+    return [(p.id, p.name, p.price, p.url, p.status, p.created_at, p.scheduled_date) for p in result.scalars().all()]
+
+
+async def orm_product_post(session, product_id):
+    result = await session.execute(select(Product).where(Product.id == product_id))
+    p = result.scalar_one_or_none()
+    return (p.name, p.url, p.price, p.basic_price, p.stocks, p.wb_id, p.category, p.image_url)
+
+
+async def orm_stats(session, start, end):
+    result = await session.execute(select(Product).where(Product.created_at >= start, Product.created_at < end))
+    products = result.scalars().all()
+    return len(products), sum(p.status == ProductStatus.posted for p in products)
+
+
+# --- стало: Core + кэш подготовленных выражений ---
+
+async def fast_user_exists(session, tg_id):
+    return await queries.user_exists(await session.connection(), tg_id)
+
+
+async def fast_user_products(session, tg_id):
+    return await queries.get_user_products(await session.connection(), tg_id)
+
+
+async def fast_product_post(session, product_id):
+    return await queries.get_product_post(await session.connection(), product_id)
+
+
+async def fast_stats(session, start, end):
+    return await queries.count_products(await session.connection(), start, end)
+
+
+async def run(conn, fn, args_for, n: int):
+    # отдельная сессия на «запрос», как Depends(get_session), поверх одного соединения
+    for i in range(min(n, 50)):  # прогрев кэшей
+        async with AsyncSession(bind=conn) as session:
+            await fn(session, *args_for(i))
+    cpu0, wall0 = time.process_time(), time.perf_counter()
+    for i in range(n):
+        async with AsyncSession(bind=conn) as session:
+            await fn(session, *args_for(i))
+    return (time.process_time() - cpu0) / n * 1e6, (time.perf_counter() - wall0) / n * 1e6
+
+
+async def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--users", type=int, default=1000)
+    ap.add_argument("--products-per-user", type=int, default=50)
+    ap.add_argument("--requests", type=int, default=2000)
+    ap.add_argument("--schema", default="bench_fast_queries")
+    args = ap.parse_args()
+
+    now = datetime.now(timezone.utc)
+    start, end = now - timedelta(days=1), now + timedelta(days=1)
+    tg = lambda i: (FIRST_TG_ID + 1 + i % args.users,)
+    pid = lambda i: (1 + i % (args.users * args.products_per_user),)
+    period = lambda i: (start, end)
+    cases = [
+        ("check_user_exists", orm_user_exists, fast_user_exists, tg),
+        ("get_user_products", orm_user_products, fast_user_products, tg),
+        ("publish_product (чтение)", orm_product_post, fast_product_post, pid),
+        ("admin_stats (день)", orm_stats, fast_stats, period),
+    ]
+
+    engine = create_async_engine(
+        DATABASE_URL, poolclass=pool.NullPool,
+        connect_args={"prepared_statement_cache_size": DB_STATEMENT_CACHE_SIZE},
+    )
+    rows = []
+    async with engine.connect() as conn:
+        await conn.execute(text(f"DROP SCHEMA IF EXISTS {args.schema} CASCADE"))
+        await conn.execute(text(f"CREATE SCHEMA {args.schema}"))
+        await conn.execute(text(f"SET search_path TO {args.schema}"))
+        await conn.commit()
+        try:
+            await conn.run_sync(Base.metadata.create_all)
+            await fill(conn, args.users, args.products_per_user)
+            await conn.commit()
+            for label, orm_fn, fast_fn, args_for in cases:
+                orm = await run(conn, orm_fn, args_for, args.requests)
+                fast = await run(conn, fast_fn, args_for, args.requests)
+                rows.append((label, orm, fast))
+        finally:
+            await conn.rollback()
+            await conn.execute(text(f"DROP SCHEMA IF EXISTS {args.schema} CASCADE"))
+            await conn.commit()
+    await engine.dispose()
+
+    print(f"📊 {args.requests} запросов на сценарий, {args.products_per_user} товаров на пользователя, "
+          f"кэш выражений asyncpg={DB_STATEMENT_CACHE_SIZE}")
+    print(f"{'сценарий':<26}{'ORM CPU':>11}{'Core CPU':>11}{'выигрыш':>9}{'ORM wall':>11}{'Core wall':>11}")
+    for label, (orm_cpu, orm_wall), (fast_cpu, fast_wall) in rows:
+        print(f"{label:<26}{orm_cpu:>9.0f}мкс{fast_cpu:>9.0f}мкс{orm_cpu / fast_cpu:>8.1f}x"
+              f"{orm_wall:>9.0f}мкс{fast_wall:>9.0f}мкс")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
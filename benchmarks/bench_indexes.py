@@ -0,0 +1,176 @@
+# bench_indexes.py
+"""
+Планы и время горячих запросов products/price_latest без индексов миграции 0003 и с ними.
+
+Данные генерируются generate_series в отдельной схеме (по умолчанию bench_indexes) той же БД,
+что и DATABASE_URL; рабочие таблицы не затрагиваются, схема удаляется в конце (--keep — оставить).
+
+Запуск из корня репозитория:
+    python -m benchmarks.bench_indexes --products 1000000 --repeat 5
+    python -m benchmarks.bench_indexes --products 200000 --plans   # + полные текстовые планы
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import text, pool
+from sqlalchemy.future import select
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from database.db import DATABASE_URL, Base
+from database.models import Product, ProductStatus, PriceLatest
+
+FIRST_TG_ID = 100_000_000
+FIRST_WB_ID = 10_000_000
+
+
+def queries(users: int):
+    """Те же условия, что в backend.py / product_refresh.py / price_history.py / change_rules.py."""
+    now = datetime.now()
+    now_tz = datetime.now(timezone.utc)
+    # прошлый календарный месяц, как /api/admin/stats?type=month
+    month_end = now_tz.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    month_start = (month_end - timedelta(days=1)).replace(day=1)
+    return {
+        "товары пользователя": select(Product).where(Product.user_id == FIRST_TG_ID + users // 2),
+        "статистика за месяц": select(Product).where(Product.created_at >= month_start, Product.created_at < month_end),
+        "к выкладке (30 мин)": select(
+            Product.id, Product.wb_id, Product.price, Product.basic_price, Product.discount, Product.stocks,
+        ).where(
+            Product.status == ProductStatus.pending,
+            Product.scheduled_date >= now,
+            Product.scheduled_date < now + timedelta(minutes=30),
+            Product.wb_id.isnot(None),
+        ),
+        "по артикулу": select(Product.id).where(Product.wb_id == FIRST_WB_ID + 12345),
+        "снижения цен (24 ч)": select(PriceLatest).where(
+            PriceLatest.changed_at >= now_tz - timedelta(hours=24),
+            PriceLatest.prev_price.isnot(None),
+            (PriceLatest.prev_price - PriceLatest.price) * 100 >= PriceLatest.prev_price * 10,
+        ).order_by(PriceLatest.changed_at.desc()).limit(100),
+        "изменения (24 ч)": select(PriceLatest.wb_id, PriceLatest.price, PriceLatest.prev_price).where(
+            PriceLatest.updated_at >= now_tz - timedelta(hours=24)
+        ),
+    }
+
+
+HOT_INDEXES = [idx for table in (Product.__table__, PriceLatest.__table__) for idx in table.indexes]
+
+
+async def fill(conn, products: int, users: int):
+    # числа подставляем в текст (это int из argparse), даты — параметрами с явным типом
+    params = {"now": datetime.now(), "now_tz": datetime.now(timezone.utc)}
+    await conn.execute(text(
+        "INSERT INTO users (tg_id, name) "
+        f"SELECT {FIRST_TG_ID} + g, 'user ' || g FROM generate_series(1, {users}) g"
+    ), params)
+    # статусы: ~80% выложено, ~10% ждут выкладки в ближайшие ±15 дней; ~10% артикулов повторяются
+    await conn.execute(text(
+        "INSERT INTO products (user_id, url, name, wb_id, price, basic_price, discount, stocks, "
+        "                      status, scheduled_date, created_at) "
+        f"SELECT ({FIRST_TG_ID} + 1 + floor(random() * {users}))::bigint, "
+        "       'https://www.wildberries.ru/catalog/' || g || '/detail.aspx', 'Товар ' || g, "
+        f"       {FIRST_WB_ID} + floor(random() * {products} * 0.9)::bigint, "
+        "       p.price, round(p.price * 1.6), 37, floor(random() * 500)::int, "
+        "       (CASE WHEN r < 0.8 THEN 'posted' WHEN r < 0.9 THEN 'pending' "
+        "             WHEN r < 0.95 THEN 'processing' ELSE 'canceled' END)::productstatus, "
+        "       CAST(:now AS timestamp) + (random() * 30 - 15) * interval '1 day', "
+        "       CAST(:now_tz AS timestamptz) - random() * interval '365 days' "
+        f"FROM generate_series(1, {products}) g, "
+        "     LATERAL (SELECT random() AS r, round((200 + random() * 20000)::numeric, 2)::float AS price "
+        "              WHERE g IS NOT NULL) p"
+    ), params)
+    await conn.execute(text(
+        "INSERT INTO price_latest (wb_id, price, prev_price, basic_price, stocks, updated_at, changed_at) "
+        f"SELECT {FIRST_WB_ID} + g, p, CASE WHEN random() < 0.3 THEN round(p * (0.8 + random() * 0.4)) END, "
+        "       round(p * 1.6), floor(random() * 500)::int, u, u - random() * interval '7 days' "
+        f"FROM generate_series(1, {products}) g, "
+        "     LATERAL (SELECT round(20000 + random() * 2000000)::int AS p, "
+        "                     CAST(:now_tz AS timestamptz) - random() * interval '30 days' AS u WHERE g IS NOT NULL) x"
+    ), params)
+    await conn.execute(text("ANALYZE users, products, price_latest"))
+
+
+def _plan_nodes(node, out):
+    name = node["Node Type"]
+    target = node.get("Index Name") or node.get("Relation Name")
+    out.append(f"{name} ({target})" if target else name)
+    for child in node.get("Plans", []):
+        _plan_nodes(child, out)
+    return out
+
+
+async def measure(conn, stmts, repeat: int, show_plans: bool):
+    results = {}
+    for label, stmt in stmts.items():
+        sql = str(stmt.compile(dialect=conn.dialect, compile_kwargs={"literal_binds": True}))
+        times, plan = [], None
+        for _ in range(repeat):
+            raw = (await conn.execute(text(f"EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {sql}"))).scalar()
+            plan = (json.loads(raw) if isinstance(raw, str) else raw)[0]
+            times.append(plan["Execution Time"])
+        nodes = [n for n in _plan_nodes(plan["Plan"], []) if "Scan" in n]
+        results[label] = {"ms": statistics.median(times), "rows": plan["Plan"]["Actual Rows"], "scans": nodes}
+        if show_plans:
+            text_plan = (await conn.execute(text(f"EXPLAIN (ANALYZE, BUFFERS) {sql}"))).scalars().all()
+            print(f"\n--- {label} ---\n" + "\n".join(text_plan))
+    return results
+
+
+async def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--products", type=int, default=1_000_000)
+    ap.add_argument("--users", type=int, default=0, help="по умолчанию products / 20")
+    ap.add_argument("--repeat", type=int, default=5)
+    ap.add_argument("--schema", default="bench_indexes")
+    ap.add_argument("--plans", action="store_true")
+    ap.add_argument("--keep", action="store_true", help="не удалять схему после прогона")
+    args = ap.parse_args()
+    users = args.users or max(args.products // 20, 1)
+
+    engine = create_async_engine(DATABASE_URL, poolclass=pool.NullPool, isolation_level="AUTOCOMMIT")
+    async with engine.connect() as conn:
+        await conn.execute(text(f"DROP SCHEMA IF EXISTS {args.schema} CASCADE"))
+        await conn.execute(text(f"CREATE SCHEMA {args.schema}"))
+        await conn.execute(text(f"SET search_path TO {args.schema}"))
+        try:
+            await conn.run_sync(Base.metadata.create_all)
+            for idx in HOT_INDEXES:
+                await conn.execute(text(f"DROP INDEX {idx.name}"))
+
+            t0 = time.perf_counter()
+            await fill(conn, args.products, users)
+            print(f"📦 {args.products} товаров, {users} пользователей: {time.perf_counter() - t0:.1f} с")
+
+            stmts = queries(users)
+            before = await measure(conn, stmts, args.repeat, args.plans)
+
+            print("🏗  CREATE INDEX CONCURRENTLY:")
+            for idx in HOT_INDEXES:
+                cols = ", ".join(c.name for c in idx.columns)
+                t0 = time.perf_counter()
+                await conn.execute(text(f"CREATE INDEX CONCURRENTLY {idx.name} ON {idx.table.name} ({cols})"))
+                print(f"   {idx.name:<36} {time.perf_counter() - t0:6.2f} с")
+            await conn.execute(text("ANALYZE products, price_latest"))
+
+            after = await measure(conn, stmts, args.repeat, args.plans)
+        finally:
+            if not args.keep:
+                await conn.execute(text(f"DROP SCHEMA IF EXISTS {args.schema} CASCADE"))
+    await engine.dispose()
+
+    print(f"\n📊 медиана Execution Time из {args.repeat} EXPLAIN ANALYZE, мс")
+    print(f"{'запрос':<22}{'строк':>9}{'без индексов':>14}{'с индексами':>13}{'ускорение':>11}")
+    for label in stmts:
+        b, a = before[label], after[label]
+        speedup = b["ms"] / a["ms"] if a["ms"] else float("inf")
+        print(f"{label:<22}{a['rows']:>9}{b['ms']:>14.2f}{a['ms']:>13.2f}{speedup:>10.1f}x")
+        print(f"{'':<22}до:    {', '.join(b['scans'])}")
+        print(f"{'':<22}после: {', '.join(a['scans'])}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
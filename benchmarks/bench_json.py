@@ -0,0 +1,201 @@
+# bench_json.py
+"""
+JSON на наших реальных формах данных: стандартный json и FastAPI против json_codec (orjson).
+
+Кодирование:
+- результат parse_product (ответ /api/products/parse) — characteristics, images, stocks_by_size;
+- список товаров пользователя (/api/products/{tg_id}) — datetime и статусы;
+- info.parsed_raw (JSONB) и платёж YooKassa.
+Для каждого: json.dumps (только если данные JSON-совместимы), путь FastAPI для возвращённого dict
+(jsonable_encoder + JSONResponse.render) и json_codec.dumps / FastJSONResponse.
+Декодирование: ответы card.json и card.wb.ru v4 (одиночный и пачка), уведомление YooKassa.
+
+Ответы WB — из фикстур wb_replay (--fixtures) или синтетические того же вида.
+Запуск из корня репозитория:
+    python -m benchmarks.bench_json
+    python -m benchmarks.bench_json --fixtures fixtures/wb --products 300
+    JSON_CODEC=stdlib python -m benchmarks.bench_json   # кодек без orjson
+"""
+import argparse
+import json
+import random
+import re
+import timeit
+from datetime import datetime, timedelta, timezone
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+import json_codec
+from json_codec import FastJSONResponse
+from database.models import ProductStatus, PARSED_COLUMNS
+from new_parser import WBParser
+from standin import FakeYooKassaServer
+from wb_replay import DETAIL_URL, _body, load_fixtures, fixture_articuls, synthesize, synthetic_articuls
+
+
+_NM = re.compile(r"nm=(\d+)(?:&|$)")
+
+
+def wb_bodies(exchanges):
+    """{articul: (тело card.json, тело card.wb.ru)} для артикулов, у которых есть оба ответа."""
+    cards, details = {}, {}
+    for ex in exchanges:
+        body = _body(ex)
+        if ex["method"] != "GET" or ex["status"] != 200 or not body:
+            continue
+        if ex["url"].endswith("/info/ru/card.json"):
+            cards[ex["url"].rsplit("/", 4)[-4]] = body
+        elif ex["url"].startswith(DETAIL_URL.split("?")[0]):
+            m = _NM.search(ex["url"])
+            if m and json.loads(body).get("products"):
+                details[m.group(1)] = body
+    return {a: (cards[a], details[a]) for a in details if a in cards}
+
+
+def parse_product_result(articul: str, card_body: bytes, detail_body: bytes) -> dict:
+    """Тот же набор полей, что собирает WBParser._parse_product из card.json и card.wb.ru."""
+    card = json.loads(card_body)
+    p = json.loads(detail_body)["products"][0]
+    nm = int(articul)
+    images = [f"https://basket-{nm % 32 + 1:02d}.wbbasket.ru/vol{nm // 100000}/part{nm // 1000}/{nm}/images/big/{i}.webp"
+              for i in range(1, min(p.get("pics") or 1, 3) + 1)]
+    return {
+        "name": card.get("imt_name"),
+        "brand": card.get("selling", {}).get("brand_name"),
+        "description": card.get("description"),
+        "characteristics": {o["name"]: o["value"] for o in card.get("options", [])},
+        "id": p["id"],
+        "supplier": p.get("supplierName"),
+        "seller": p.get("supplierName"),
+        "rating": p.get("reviewRating") or 0,
+        "feedbacks": p.get("feedbacks") or 0,
+        **WBParser._extract_prices_stocks(p),
+        "images": images,
+        "success": True,
+        "articul": articul,
+        "url": f"https://www.wildberries.ru/catalog/{articul}/detail.aspx",
+    }
+
+
+def user_products(count: int, rnd: random.Random) -> dict:
+    now = datetime.now(timezone.utc)
+    statuses = list(ProductStatus)
+    return {
+        "success": True, "tg_id": "123456789", "user_id": "123456789",
+        "products": [
+            {
+                "id": i, "name": f"Товар {rnd.randrange(10**7, 4 * 10**8)}", "price": round(rnd.uniform(300, 20000), 2),
+                "url": f"https://www.wildberries.ru/catalog/{rnd.randrange(10**7, 4 * 10**8)}/detail.aspx",
+                "status": rnd.choice(statuses).value,
+                "created_at": now - timedelta(seconds=rnd.randrange(365 * 86400)),
+                "scheduled_date": (now + timedelta(seconds=rnd.randrange(-86400, 3 * 86400))).replace(tzinfo=None),
+            }
+            for i in range(count)
+        ],
+    }
+
+
+def yookassa_payment(rnd: random.Random) -> dict:
+    payment = {
+        "id": "2e8f1a3c-000f-5000-9000-1b6d2c3e4f50", "status": "pending", "paid": False, "test": False,
+        "amount": {"value": f"{rnd.randrange(100, 5000)}.00", "currency": "RUB"},
+        "description": "Публикация товара в канале",
+        "metadata": {"tg_id": "123456789", "url": "https://www.wildberries.ru/catalog/123456789/detail.aspx",
+                     "name": "Товар", "category": "Женщинам", "scheduled_date": "2025-01-01T12:00"},
+        "confirmation": {"type": "redirect", "confirmation_url": "https://yoomoney.ru/checkout/payments/v2/contract"},
+        "created_at": "2025-01-01T09:00:00.000Z",
+        "recipient": {"account_id": "000000", "gateway_id": "000000"},
+    }
+    return FakeYooKassaServer.notification(payment)
+
+
+def per_op_us(fn, number: int) -> float:
+    return min(timeit.repeat(fn, number=number, repeat=5)) / number * 1e6
+
+
+def encode_row(label: str, payloads, number: int):
+    def stdlib():
+        for obj in payloads:
+            json.dumps(obj, ensure_ascii=False).encode("utf-8")
+
+    def fastapi_default():
+        for obj in payloads:
+            JSONResponse(jsonable_encoder(obj))
+
+    def codec():
+        for obj in payloads:
+            FastJSONResponse(obj)
+
+    try:
+        stdlib()
+        plain = per_op_us(stdlib, number) / len(payloads)
+    except TypeError:
+        plain = None
+    base = per_op_us(fastapi_default, number) / len(payloads)
+    fast = per_op_us(codec, number) / len(payloads)
+    size = sum(len(json_codec.dumps(o)) for o in payloads) // len(payloads)
+    plain_s = f"{plain:>10.1f}" if plain is not None else f"{'—':>10}"
+    print(f"{label:<30}{size:>8}{plain_s}{base:>10.1f}{fast:>10.1f}{base / fast:>9.1f}x")
+
+
+def decode_row(label: str, bodies, number: int):
+    def stdlib():
+        for body in bodies:
+            json.loads(body)
+
+    def codec():
+        for body in bodies:
+            json_codec.loads(body)
+
+    plain = per_op_us(stdlib, number) / len(bodies)
+    fast = per_op_us(codec, number) / len(bodies)
+    size = sum(len(b) for b in bodies) // len(bodies)
+    print(f"{label:<30}{size:>8}{plain:>10.1f}{fast:>10.1f}{plain / fast:>9.1f}x")
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--fixtures", nargs="*", help="файлы/каталоги фикстур wb_replay (по умолчанию — синтетика)")
+    ap.add_argument("--products", type=int, default=200)
+    ap.add_argument("--user-products", type=int, default=300, help="товаров в ответе /api/products/{tg_id}")
+    ap.add_argument("--batch-size", type=int, default=50)
+    ap.add_argument("--number", type=int, default=20, help="проходов по всем payload'ам на замер")
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+    rnd = random.Random(args.seed)
+
+    if args.fixtures:
+        exchanges = load_fixtures(args.fixtures)
+        articuls = fixture_articuls(exchanges)[:args.products]
+    else:
+        articuls = synthetic_articuls(args.products, args.seed)
+        exchanges = synthesize(articuls, args.seed)
+    bodies = wb_bodies(exchanges)
+    parsed = [parse_product_result(a, *bodies[a]) for a in articuls if a in bodies]
+    if not parsed:
+        raise SystemExit("В фикстурах нет пар card.json + card.wb.ru")
+    parsed_raw = [{"parsed_raw": {k: v for k, v in p.items() if k not in PARSED_COLUMNS}} for p in parsed]
+    details = [json.loads(bodies[a][1])["products"][0] for a in articuls if a in bodies]
+    batches = [json.dumps({"products": details[i:i + args.batch_size]}, ensure_ascii=False).encode("utf-8")
+               for i in range(0, len(details), args.batch_size)]
+    notifications = [yookassa_payment(rnd) for _ in range(50)]
+
+    print(f"🧪 кодек json_codec: {json_codec.NAME}; товаров: {len(parsed)}; мкс на объект (min из 5 замеров)")
+    print(f"\n{'кодирование':<30}{'байт':>8}{'json':>10}{'FastAPI':>10}{'codec':>10}{'выигрыш':>10}")
+    encode_row("parse_product", parsed, args.number)
+    encode_row(f"товары пользователя ({args.user_products})",
+               [user_products(args.user_products, rnd) for _ in range(5)], args.number)
+    encode_row("info.parsed_raw (JSONB)", parsed_raw, args.number)
+    encode_row("уведомление YooKassa", notifications, args.number)
+
+    print(f"\n{'декодирование':<30}{'байт':>8}{'json':>10}{'codec':>10}{'выигрыш':>10}")
+    decode_row("card.json", [bodies[a][0] for a in articuls if a in bodies], args.number)
+    decode_row("card.wb.ru v4 (1 товар)", [bodies[a][1] for a in articuls if a in bodies], args.number)
+    decode_row(f"card.wb.ru v4 (пачка {args.batch_size})", batches, args.number)
+    decode_row("уведомление YooKassa", [json.dumps(n).encode() for n in notifications], args.number)
+    decode_row("info.parsed_raw (JSONB)", [json_codec.dumps(p) for p in parsed_raw], args.number)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+# bench_logging.py
+"""
+Цена строки лога для вызывающей корутины: print(json.dumps(...)) (как было) против app_logging.
+
+Сценарий — «💳 CALLBACK RAW» на каждый webhook YooKassa с типичным телом уведомления.
+Меряем только время в вызывающем потоке (то, что держит event loop); запись в файл
+у app_logging идёт в фоновом потоке. Вывод — в --out (по умолчанию /dev/null);
+--slow-ms добавляет задержку на каждую строку, как у забитого диска или journald.
+
+Запуск из корня репозитория:
+    python -m benchmarks.bench_logging --events 20000 --out /tmp/bench_log.txt
+    python -m benchmarks.bench_logging --events 500 --slow-ms 1
+"""
+import argparse
+import json
+import logging
+import sys
+import time
+
+PAYLOAD = {
+    "type": "notification",
+    "event": "payment.succeeded",
+    "object": {
+        "id": "2f8e0a6c-000f-5000-9000-1b2a3c4d5e6f",
+        "status": "succeeded",
+        "amount": {"value": "199.00", "currency": "RUB"},
+        "income_amount": {"value": "192.03", "currency": "RUB"},
+        "description": "Размещение товара: Платье летнее женское миди с поясом",
+        "recipient": {"account_id": "123456", "gateway_id": "2345678"},
+        "payment_method": {
+            "type": "bank_card", "id": "2f8e0a6c-000f-5000-9000-1b2a3c4d5e6f", "saved": False,
+            "card": {"first6": "555555", "last4": "4444", "expiry_month": "12", "expiry_year": "2027",
+                     "card_type": "MasterCard", "issuer_country": "RU"},
+        },
+        "captured_at": "2025-10-01T12:00:05.000Z",
+        "created_at": "2025-10-01T11:59:40.000Z",
+        "test": False,
+        "paid": True,
+        "refundable": True,
+        "metadata": {
+            "order_id": "b3c5a3e4-5f2d-4c8e-9a51-0c6f0e7a1d22", "user_id": "123456789",
+            "url": "https://www.wildberries.ru/catalog/123456789/detail.aspx",
+            "name": "Платье летнее женское миди с поясом", "description": "Лёгкое платье из вискозы " * 6,
+            "price": "1990", "scheduled_date": "2025-10-02T10:00:00", "category": "Одежда",
+            "parse_token": "eyJ3YiI6MTIzNDU2Nzg5fQ.c2lnbmF0dXJl",
+            "traceparent": "00-4bf92f3577b34da6a3ce929d0e0e4736-00f067aa0ba902b7-01",
+        },
+        "receipt_registration": "succeeded",
+    },
+}
+
+
+class SlowWriter:
+    """Поток вывода, который «тормозит» на каждой строке."""
+
+    def __init__(self, stream, delay: float):
+        self.stream = stream
+        self.delay = delay
+
+    def write(self, text: str) -> int:
+        if self.delay and "\n" in text:
+            time.sleep(self.delay)
+        return self.stream.write(text)
+
+    def flush(self):
+        self.stream.flush()
+
+    def close(self):
+        self.stream.close()
+
+
+def bench(fn, n: int) -> float:
+    for _ in range(min(n, 200)):
+        fn()
+    t0 = time.perf_counter()
+    for _ in range(n):
+        fn()
+    return (time.perf_counter() - t0) / n * 1e6
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--events", type=int, default=20_000)
+    ap.add_argument("--out", default="/dev/null")
+    ap.add_argument("--slow-ms", type=float, default=0.0, help="задержка записи строки в вывод")
+    args = ap.parse_args()
+
+    real_stdout = sys.stdout
+    sys.stdout = SlowWriter(open(args.out, "w", encoding="utf-8"), args.slow_ms / 1000)
+    try:
+        # фоновый писатель пишет в тот же --out
+        from app_logging import setup_logging, shutdown_logging, dropped_records, Redacted, sampled
+        setup_logging("INFO")
+        logger = logging.getLogger("bench")
+
+        rows = [
+            ("print(json.dumps) — было", bench(
+                lambda: print("💳 CALLBACK RAW:", json.dumps(PAYLOAD, ensure_ascii=False)), args.events)),
+            ("debug(Redacted) при INFO", bench(
+                lambda: logger.debug("💳 CALLBACK RAW: %s", Redacted(PAYLOAD)), args.events)),
+            ("info(Redacted), в очередь", bench(
+                lambda: logger.info("💳 CALLBACK RAW: %s", Redacted(PAYLOAD)), args.events)),
+            ("info(короткая строка)", bench(
+                lambda: logger.info("💳 YooKassa callback: %s", "payment.succeeded"), args.events)),
+            ("info(..., extra=sampled())", bench(
+                lambda: logger.info("📩 Запрос к WB API: %s", "https://card.wb.ru/...", extra=sampled()), args.events)),
+        ]
+        # дописать очередь до закрытия вывода
+        shutdown_logging()
+    finally:
+        sys.stdout.close()
+        sys.stdout = real_stdout
+
+    print(f"📊 {args.events} событий, вывод в {args.out} (+{args.slow_ms} мс на строку); "
+          f"время в вызывающем потоке на событие")
+    for label, us in rows:
+        print(f"{label:<32}{us:>10.1f} мкс")
+    if dropped_records():
+        print(f"⚠️ очередь переполнялась: выброшено {dropped_records()} записей")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+# bench_parser.py
+"""
+WBParser на записанных (или синтетических) ответах WB: стенд wb_replay.ReplayServer в отдельном потоке.
+
+Сценарии:
+- parse_product — полный парсинг товара (card.json + card.wb.ru + поиск CDN картинок);
+- batch — parse_api_details_batch пачками по --batch-size (фоновое обновление цен).
+Для каждого: товаров/с, p50/p99 задержки вызова и запросов в WB на товар (по группам хостов).
+Общий кэш парсинга (shared_cache) выключен — иначе после первого прохода мерили бы SQLite; запись истории цен —
+тоже (БД бенчмарку не нужна).
+
+Запуск из корня репозитория:
+    python -m benchmarks.bench_parser --products 50 --concurrency 8
+    python -m benchmarks.bench_parser --fixtures fixtures/wb --latency-scale 0.5 --rate-429 0.05
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+import new_parser
+import shared_cache
+from new_parser import WBParser
+from wb_replay import ReplayServer, load_fixtures, fixture_articuls, synthesize, synthetic_articuls
+
+
+def percentile(values, q: float) -> float:
+    values = sorted(values)
+    return values[min(int(len(values) * q), len(values) - 1)] if values else 0.0
+
+
+async def run_calls(calls, concurrency: int):
+    """calls — список корутинных фабрик; (задержки в мс, число успехов, общее время)."""
+    sem = asyncio.Semaphore(concurrency)
+    latencies, ok = [], 0
+
+    async def one(call):
+        nonlocal ok
+        async with sem:
+            started = time.perf_counter()
+            result = await call()
+            latencies.append((time.perf_counter() - started) * 1000)
+            ok += bool(result)
+
+    started = time.perf_counter()
+    await asyncio.gather(*[one(c) for c in calls])
+    return latencies, ok, time.perf_counter() - started
+
+
+def report(label: str, server: ReplayServer, products: int, latencies, ok: int, elapsed: float, calls: int):
+    stats = dict(server.stats)
+    groups = {k[6:]: v for k, v in stats.items() if k.startswith("group:")}
+    statuses = {k[7:]: v for k, v in stats.items() if k.startswith("status:")}
+    print(f"\n▶️ {label}: {products} товаров, {calls} вызовов, успешных {ok}")
+    print(f"   {products / elapsed:8.1f} товаров/с   p50 {statistics.median(latencies):7.1f} мс"
+          f"   p99 {percentile(latencies, 0.99):7.1f} мс   всего {elapsed:.2f} с")
+    print(f"   запросов в WB на товар: {stats.get('requests', 0) / products:.1f}  "
+          + "  ".join(f"{g}={v / products:.1f}" for g, v in sorted(groups.items())))
+    print(f"   ответы стенда: {statuses}, обрывов: {stats.get('dropped', 0)}, промахов фикстур: {stats.get('misses', 0)}")
+
+
+async def _success(call) -> bool:
+    result = await call()
+    return bool(result.get("success"))
+
+
+async def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--fixtures", nargs="*", help="файлы/каталоги фикстур (по умолчанию — синтетика)")
+    ap.add_argument("--products", type=int, default=50)
+    ap.add_argument("--concurrency", type=int, default=8)
+    ap.add_argument("--batch-size", type=int, default=20)
+    ap.add_argument("--latency-scale", type=float, default=1.0)
+    ap.add_argument("--latency-ms", type=float, default=None)
+    ap.add_argument("--error-rate", type=float, default=0.0)
+    ap.add_argument("--drop-rate", type=float, default=0.0)
+    ap.add_argument("--rate-429", type=float, default=0.0)
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+
+    if args.fixtures:
+        exchanges = load_fixtures(args.fixtures)
+        articuls = fixture_articuls(exchanges)[:args.products]
+    else:
+        articuls = synthetic_articuls(args.products, args.seed)
+        exchanges = synthesize(articuls, args.seed)
+    if not articuls:
+        raise SystemExit("❌ В фикстурах нет одиночных ответов card.wb.ru (nm=<артикул>) — замерять нечего")
+
+    shared_cache.PARSE_CACHE_ENABLED = False
+    new_parser.RECORD_PRICE_HISTORY = False
+    server = ReplayServer(
+        exchanges, latency_scale=args.latency_scale, latency_ms=args.latency_ms, error_rate=args.error_rate,
+        drop_rate=args.drop_rate, rate_429=args.rate_429, seed=args.seed,
+    )
+    url = server.start_in_thread()
+    parser = WBParser(upstream_url=url)
+    await parser.setup()
+    print(f"🎭 Стенд {url}: {len(exchanges)} записей, {len(articuls)} артикулов, "
+          f"concurrency={args.concurrency}, 429={args.rate_429}, 503={args.error_rate}, обрывы={args.drop_rate}")
+    try:
+        n = len(articuls)
+        server.reset_stats()
+        calls = [lambda a=a: parser.parse_product(f"https://www.wildberries.ru/catalog/{a}/detail.aspx") for a in articuls]
+        latencies, ok, elapsed = await run_calls([lambda c=c: _success(c) for c in calls], args.concurrency)
+        report("parse_product", server, n, latencies, ok, elapsed, len(calls))
+
+        server.reset_stats()
+        chunks = [articuls[i:i + args.batch_size] for i in range(0, n, args.batch_size)]
+        latencies, ok, elapsed = await run_calls(
+            [lambda c=c: parser.parse_api_details_batch(c) for c in chunks], args.concurrency,
+        )
+        report(f"parse_api_details_batch (по {args.batch_size})", server, n, latencies, ok, elapsed, len(chunks))
+    finally:
+        await parser.close()
+        server.stop_thread()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
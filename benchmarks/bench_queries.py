@@ -0,0 +1,249 @@
+# bench_queries.py
+"""
+Время и планы горячих запросов backend.py к users/products на наборе из gen_dataset.py.
+
+Для каждого запроса — те же объекты/условия, что в приложении (database/queries.py, backend.py,
+product_refresh.py): --repeat выполнений через asyncpg (p50/p95 с сетью и разбором строк)
+и EXPLAIN (ANALYZE, BUFFERS). В --out сохраняются:
+- summary.json — время, Execution/Planning Time, буферы, узлы сканирования, а также
+  версия PostgreSQL, индексы схемы и git-ревизия, на которых делался замер;
+- <запрос>.json / <запрос>.txt — полный план (JSON и текст вместе с SQL).
+
+Сравнение до/после изменения схемы (индекс, партиционирование, тип колонки): два прогона
+в разные каталоги, затем --compare. Изменение можно применить прямо к схеме набора через
+--apply файл.sql (выражения через «;», выполняются в AUTOCOMMIT, потом ANALYZE).
+
+Запуск из корня репозитория:
+    python -m benchmarks.gen_dataset --products 2000000
+    python -m benchmarks.bench_queries --out query_plans/before
+    python -m benchmarks.bench_queries --apply candidate.sql --out query_plans/after
+    python -m benchmarks.bench_queries --compare query_plans/before query_plans/after
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import time
+from datetime import datetime, timedelta
+
+import pytz
+from sqlalchemy import text, pool
+from sqlalchemy.future import select
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from database.db import DATABASE_URL
+from database.models import Product, User, ProductStatus
+from database import queries
+from benchmarks.bench_indexes import _plan_nodes
+from benchmarks.gen_dataset import DEFAULT_SCHEMA
+
+MSK = pytz.timezone("Europe/Moscow")
+
+
+async def pick_params(conn) -> dict:
+    """Детерминированные параметры из самих данных: крупнейший и медианный продавец, товар из середины."""
+    heavy = (await conn.execute(text(
+        "SELECT user_id FROM products GROUP BY user_id ORDER BY count(*) DESC, user_id LIMIT 1"
+    ))).scalar()
+    users = (await conn.execute(text("SELECT count(*) FROM users"))).scalar()
+    typical = (await conn.execute(text(
+        "SELECT tg_id FROM users ORDER BY tg_id OFFSET :n LIMIT 1"
+    ), {"n": users // 2})).scalar()
+    product_id = (await conn.execute(text("SELECT (min(id) + max(id)) / 2 FROM products"))).scalar()
+    wb_id = (await conn.execute(text(
+        "SELECT wb_id FROM products WHERE id >= :id ORDER BY id LIMIT 1"
+    ), {"id": product_id})).scalar()
+    return {"heavy": heavy, "typical": typical, "product_id": product_id, "wb_id": wb_id}
+
+
+def hot_queries(p: dict) -> dict:
+    """{ключ: (описание, выражение, параметры)} — условия как в обработчиках backend.py."""
+    now = datetime.now(MSK)
+    # compute_stats: type=day — сегодня по Москве, type=month — прошлый календарный месяц
+    day_start = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    month_end = MSK.localize(datetime(now.year, now.month, 1))
+    prev = month_end - timedelta(days=1)
+    month_start = MSK.localize(datetime(prev.year, prev.month, 1))
+    # product_refresh.refresh_due_products: naive локальное время, окно 30 минут
+    naive_now = datetime.now()
+    return {
+        "user_exists": ("GET /api/users/{tg_id}", queries.USER_EXISTS, {"tg_id": p["typical"]}),
+        "user_lookup": ("add/register/callback: User по tg_id",
+                        select(User).where(User.tg_id == p["typical"]), {}),
+        "user_products_heavy": ("GET /api/products/{tg_id}, крупнейший продавец",
+                                queries.USER_PRODUCTS, {"tg_id": p["heavy"]}),
+        "user_products_typical": ("GET /api/products/{tg_id}, медианный продавец",
+                                  queries.USER_PRODUCTS, {"tg_id": p["typical"]}),
+        "product_post": ("публикация поста: товар по id", queries.PRODUCT_POST, {"product_id": p["product_id"]}),
+        "stats_day": ("GET /api/admin/stats?type=day", queries.STATS_RANGE,
+                      {"start": day_start, "end": day_start + timedelta(days=1)}),
+        "stats_month": ("GET /api/admin/stats?type=month", queries.STATS_RANGE,
+                        {"start": month_start, "end": month_end}),
+        "stats_all": ("GET /api/admin/stats?type=all", queries.STATS_ALL, {}),
+        "due_queue_30m": ("product_refresh: к выкладке в ближайшие 30 минут", select(
+            Product.id, Product.wb_id, Product.price, Product.basic_price, Product.discount, Product.stocks,
+        ).where(
+            Product.status == ProductStatus.pending,
+            Product.scheduled_date >= naive_now,
+            Product.scheduled_date < naive_now + timedelta(minutes=30),
+            Product.wb_id.isnot(None),
+        ), {}),
+        "products_by_wb_id": ("товары с тем же артикулом", select(Product.id).where(Product.wb_id == p["wb_id"]), {}),
+    }
+
+
+def percentile(values, q: float) -> float:
+    values = sorted(values)
+    return values[min(int(len(values) * q), len(values) - 1)] if values else 0.0
+
+
+def _literal_sql(conn, stmt, params: dict) -> str:
+    if params:
+        stmt = stmt.params(**params)
+    return str(stmt.compile(dialect=conn.dialect, compile_kwargs={"literal_binds": True}))
+
+
+async def measure(conn, stmt, params: dict, repeat: int) -> dict:
+    # первый прогон — прогрев кэшей (SQLAlchemy, подготовленные выражения asyncpg, shared_buffers)
+    rows = len((await conn.execute(stmt, params)).all())
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        (await conn.execute(stmt, params)).all()
+        times.append((time.perf_counter() - started) * 1000)
+    return {"rows": rows, "p50_ms": statistics.median(times), "p95_ms": percentile(times, 0.95)}
+
+
+async def explain(conn, sql: str):
+    raw = (await conn.execute(text(f"EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {sql}"))).scalar()
+    plan = (json.loads(raw) if isinstance(raw, str) else raw)[0]
+    text_plan = (await conn.execute(text(f"EXPLAIN (ANALYZE, BUFFERS) {sql}"))).scalars().all()
+    return plan, text_plan
+
+
+async def environment(conn, schema: str) -> dict:
+    indexes = (await conn.execute(text(
+        "SELECT indexdef FROM pg_indexes WHERE schemaname = :schema ORDER BY tablename, indexname"
+    ), {"schema": schema})).scalars().all()
+    sizes = dict((await conn.execute(text(
+        "SELECT c.relname, c.reltuples::bigint FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace "
+        "WHERE n.nspname = :schema AND c.relname IN ('users', 'products')"
+    ), {"schema": schema})).all())
+    try:
+        rev = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        rev = None
+    return {
+        "at": datetime.now().isoformat(timespec="seconds"),
+        "schema": schema,
+        "server_version": (await conn.execute(text("SHOW server_version"))).scalar(),
+        "git_rev": rev or None,
+        "rows": sizes,
+        "indexes": list(indexes),
+    }
+
+
+async def apply_sql(conn, path: str) -> None:
+    with open(path, encoding="utf-8") as f:
+        statements = [s.strip() for s in f.read().split(";") if s.strip()]
+    for stmt in statements:
+        t0 = time.perf_counter()
+        await conn.execute(text(stmt))
+        print(f"🛠  {stmt.splitlines()[0][:70]:<70} {time.perf_counter() - t0:6.2f} с")
+    await conn.execute(text("ANALYZE users, products"))
+
+
+async def run(args) -> None:
+    os.makedirs(args.out, exist_ok=True)
+    engine = create_async_engine(DATABASE_URL, poolclass=pool.NullPool, isolation_level="AUTOCOMMIT")
+    async with engine.connect() as conn:
+        await conn.execute(text(f"SET search_path TO {args.schema}"))
+        if args.apply:
+            await apply_sql(conn, args.apply)
+        params = await pick_params(conn)
+        summary = {"meta": {**await environment(conn, args.schema), "params": params}, "queries": {}}
+
+        print(f"{'запрос':<24}{'строк':>8}{'p50, мс':>10}{'p95, мс':>10}{'exec, мс':>10}{'буферы':>9}  сканирования")
+        for key, (description, stmt, values) in hot_queries(params).items():
+            if args.only and not any(o in key for o in args.only):
+                continue
+            timing = await measure(conn, stmt, values, args.repeat)
+            sql = _literal_sql(conn, stmt, values)
+            plan, text_plan = await explain(conn, sql)
+            top = plan["Plan"]
+            result = {
+                "description": description,
+                **timing,
+                "execution_ms": plan["Execution Time"],
+                "planning_ms": plan["Planning Time"],
+                "shared_hit": top.get("Shared Hit Blocks", 0),
+                "shared_read": top.get("Shared Read Blocks", 0),
+                "scans": [n for n in _plan_nodes(top, []) if "Scan" in n],
+                "sql": sql,
+            }
+            summary["queries"][key] = result
+            with open(os.path.join(args.out, f"{key}.json"), "w", encoding="utf-8") as f:
+                json.dump(plan, f, ensure_ascii=False, indent=2)
+            with open(os.path.join(args.out, f"{key}.txt"), "w", encoding="utf-8") as f:
+                f.write(f"-- {description}\n{sql};\n\n" + "\n".join(text_plan) + "\n")
+            buffers = result["shared_hit"] + result["shared_read"]
+            print(f"{key:<24}{result['rows']:>8}{result['p50_ms']:>10.2f}{result['p95_ms']:>10.2f}"
+                  f"{result['execution_ms']:>10.2f}{buffers:>9}  {', '.join(result['scans'])}")
+    await engine.dispose()
+
+    with open(os.path.join(args.out, "summary.json"), "w", encoding="utf-8") as f:
+        json.dump(summary, f, ensure_ascii=False, indent=2, default=str)
+    print(f"💾 Планы и сводка: {args.out}")
+
+
+def compare(dir_a: str, dir_b: str) -> None:
+    with open(os.path.join(dir_a, "summary.json"), encoding="utf-8") as f:
+        a = json.load(f)
+    with open(os.path.join(dir_b, "summary.json"), encoding="utf-8") as f:
+        b = json.load(f)
+    print(f"A: {dir_a} ({a['meta']['at']}, {a['meta'].get('git_rev')}, строк {a['meta']['rows']})")
+    print(f"B: {dir_b} ({b['meta']['at']}, {b['meta'].get('git_rev')}, строк {b['meta']['rows']})")
+    added = sorted(set(b["meta"]["indexes"]) - set(a["meta"]["indexes"]))
+    removed = sorted(set(a["meta"]["indexes"]) - set(b["meta"]["indexes"]))
+    for idx in added:
+        print(f"   + {idx}")
+    for idx in removed:
+        print(f"   - {idx}")
+
+    print(f"\n{'запрос':<24}{'p50 A':>9}{'p50 B':>9}{'exec A':>9}{'exec B':>9}{'буф. A':>9}{'буф. B':>9}{'B/A':>7}")
+    for key, qa in a["queries"].items():
+        qb = b["queries"].get(key)
+        if qb is None:
+            continue
+        ratio = qb["execution_ms"] / qa["execution_ms"] if qa["execution_ms"] else float("inf")
+        buf_a = qa["shared_hit"] + qa["shared_read"]
+        buf_b = qb["shared_hit"] + qb["shared_read"]
+        print(f"{key:<24}{qa['p50_ms']:>9.2f}{qb['p50_ms']:>9.2f}{qa['execution_ms']:>9.2f}{qb['execution_ms']:>9.2f}"
+              f"{buf_a:>9}{buf_b:>9}{ratio:>6.2f}x")
+        if qa["scans"] != qb["scans"]:
+            print(f"{'':<24}⚠️ план: {', '.join(qa['scans'])} -> {', '.join(qb['scans'])}")
+        if qa["rows"] != qb["rows"]:
+            print(f"{'':<24}⚠️ строк: {qa['rows']} -> {qb['rows']}")
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--schema", default=DEFAULT_SCHEMA)
+    ap.add_argument("--repeat", type=int, default=20)
+    ap.add_argument("--out", default=None, help="каталог для планов (по умолчанию query_plans/<время>)")
+    ap.add_argument("--apply", help="SQL-файл с изменением схемы, применяется перед замером")
+    ap.add_argument("--only", nargs="*", help="только запросы, в ключе которых есть подстрока")
+    ap.add_argument("--compare", nargs=2, metavar=("DIR_A", "DIR_B"), help="сравнить два сохранённых прогона")
+    args = ap.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+    args.out = args.out or os.path.join("query_plans", datetime.now().strftime("%Y%m%d-%H%M%S"))
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+# bench_startup.py
+"""
+Холодный старт процессов: сколько стоит import backend / import main и когда воркер отвечает.
+
+- импорт: python -X importtime в чистом процессе (внутри asyncio.run, как у uvicorn), --repeat раз; медиана общего
+  времени и самые дорогие пакеты (сумма собственного времени модулей пакета) и прямые импорты модуля;
+- --serve: uvicorn backend:app на свободном порту — время от запуска процесса до первого ответа
+  /metrics (воркер слушает, без БД; с временным ADMIN_API_TOKEN) и до первого ответа /api/users/0 (с соединением пула к БД).
+  Нужны DATABASE_URL и доступная БД: startup_event проверяет соединение.
+
+Окружение (.env, DATABASE_URL, BOT_TOKEN) — как у приложения. Запуск из корня репозитория:
+    python -m benchmarks.bench_startup --repeat 5
+    python -m benchmarks.bench_startup --modules backend --top 30 --serve
+"""
+import argparse
+import os
+import re
+import secrets
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+from collections import defaultdict
+
+_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$")
+
+
+def import_profile(module: str):
+    """[(собственное мкс, суммарное мкс, глубина, модуль)] одного холодного импорта."""
+    # импорт внутри работающего event loop — как uvicorn загружает приложение
+    code = f"import asyncio\nasync def _load():\n    import {module}\nasyncio.run(_load())"
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", code], capture_output=True, text=True)
+    if proc.returncode != 0:
+        raise RuntimeError(f"import {module} завершился с кодом {proc.returncode}:\n{proc.stderr[-2000:]}")
+    rows = []
+    for line in proc.stderr.splitlines():
+        m = _LINE.match(line)
+        if m:
+            rows.append((int(m.group(1)), int(m.group(2)), (len(m.group(3)) - 1) // 2, m.group(4)))
+    return rows
+
+
+def report_imports(module: str, repeat: int, top: int) -> None:
+    runs = [import_profile(module) for _ in range(repeat)]
+    totals = []
+    for rows in runs:
+        root = [r for r in rows if r[3] == module and r[2] == 0]
+        totals.append(root[-1][1] / 1000 if root else 0.0)
+    # разбивка — по прогону с медианным временем
+    rows = runs[sorted(range(repeat), key=lambda i: totals[i])[repeat // 2]]
+    packages = defaultdict(int)
+    for self_us, _, _, name in rows:
+        packages[name.split(".")[0]] += self_us
+    direct = sorted((r for r in rows if r[2] == 1), key=lambda r: -r[1])
+
+    print(f"\n📦 import {module}: медиана {statistics.median(totals):.0f} мс "
+          f"(min {min(totals):.0f}, max {max(totals):.0f}, {repeat} прогонов), модулей: {len(rows)}")
+    print(f"   {'пакет':<28}{'мс':>8}     {'прямой импорт':<28}{'мс':>8}")
+    by_package = sorted(packages.items(), key=lambda kv: -kv[1])[:top]
+    for i in range(max(len(by_package), min(len(direct), top))):
+        left = f"{by_package[i][0]:<28}{by_package[i][1] / 1000:>8.1f}" if i < len(by_package) else " " * 36
+        right = f"{direct[i][3]:<28}{direct[i][1] / 1000:>8.1f}" if i < min(len(direct), top) else ""
+        print(f"   {left}     {right}")
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _wait(url: str, proc: subprocess.Popen, deadline: float, headers: dict = None) -> float:
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"backend завершился с кодом {proc.returncode}")
+        try:
+            with urllib.request.urlopen(urllib.request.Request(url, headers=headers or {}), timeout=2) as resp:
+                if resp.status == 200:
+                    return time.monotonic()
+        except (urllib.error.URLError, ConnectionError, TimeoutError):
+            pass
+        time.sleep(0.01)
+    raise RuntimeError(f"{url}: нет ответа за отведённое время")
+
+
+def time_to_first_request(timeout: float = 60) -> tuple:
+    port = _free_port()
+    base = f"http://127.0.0.1:{port}"
+    # /metrics закрыт X-Admin-Token — поднимаем backend со своим токеном
+    admin_token = secrets.token_hex(16)
+    started = time.monotonic()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "backend:app", "--port", str(port), "--log-level", "warning"],
+        stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, env={**os.environ, "ADMIN_API_TOKEN": admin_token},
+    )
+    try:
+        listening = _wait(f"{base}/metrics", proc, started + timeout, {"X-Admin-Token": admin_token})
+        first_db = _wait(f"{base}/api/users/0", proc, started + timeout)
+        return (listening - started) * 1000, (first_db - started) * 1000
+    except RuntimeError:
+        proc.kill()
+        sys.stderr.write(proc.communicate()[1].decode(errors="replace")[-2000:])
+        raise
+    finally:
+        if proc.poll() is None:
+            proc.terminate()
+            proc.wait(10)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--modules", nargs="*", default=["backend", "main"])
+    ap.add_argument("--repeat", type=int, default=5)
+    ap.add_argument("--top", type=int, default=15)
+    ap.add_argument("--serve", action="store_true", help="замерить время до первого ответа uvicorn backend:app")
+    args = ap.parse_args()
+
+    # первый импорт пишет .pyc — его не считаем: воркеры стартуют с готовым байткодом
+    for module in args.modules:
+        import_profile(module)
+        report_imports(module, args.repeat, args.top)
+
+    if args.serve:
+        results = [time_to_first_request() for _ in range(args.repeat)]
+        print(f"\n🚀 uvicorn backend:app, медиана из {args.repeat}: "
+              f"слушает через {statistics.median(r[0] for r in results):.0f} мс, "
+              f"первый запрос к БД через {statistics.median(r[1] for r in results):.0f} мс")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+# bench_tg_id.py
+"""
+Telegram id как VARCHAR (как было) против BIGINT (миграция 0004): размер индексов и время поиска/джойна.
+
+Две пары таблиц users/products с одинаковыми данными создаются в отдельной схеме
+(по умолчанию bench_tg_id) той же БД, что и DATABASE_URL; схема удаляется в конце.
+
+Запуск из корня репозитория:
+    python -m benchmarks.bench_tg_id --users 200000 --products 2000000
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+
+from sqlalchemy import text, pool
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from database.db import DATABASE_URL
+
+VARIANTS = {"text": "varchar", "bigint": "bigint"}
+
+
+async def create(conn, kind: str, sql_type: str, users: int, products: int):
+    await conn.execute(text(
+        f"CREATE TABLE users_{kind} (id serial PRIMARY KEY, tg_id {sql_type} UNIQUE, name varchar)"
+    ))
+    await conn.execute(text(
+        f"CREATE TABLE products_{kind} (id serial PRIMARY KEY, "
+        f"user_id {sql_type} REFERENCES users_{kind} (tg_id), name varchar)"
+    ))
+    # одинаковые id в обоих вариантах: берём их из общей таблицы ids
+    await conn.execute(text(
+        f"INSERT INTO users_{kind} (tg_id, name) SELECT tg_id::{sql_type}, 'user ' || n FROM ids ORDER BY n"
+    ))
+    await conn.execute(text(
+        f"INSERT INTO products_{kind} (user_id, name) "
+        f"SELECT i.tg_id::{sql_type}, 'Товар ' || g "
+        f"FROM generate_series(1, {products}) g JOIN ids i ON i.n = 1 + (g::bigint * 7919) % {users}"
+    ))
+    await conn.execute(text(f"CREATE INDEX ix_products_{kind}_user_id ON products_{kind} (user_id)"))
+    await conn.execute(text(f"ANALYZE users_{kind}, products_{kind}"))
+
+
+async def sizes(conn, kind: str) -> dict:
+    row = (await conn.execute(text(
+        f"SELECT pg_relation_size('users_{kind}_tg_id_key'), pg_relation_size('ix_products_{kind}_user_id'), "
+        f"pg_relation_size('users_{kind}') + pg_relation_size('products_{kind}')"
+    ))).one()
+    return {"unique_idx": row[0], "user_id_idx": row[1], "tables": row[2]}
+
+
+async def explain_ms(conn, sql: str, repeat: int) -> float:
+    times = []
+    for _ in range(repeat):
+        raw = (await conn.execute(text(f"EXPLAIN (ANALYZE, FORMAT JSON) {sql}"))).scalar()
+        times.append((json.loads(raw) if isinstance(raw, str) else raw)[0]["Execution Time"])
+    return statistics.median(times)
+
+
+def _mb(n: int) -> str:
+    return f"{n / 1024 / 1024:.1f} МБ"
+
+
+async def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--users", type=int, default=200_000)
+    ap.add_argument("--products", type=int, default=2_000_000)
+    ap.add_argument("--probes", type=int, default=20_000, help="сколько точечных поисков по tg_id")
+    ap.add_argument("--repeat", type=int, default=5)
+    ap.add_argument("--schema", default="bench_tg_id")
+    args = ap.parse_args()
+
+    engine = create_async_engine(DATABASE_URL, poolclass=pool.NullPool, isolation_level="AUTOCOMMIT")
+    results = {}
+    async with engine.connect() as conn:
+        await conn.execute(text(f"DROP SCHEMA IF EXISTS {args.schema} CASCADE"))
+        await conn.execute(text(f"CREATE SCHEMA {args.schema}"))
+        await conn.execute(text(f"SET search_path TO {args.schema}"))
+        try:
+            # реалистичные id: 9–10 знаков, как у пользователей Telegram
+            await conn.execute(text(
+                "CREATE TABLE ids AS SELECT n, 100000000 + (n::bigint * 2654435761) % 8000000000 AS tg_id "
+                f"FROM generate_series(1, {args.users}) n"
+            ))
+            await conn.execute(text(
+                f"CREATE TABLE probe AS SELECT tg_id FROM ids ORDER BY random() LIMIT {args.probes}"
+            ))
+            await conn.execute(text("ANALYZE ids, probe"))
+
+            for kind, sql_type in VARIANTS.items():
+                t0 = time.perf_counter()
+                await create(conn, kind, sql_type, args.users, args.products)
+                load_s = time.perf_counter() - t0
+
+                # точечные поиски по индексу, как User.tg_id == ... в каждом запросе бота/WebApp
+                await conn.execute(text("SET enable_hashjoin = off"))
+                await conn.execute(text("SET enable_mergejoin = off"))
+                lookup_ms = await explain_ms(
+                    conn,
+                    f"SELECT count(*) FROM probe p JOIN users_{kind} u ON u.tg_id = p.tg_id::{sql_type}",
+                    args.repeat,
+                )
+                await conn.execute(text("RESET enable_hashjoin"))
+                await conn.execute(text("RESET enable_mergejoin"))
+
+                # товары пользователей по FK-колонке (get_user_products, статистика по пользователям)
+                join_ms = await explain_ms(
+                    conn,
+                    f"SELECT count(*) FROM users_{kind} u JOIN products_{kind} p ON p.user_id = u.tg_id",
+                    args.repeat,
+                )
+                results[kind] = {**await sizes(conn, kind), "load_s": load_s, "lookup_ms": lookup_ms, "join_ms": join_ms}
+        finally:
+            await conn.execute(text(f"DROP SCHEMA IF EXISTS {args.schema} CASCADE"))
+    await engine.dispose()
+
+    t, b = results["text"], results["bigint"]
+    print(f"📊 {args.users} пользователей, {args.products} товаров, медиана из {args.repeat} EXPLAIN ANALYZE")
+    print(f"{'':<28}{'varchar':>12}{'bigint':>12}{'bigint/varchar':>16}")
+    rows = [
+        ("users.tg_id UNIQUE", _mb(t["unique_idx"]), _mb(b["unique_idx"]), b["unique_idx"] / t["unique_idx"]),
+        ("products.user_id индекс", _mb(t["user_id_idx"]), _mb(b["user_id_idx"]), b["user_id_idx"] / t["user_id_idx"]),
+        ("таблицы (heap)", _mb(t["tables"]), _mb(b["tables"]), b["tables"] / t["tables"]),
+        (f"{args.probes} поисков по tg_id", f"{t['lookup_ms']:.1f} мс", f"{b['lookup_ms']:.1f} мс", b["lookup_ms"] / t["lookup_ms"]),
+        ("джойн users ⨝ products", f"{t['join_ms']:.1f} мс", f"{b['join_ms']:.1f} мс", b["join_ms"] / t["join_ms"]),
+        ("загрузка + индексы", f"{t['load_s']:.1f} с", f"{b['load_s']:.1f} с", b["load_s"] / t["load_s"]),
+    ]
+    for label, tv, bv, ratio in rows:
+        print(f"{label:<28}{tv:>12}{bv:>12}{ratio:>15.2f}x")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
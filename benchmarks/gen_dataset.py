@@ -0,0 +1,200 @@
+# gen_dataset.py
+"""
+Синтетический набор данных users/products для бенчмарков запросов (bench_queries.py).
+
+Распределения — как в проде, а не равномерные:
+- продавцы: размер «магазина» по степенному закону (--skew): у верхнего 1% пользователей
+  ~20% товаров при skew=3, у большинства — единицы; так же скошены бренды и продавцы WB;
+- created_at: рост сервиса (плотность линейно растёт к сегодняшнему дню за --days дней)
+  и суточный ритм с пиком днём по Москве;
+- scheduled_date: через 0–72 ч после добавления (ближе — чаще); будущие — в статусе pending,
+  поэтому очередь выкладки на ближайшие 30 минут имеет реалистичный размер;
+- JSONB: stocks_by_size, images и info.parsed_raw в том виде, в каком их пишет /api/products/add
+  из результата parse_product (characteristics, supplier, articul), плюс длинное description.
+
+Таблицы создаются по моделям в отдельной схеме (по умолчанию bench_dataset) той же БД, что и
+DATABASE_URL; индексы моделей строятся после заливки (--no-indexes — не строить). Заливка
+пачками по --chunk строк в своих транзакциях, генерация целиком на стороне PostgreSQL.
+
+Запуск из корня репозитория:
+    python -m benchmarks.gen_dataset --users 100000 --products 2000000
+    python -m benchmarks.gen_dataset --products 5000000 --skew 4 --seed 0.42 --no-indexes
+"""
+import argparse
+import asyncio
+import time
+from datetime import datetime, timezone
+
+from sqlalchemy import text, pool
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from database.db import DATABASE_URL, Base
+from database.models import Product
+
+DEFAULT_SCHEMA = "bench_dataset"
+FIRST_TG_ID = 100_000_000
+FIRST_WB_ID = 10_000_000
+
+SIZES = ["XS", "S", "M", "L", "XL", "XXL", "3XL"]
+BRANDS = ["Zara", "Nike", "Тефаль", "Lego", "Adidas", "Samsung", "Love Republic", "Gloria Jeans", "ZARINA", "Xiaomi",
+          "Lamoda", "Befree", "Bosch", "Philips", "Demix", "Mavi", "Sela", "Colin's", "Ostin", "Incity"]
+CATEGORIES = ["Женщинам", "Мужчинам", "Детям", "Обувь", "Дом", "Красота", "Электроника", "Игрушки",
+              "Спорт", "Аксессуары", "Бытовая техника", "Разное"]
+
+
+def _pg_array(values) -> str:
+    return "ARRAY[" + ", ".join("'" + v.replace("'", "''") + "'" for v in values) + "]"
+
+
+async def fill_users(conn, users: int, days: int, chunk: int) -> None:
+    for lo in range(1, users + 1, chunk):
+        hi = min(lo + chunk - 1, users)
+        await conn.execute(text(
+            "INSERT INTO users (tg_id, name, phone, created_at) "
+            f"SELECT {FIRST_TG_ID} + g, 'Продавец ' || g, "
+            "       CASE WHEN random() < 0.6 THEN '+79' || lpad(floor(random() * 1e9)::bigint::text, 9, '0') END, "
+            f"      CAST(:now_tz AS timestamptz) - {days} * (1 - sqrt(random())) * interval '1 day' "
+            f"FROM generate_series({lo}, {hi}) g"
+        ), {"now_tz": datetime.now(timezone.utc)})
+
+
+async def fill_products(conn, products: int, users: int, days: int, skew: float, chunk: int) -> None:
+    # числа подставляем в текст (int/float из argparse), время — параметром с явным типом.
+    # WHERE c.g IS NOT NULL в LATERAL-подзапросах — чтобы random() считался для каждой строки, а не один раз
+    articuls = max(int(products * 0.9), 1)
+    sellers = max(users // 4, 1)
+    sql = text(
+        "WITH b AS ("
+        f"  SELECT g, {FIRST_TG_ID} + 1 + floor({users} * power(random(), {skew}))::bigint AS user_id, "
+        # популярные артикулы добавляют многие продавцы
+        f"         {FIRST_WB_ID} + floor({articuls} * power(random(), 2))::bigint AS wb_id, "
+        f"         1 + floor({sellers} * power(random(), {skew}))::int AS seller, "
+        f"         ({_pg_array(BRANDS)})[1 + floor({len(BRANDS)} * power(random(), 2))::int] AS brand, "
+        f"         ({_pg_array(CATEGORIES)})[1 + floor({len(CATEGORIES)} * random())::int] AS category, "
+        "          round((300 + 30000 * power(random(), 3))::numeric)::float AS basic_price, "
+        "          5 + floor(random() * 70)::int AS discount, "
+        # рост: плотность ~ возраст^-1 -> sqrt; день по Москве + час с пиком около 15:00
+        "          date_trunc('day', CAST(:now_tz AS timestamptz) "
+        f"                           - {days} * (1 - sqrt(random())) * interval '1 day') "
+        "            + (6 + 6 * (random() + random() + random())) * interval '1 hour' AS created, "
+        "          power(random(), 2) * interval '72 hours' AS delay, "
+        "          random() AS r "
+        "  FROM generate_series(CAST(:lo AS int), CAST(:hi AS int)) g"
+        "), c AS ("
+        "  SELECT b.*, CASE WHEN created > CAST(:now_tz AS timestamptz) THEN created - interval '1 day' "
+        "                   ELSE created END AS created_at "
+        "  FROM b"
+        ") "
+        "INSERT INTO products (user_id, url, name, description, image_url, wb_id, brand, seller, rating, feedbacks, "
+        "                      basic_price, discount, stocks, stocks_by_size, images, category, info, status, "
+        "                      scheduled_date, created_at, price) "
+        "SELECT c.user_id, 'https://www.wildberries.ru/catalog/' || c.wb_id || '/detail.aspx', "
+        "       'Товар ' || c.wb_id, repeat('Описание товара. ', 5 + floor(random() * 35)::int), "
+        "       img.images ->> 0, c.wb_id, c.brand, 'ИП Продавец ' || c.seller, "
+        "       round((3.5 + random() * 1.5)::numeric, 1)::float, floor(20000 * power(random(), 4))::int, "
+        "       c.basic_price, c.discount, st.stocks, st.stocks_by_size, img.images, c.category, "
+        "       jsonb_build_object('parsed_raw', jsonb_build_object("
+        "           'success', true, 'articul', c.wb_id::text, 'supplier', 'ИП Продавец ' || c.seller, "
+        "           'characteristics', ch.characteristics)), "
+        "       (CASE WHEN c.r < 0.01 THEN 'processing' WHEN c.r < 0.06 THEN 'canceled' "
+        "             WHEN c.created_at + c.delay > CAST(:now_tz AS timestamptz) THEN 'pending' "
+        "             ELSE 'posted' END)::productstatus, "
+        # scheduled_date — naive московское время, как normalize_datetime в backend.py
+        "       CASE WHEN c.r >= 0.01 THEN (c.created_at + c.delay) AT TIME ZONE 'Europe/Moscow' END, "
+        "       c.created_at, round(c.basic_price * (100 - c.discount) / 100) "
+        "FROM c, "
+        "LATERAL (SELECT coalesce(sum(q), 0)::int AS stocks, "
+        "                jsonb_agg(jsonb_build_object('size', s, 'qty', q)) AS stocks_by_size "
+        f"         FROM (SELECT s, floor(50 * power(random(), 2))::int AS q "
+        f"               FROM unnest(({_pg_array(SIZES)})[1:1 + floor(random() * {len(SIZES)})::int]) s "
+        "               WHERE c.g IS NOT NULL) x) st, "
+        "LATERAL (SELECT jsonb_agg('https://basket-' || lpad((1 + c.wb_id % 32)::text, 2, '0') "
+        "                          || '.wbbasket.ru/vol' || c.wb_id / 100000 || '/part' || c.wb_id / 1000 "
+        "                          || '/' || c.wb_id || '/images/big/' || i || '.webp') AS images "
+        "         FROM generate_series(1, 1 + floor(random() * 3)::int) i WHERE c.g IS NOT NULL) img, "
+        "LATERAL (SELECT jsonb_object_agg('Характеристика ' || i, 'Значение ' || floor(random() * 100)) "
+        "                  AS characteristics "
+        "         FROM generate_series(1, 3 + floor(random() * 22)::int) i WHERE c.g IS NOT NULL) ch"
+    )
+    now_tz = datetime.now(timezone.utc)
+    started = time.perf_counter()
+    for lo in range(1, products + 1, chunk):
+        hi = min(lo + chunk - 1, products)
+        await conn.execute(sql, {"lo": lo, "hi": hi, "now_tz": now_tz})
+        rate = hi / (time.perf_counter() - started)
+        print(f"   товаров {hi}/{products} ({rate:,.0f} строк/с)", end="\r", flush=True)
+    print()
+
+
+async def generate(conn, schema: str, users: int, products: int, days: int = 365, skew: float = 3.0,
+                   chunk: int = 200_000, seed: float = None, indexes: bool = True) -> None:
+    """Пересоздаёт schema и заполняет её. conn — AUTOCOMMIT-соединение (каждая пачка — своя транзакция)."""
+    await conn.execute(text(f"DROP SCHEMA IF EXISTS {schema} CASCADE"))
+    await conn.execute(text(f"CREATE SCHEMA {schema}"))
+    await conn.execute(text(f"SET search_path TO {schema}"))
+    # date_trunc('day', ...) и суточный ритм — по московскому времени
+    await conn.execute(text("SET TIME ZONE 'Europe/Moscow'"))
+    if seed is not None:
+        await conn.execute(text("SELECT setseed(:seed)"), {"seed": seed})
+    await conn.run_sync(Base.metadata.create_all)
+    model_indexes = list(Product.__table__.indexes)
+    for idx in model_indexes:
+        await conn.execute(text(f"DROP INDEX {idx.name}"))
+
+    t0 = time.perf_counter()
+    await fill_users(conn, users, days, chunk)
+    print(f"👤 {users} пользователей: {time.perf_counter() - t0:.1f} с")
+    t0 = time.perf_counter()
+    await fill_products(conn, products, users, days, skew, chunk)
+    print(f"📦 {products} товаров: {time.perf_counter() - t0:.1f} с")
+
+    if indexes:
+        for idx in model_indexes:
+            cols = ", ".join(c.name for c in idx.columns)
+            t0 = time.perf_counter()
+            await conn.execute(text(f"CREATE INDEX {idx.name} ON {idx.table.name} ({cols})"))
+            print(f"🏗  {idx.name:<36} {time.perf_counter() - t0:6.2f} с")
+    await conn.execute(text("VACUUM ANALYZE users"))
+    await conn.execute(text("VACUUM ANALYZE products"))
+
+
+async def describe(conn) -> None:
+    """Короткая сводка распределений — проверить, что данные похожи на прод."""
+    sizes = (await conn.execute(text(
+        "SELECT percentile_disc(ARRAY[0.5, 0.9, 0.99]) WITHIN GROUP (ORDER BY n), max(n) "
+        "FROM (SELECT count(*) AS n FROM products GROUP BY user_id) s"
+    ))).one()
+    print(f"🏪 товаров на продавца: p50={sizes[0][0]} p90={sizes[0][1]} p99={sizes[0][2]} max={sizes[1]}")
+    for status, n in (await conn.execute(text("SELECT status, count(*) FROM products GROUP BY 1 ORDER BY 2 DESC"))).all():
+        print(f"   {status}: {n}")
+    row = (await conn.execute(text(
+        "SELECT pg_size_pretty(pg_total_relation_size('products')), pg_size_pretty(pg_relation_size('products')), "
+        "       avg(pg_column_size(info))::int, avg(pg_column_size(description))::int FROM products"
+    ))).one()
+    print(f"💾 products: {row[0]} (куча {row[1]}), info ~{row[2]} Б, description ~{row[3]} Б на строку")
+
+
+async def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--users", type=int, default=0, help="по умолчанию products / 20")
+    ap.add_argument("--products", type=int, default=2_000_000)
+    ap.add_argument("--days", type=int, default=365, help="глубина истории created_at")
+    ap.add_argument("--skew", type=float, default=3.0, help="скошенность размеров продавцов (1 — равномерно)")
+    ap.add_argument("--chunk", type=int, default=200_000)
+    ap.add_argument("--seed", type=float, default=None, help="setseed() PostgreSQL, от -1 до 1")
+    ap.add_argument("--schema", default=DEFAULT_SCHEMA)
+    ap.add_argument("--no-indexes", action="store_true", help="не строить индексы моделей после заливки")
+    args = ap.parse_args()
+    users = args.users or max(args.products // 20, 1)
+
+    engine = create_async_engine(DATABASE_URL, poolclass=pool.NullPool, isolation_level="AUTOCOMMIT")
+    async with engine.connect() as conn:
+        await generate(conn, args.schema, users, args.products, args.days, args.skew, args.chunk,
+                       args.seed, not args.no_indexes)
+        await describe(conn)
+    await engine.dispose()
+    print(f"✅ Схема {args.schema} готова: python -m benchmarks.bench_queries --schema {args.schema}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,80 @@
+# bot_concurrency.py
+import os
+import asyncio
+from typing import Any, Awaitable, Dict, Hashable, Optional
+from telegram.ext import BaseUpdateProcessor
+from tracing import span
+
+# Сколько апдейтов бот обрабатывает одновременно (воркеры)
+BOT_CONCURRENT_UPDATES = int(os.getenv("BOT_CONCURRENT_UPDATES", "32"))
+# Сколько апдейтов может быть «в полёте» всего, включая ждущие очереди своего пользователя
+BOT_MAX_PENDING_UPDATES = int(os.getenv("BOT_MAX_PENDING_UPDATES", "512"))
+
+
+def update_key(update: Any) -> Optional[Hashable]:
+    """Ключ сериализации апдейта: пользователь, иначе чат. None — без упорядочивания."""
+    user = getattr(update, "effective_user", None)
+    if user is not None:
+        return ("user", user.id)
+    chat = getattr(update, "effective_chat", None)
+    if chat is not None:
+        return ("chat", chat.id)
+    return None
+
+
+def update_kind(update: Any) -> str:
+    """Тип апдейта для имени спана: successful_payment, web_app_data, callback_query, ..."""
+    for attr in ("pre_checkout_query", "callback_query", "message", "edited_message", "channel_post"):
+        obj = getattr(update, attr, None)
+        if obj is None:
+            continue
+        if attr == "message":
+            for sub in ("successful_payment", "web_app_data", "contact"):
+                if getattr(obj, sub, None):
+                    return sub
+            if (getattr(obj, "text", None) or "").startswith("/"):
+                return "command"
+        return attr
+    return "update"
+
+
+class KeyedUpdateProcessor(BaseUpdateProcessor):
+    """
+    Параллельная обработка апдейтов (не более workers одновременно),
+    но апдейты одного пользователя идут строго по очереди — например,
+    pre_checkout → successful_payment не перемешаются.
+    Апдейт сначала ждёт очереди своего пользователя и только потом занимает воркер,
+    так что один «шумный» пользователь не блокирует остальных.
+    """
+
+    def __init__(self, workers: int = BOT_CONCURRENT_UPDATES, max_pending: int = BOT_MAX_PENDING_UPDATES):
+        super().__init__(max(max_pending, workers))
+        self._workers = asyncio.BoundedSemaphore(workers)
+        # key -> [lock, сколько апдейтов держат/ждут lock]
+        self._locks: Dict[Hashable, list] = {}
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        key = update_key(update)
+        # 🧵 корень трассы апдейта (ожидание очереди пользователя входит в спан)
+        with span(f"bot.{update_kind(update)}", kind="SERVER", update_id=getattr(update, "update_id", None)):
+            if key is None:
+                async with self._workers:
+                    await coroutine
+                return
+
+            entry = self._locks.setdefault(key, [asyncio.Lock(), 0])
+            entry[1] += 1
+            try:
+                async with entry[0]:
+                    async with self._workers:
+                        await coroutine
+            finally:
+                entry[1] -= 1
+                if entry[1] == 0:
+                    self._locks.pop(key, None)
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
@@ -0,0 +1,71 @@
+# bot_webhook.py
+import os
+import hmac
+import logging
+from fastapi import FastAPI, Request, Response
+from telegram import Update
+
+logger = logging.getLogger(__name__)
+
+# --- Конфиг webhook-режима (из env) ---
+# Публичный адрес, на который nginx проксирует запросы Telegram (без пути), например https://api.zepovvv.ru
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/telegram/webhook")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
+# Адрес, который слушает отдельный webhook-процесс бота (за nginx)
+WEBHOOK_LISTEN = os.getenv("WEBHOOK_LISTEN", "127.0.0.1")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8081"))
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+def mount_bot_webhook(api: FastAPI, application, path: str = WEBHOOK_PATH, secret: str = WEBHOOK_SECRET):
+    """
+    Подключает бота (telegram.ext.Application, собранный без Updater) к FastAPI-приложению:
+    эндпоинт приёма апдейтов с проверкой secret token + запуск/остановка бота в startup/shutdown.
+    Используется и отдельным webhook-процессом (main.py), и backend.py при BOT_WEBHOOK_IN_BACKEND=1.
+
+    Состояние бота (инвойсы, кэши, очередь апдейтов по пользователю) живёт в памяти процесса: апдейты
+    принимает ровно один процесс — backend.py не монтирует бота при WEB_CONCURRENCY > 1.
+    Неоплаченные заказы дублируются в общий кэш хоста (main.remember_order) и переживают перезапуск.
+    """
+    if not secret:
+        raise RuntimeError("❌ WEBHOOK_SECRET не задан — webhook без проверки подписи не запускаем")
+
+    @api.post(path, include_in_schema=False)
+    async def telegram_webhook(request: Request):
+        token = request.headers.get(SECRET_HEADER, "")
+        if not hmac.compare_digest(token, secret):
+            return Response(status_code=403)
+
+        try:
+            data = await request.json()
+        except Exception:
+            return Response(status_code=400)
+
+        await application.update_queue.put(Update.de_json(data, application.bot))
+        return Response(status_code=200)
+
+    @api.on_event("startup")
+    async def start_bot():
+        await application.initialize()
+        if application.post_init:
+            await application.post_init(application)
+        await application.start()
+
+        if WEBHOOK_URL:
+            await application.bot.set_webhook(
+                url=f"{WEBHOOK_URL.rstrip('/')}{path}",
+                secret_token=secret,
+                allowed_updates=Update.ALL_TYPES,
+            )
+            logger.info("🔗 Webhook установлен: %s%s", WEBHOOK_URL.rstrip("/"), path)
+
+    @api.on_event("shutdown")
+    async def stop_bot():
+        await application.stop()
+        await application.shutdown()
+        if application.post_shutdown:
+            await application.post_shutdown(application)
+
+    return api
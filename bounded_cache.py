@@ -0,0 +1,130 @@
+# bounded_cache.py
+import sys
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+from metrics import CACHE_REQUESTS
+
+
+def approx_sizeof(obj: Any, _seen: Optional[set] = None) -> int:
+    """Примерный размер объекта в байтах вместе с вложенными dict/list/tuple/set."""
+    if _seen is None:
+        _seen = set()
+    if id(obj) in _seen:
+        return 0
+    _seen.add(id(obj))
+
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        for k, v in obj.items():
+            size += approx_sizeof(k, _seen) + approx_sizeof(v, _seen)
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        for it in obj:
+            size += approx_sizeof(it, _seen)
+    return size
+
+
+def sampled_sizeof(container: Any, limit: int = 256) -> int:
+    """
+    Оценка approx_sizeof для большого dict/list по первым limit элементам —
+    чтобы мерить реестры на тысячи записей, не обходя их целиком.
+    """
+    n = len(container)
+    if n <= limit:
+        return approx_sizeof(container)
+    items = container.items() if isinstance(container, dict) else container
+    sample = 0
+    for i, it in enumerate(items):
+        if i >= limit:
+            break
+        sample += approx_sizeof(it)
+    return sys.getsizeof(container) + sample * n // limit
+
+
+class BoundedCache:
+    """
+    LRU-кэш с TTL, лимитом числа записей и бюджетом памяти (по approx_sizeof).
+    Записи крупнее всего бюджета не кэшируются.
+    """
+
+    def __init__(self, name: str, ttl: float, max_entries: int, max_bytes: int):
+        self.name = name
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        # key -> (expires_at, size, value)
+        self._items: "OrderedDict[Hashable, tuple[float, int, Any]]" = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions: Dict[str, int] = {"ttl": 0, "lru": 0, "memory": 0}
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self.get(key) is not None
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        entry = self._items.get(key)
+        if entry is None:
+            self.misses += 1
+            CACHE_REQUESTS.labels(self.name, "miss").inc()
+            return default
+        if entry[0] <= time.monotonic():
+            self._remove(key, "ttl")
+            self.misses += 1
+            CACHE_REQUESTS.labels(self.name, "miss").inc()
+            return default
+        self._items.move_to_end(key)
+        self.hits += 1
+        CACHE_REQUESTS.labels(self.name, "hit").inc()
+        return entry[2]
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        if key in self._items:
+            self._remove(key)
+        size = approx_sizeof(value)
+        if size > self.max_bytes:
+            self.evictions["memory"] += 1
+            return
+        self._items[key] = (time.monotonic() + (ttl or self.ttl), size, value)
+        self._bytes += size
+        self._evict()
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        value = self.get(key, default)
+        self._remove(key)
+        return value
+
+    def _remove(self, key: Hashable, reason: Optional[str] = None) -> None:
+        entry = self._items.pop(key, None)
+        if entry is None:
+            return
+        self._bytes -= entry[1]
+        if reason:
+            self.evictions[reason] += 1
+
+    def _evict(self) -> None:
+        if len(self._items) <= self.max_entries and self._bytes <= self.max_bytes:
+            return
+        # сначала протухшие (иначе они истекают лениво при get), потом LRU
+        now = time.monotonic()
+        for key in [k for k, (exp, _, _) in self._items.items() if exp <= now]:
+            self._remove(key, "ttl")
+        while len(self._items) > self.max_entries:
+            self._remove(next(iter(self._items)), "lru")
+        while self._bytes > self.max_bytes:
+            self._remove(next(iter(self._items)), "memory")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "entries": len(self._items),
+            "max_entries": self.max_entries,
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": dict(self.evictions),
+        }
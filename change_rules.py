@@ -0,0 +1,108 @@
+# change_rules.py
+import os
+import json
+from datetime import datetime, timezone, timedelta
+from typing import Any, Dict, Iterable, List
+import numpy as np
+from sqlalchemy import or_
+from sqlalchemy.future import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from database.models import PriceLatest
+
+# Правила по умолчанию; переопределяются JSON-списком в CHANGE_RULES
+# [{"name": "...", "type": "<тип из RULE_TYPES>", "value": число}]
+DEFAULT_CHANGE_RULES = [
+    {"name": "price_drop_10", "type": "price_drop_pct", "value": 10},
+    {"name": "discount_50", "type": "discount_crossed", "value": 50},
+    {"name": "out_of_stock", "type": "out_of_stock"},
+    {"name": "back_in_stock", "type": "back_in_stock"},
+]
+CHANGE_RULES = json.loads(os.getenv("CHANGE_RULES") or "null") or DEFAULT_CHANGE_RULES
+
+def _discount(price: np.ndarray, basic: np.ndarray) -> np.ndarray:
+    # как в парсере: int(100 - price / basic * 100), NaN если базовой цены нет
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(basic > 0, np.trunc(100 - price / basic * 100), np.nan)
+
+
+def _price_change_pct(prev: np.ndarray, cur: np.ndarray) -> np.ndarray:
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(prev > 0, (cur - prev) / prev * 100, np.nan)
+
+
+# Тип правила -> маска по массивам prev/cur (NaN в сравнениях даёт False)
+RULE_TYPES = {
+    "price_drop_pct": lambda p, c, v: _price_change_pct(p["price"], c["price"]) <= -v,
+    "price_rise_pct": lambda p, c, v: _price_change_pct(p["price"], c["price"]) >= v,
+    "price_below": lambda p, c, v: (c["price"] <= v) & ~(p["price"] <= v),
+    "discount_crossed": lambda p, c, v: (c["discount"] >= v) & ~(p["discount"] >= v),
+    "out_of_stock": lambda p, c, v: (c["stocks"] == 0) & (p["stocks"] > 0),
+    "back_in_stock": lambda p, c, v: (c["stocks"] > 0) & (p["stocks"] == 0),
+    "low_stock": lambda p, c, v: (c["stocks"] <= v) & (p["stocks"] > v),
+}
+
+
+def to_arrays(price: Iterable, basic_price: Iterable, stocks: Iterable) -> Dict[str, np.ndarray]:
+    """Колонки значений -> float64-массивы (None -> NaN) + вычисленная скидка."""
+    arrays = {
+        "price": np.asarray(list(price), dtype=np.float64),
+        "basic_price": np.asarray(list(basic_price), dtype=np.float64),
+        "stocks": np.asarray(list(stocks), dtype=np.float64),
+    }
+    arrays["discount"] = _discount(arrays["price"], arrays["basic_price"])
+    return arrays
+
+
+def evaluate(ids: np.ndarray, prev: Dict[str, np.ndarray], cur: Dict[str, np.ndarray], rules: List[Dict[str, Any]] = None) -> Dict[str, np.ndarray]:
+    """Для каждого правила — массив ids товаров, на которых оно сработало."""
+    result = {}
+    for rule in rules or CHANGE_RULES:
+        check = RULE_TYPES.get(rule["type"])
+        if check is None:
+            raise ValueError(f"Неизвестный тип правила: {rule['type']}")
+        mask = check(prev, cur, float(rule.get("value") or 0))
+        result[rule["name"]] = ids[mask]
+    return result
+
+
+async def evaluate_latest(session: AsyncSession, hours: int = 24, rules: List[Dict[str, Any]] = None) -> Dict[str, List[int]]:
+    """Правила по товарам из price_latest, у которых цена/базовая цена/остатки менялись за последние hours часов.
+
+    Повторный парсинг без изменений (updated_at) правила заново не взводит: поле, не менявшееся в окне,
+    считается неизменным, иначе prev_* (последнее ОТЛИЧАЮЩЕЕСЯ значение) срабатывало бы и через месяц.
+    """
+    since = datetime.now(timezone.utc) - timedelta(hours=hours)
+    result = await session.execute(
+        select(
+            PriceLatest.wb_id, PriceLatest.price, PriceLatest.basic_price, PriceLatest.stocks,
+            PriceLatest.prev_price, PriceLatest.prev_basic_price, PriceLatest.prev_stocks,
+            PriceLatest.changed_at, PriceLatest.basic_price_changed_at, PriceLatest.stocks_changed_at,
+        ).where(or_(
+            PriceLatest.changed_at >= since,
+            PriceLatest.basic_price_changed_at >= since,
+            PriceLatest.stocks_changed_at >= since,
+        ))
+    )
+    rows = result.all()
+    n = len(rows)
+
+    def recent(ts) -> bool:
+        return ts is not None and ts >= since
+
+    ids = np.fromiter((r.wb_id for r in rows), dtype=np.int64, count=n)
+    # в price_latest цены в копейках, правила — в рублях (скидка от масштаба не зависит)
+    cur = to_arrays(
+        [r.price / 100 if r.price is not None else None for r in rows],
+        [r.basic_price / 100 if r.basic_price is not None else None for r in rows],
+        [r.stocks for r in rows],
+    )
+    # нет предыдущего значения или поле не менялось в окне — считаем, что не менялось
+    prev = to_arrays(
+        [(r.prev_price if r.prev_price is not None and recent(r.changed_at) else r.price) for r in rows],
+        [(r.prev_basic_price if r.prev_basic_price is not None and recent(r.basic_price_changed_at)
+          else r.basic_price) for r in rows],
+        [(r.prev_stocks if r.prev_stocks is not None and recent(r.stocks_changed_at) else r.stocks) for r in rows],
+    )
+    prev["price"] /= 100
+    prev["basic_price"] /= 100
+    return {name: matched.tolist() for name, matched in evaluate(ids, prev, cur, rules).items()}
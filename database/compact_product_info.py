@@ -0,0 +1,39 @@
+# compact_product_info.py
+"""
+Разовая чистка: убирает из products.info.parsed_raw значения, которые дублируют колонки.
+Запуск из корня репозитория: python -m database.compact_product_info
+"""
+import asyncio
+from sqlalchemy.future import select
+from sqlalchemy.orm import undefer_group
+from .db import AsyncSessionLocal
+from .models import Product
+
+BATCH_SIZE = 500
+
+
+async def compact():
+    last_id, total = 0, 0
+    while True:
+        async with AsyncSessionLocal() as session:
+            result = await session.execute(
+                select(Product)
+                .options(undefer_group("cold"))
+                .where(Product.id > last_id, Product.info.isnot(None))
+                .order_by(Product.id)
+                .limit(BATCH_SIZE)
+            )
+            products = result.scalars().all()
+            if not products:
+                break
+            for p in products:
+                p.set_parsed_raw((p.info or {}).get("parsed_raw") or {})
+            await session.commit()
+            last_id = products[-1].id
+            total += len(products)
+            print(f"🧹 Обработано {total} товаров (до id={last_id})")
+    print("✅ Готово")
+
+
+if __name__ == "__main__":
+    asyncio.run(compact())
@@ -1,13 +1,19 @@
 # create_db.py
-import asyncio
-from db import engine, Base
-import models  
+"""
+Создание/обновление схемы БД миграциями Alembic (раньше — Base.metadata.create_all).
+Запуск из корня репозитория: python -m database.create_db  (то же, что alembic upgrade head)
+"""
+import os
+from alembic import command
+from alembic.config import Config
+
+ALEMBIC_INI = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "alembic.ini")
+
+
+def init_db(revision: str = "head"):
+    command.upgrade(Config(ALEMBIC_INI), revision)
+    print("✅ Схема БД обновлена!")
 
-async def init_db():
-    async with engine.begin() as conn:
-        print(f"🔗 Подключаемся к базе: {engine.url}")
-        await conn.run_sync(Base.metadata.create_all)
-    print("✅ Таблицы созданы!")
 
 if __name__ == "__main__":
-    asyncio.run(init_db())
+    init_db()
@@ -1,26 +1,46 @@
 # db.py
-import os, asyncio
+import os
+import logging
+from contextlib import asynccontextmanager
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.orm import sessionmaker, declarative_base
 from sqlalchemy import text
-from sqlalchemy.exc import OperationalError, InterfaceError
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
 from dotenv import load_dotenv
+from .pool import pool_sizing, install_idle_ping, PoolStats, DB_POOL_TIMEOUT, DB_POOL_RECYCLE
+from tracing import instrument_engine
+from json_codec import dumps_str, loads
 
 load_dotenv()
+logger = logging.getLogger(__name__)
 
 DATABASE_URL = os.getenv("DATABASE_URL")
 
 if DATABASE_URL and DATABASE_URL.startswith("postgresql://"):
     DATABASE_URL = DATABASE_URL.replace("postgresql://", "postgresql+asyncpg://")
 
+# Кэш подготовленных выражений asyncpg на соединение (0 — выключить, нужно за pgbouncer в transaction-режиме)
+DB_STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", "256"))
+# Кэш скомпилированного SQL в SQLAlchemy (на движок)
+DB_QUERY_CACHE_SIZE = int(os.getenv("DB_QUERY_CACHE_SIZE", "500"))
+
 engine = create_async_engine(
     DATABASE_URL,
     echo=False,
-    pool_pre_ping=True,       # проверка соединения перед использованием
-    pool_recycle=1800,        # обновлять каждые 30 мин
-    pool_size=5,
-    max_overflow=10,
+    pool_pre_ping=False,      # вместо пинга на каждой выдаче — пинг после простоя (install_idle_ping)
+    pool_recycle=DB_POOL_RECYCLE,
+    pool_timeout=DB_POOL_TIMEOUT,
+    **pool_sizing(),
+    query_cache_size=DB_QUERY_CACHE_SIZE,
+    connect_args={"prepared_statement_cache_size": DB_STATEMENT_CACHE_SIZE},
+    # JSONB (info, images, stocks_by_size) — тем же кодеком, что и ответы API
+    json_serializer=dumps_str,
+    json_deserializer=loads,
 )
+install_idle_ping(engine)
+# спан на каждый SQL-запрос внутри трассы (если трассировка включена)
+instrument_engine(engine)
+POOL_STATS = PoolStats()
 
 AsyncSessionLocal = sessionmaker(
     bind=engine,
@@ -30,21 +50,41 @@ AsyncSessionLocal = sessionmaker(
 
 Base = declarative_base()
 
+@asynccontextmanager
+async def session_scope():
+    """
+    Сессия с уже выданным соединением: ожидание пула учитывается в POOL_STATS,
+    при исчерпании пула дольше DB_POOL_TIMEOUT — sqlalchemy.exc.TimeoutError.
+    """
+    session = AsyncSessionLocal()
+    started = POOL_STATS.begin()
+    try:
+        await session.connection()
+    except BaseException as e:
+        timed_out = isinstance(e, PoolTimeoutError)
+        POOL_STATS.fail(timed_out)
+        await session.close()
+        if timed_out:
+            logger.error("❌ Нет свободного соединения с БД за %s с: %s", DB_POOL_TIMEOUT, engine.pool.status())
+        raise
+    POOL_STATS.end(started)
+    try:
+        yield session
+    finally:
+        await session.close()
+
+
 async def get_session():
-    retries = 3
-    for attempt in range(retries):
-        try:
-            async with AsyncSessionLocal() as session:
-                yield session
-            break
-        except (OperationalError, InterfaceError) as e:
-            print(f"⚠️ Потеря соединения с БД (попытка {attempt+1}/{retries}): {e}")
-            await asyncio.sleep(2)
-    else:
-        raise RuntimeError("❌ Не удалось установить соединение с БД после нескольких попыток")
+    """FastAPI-зависимость: ровно одна сессия на запрос, без повторов и sleep на пути запроса."""
+    async with session_scope() as session:
+        yield session
+
+
+def pool_status() -> dict:
+    return POOL_STATS.snapshot(engine.pool)
 
 async def test_connection():
     """Проверяет соединение при старте"""
     async with engine.connect() as conn:
         await conn.execute(text("SELECT 1"))
-        print("✅ Подключение к БД успешно")
+        logger.info("✅ Подключение к БД успешно")
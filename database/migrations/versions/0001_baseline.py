@@ -0,0 +1,90 @@
+"""baseline: users и products в том виде, в котором их создавал create_all
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-19 12:00:00
+
+На БД, созданной через create_all (без alembic_version), таблицы уже есть — тогда пропускаем,
+и alembic upgrade head из ExecStartPre просто помечает её этой ревизией.
+"""
+from typing import Sequence, Union
+
+from alembic import context, op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0001"
+down_revision: Union[str, Sequence[str], None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _has_table(name: str) -> bool:
+    # в режиме --sql подключения нет — генерируем полный DDL
+    if context.is_offline_mode():
+        return False
+    return sa.inspect(op.get_bind()).has_table(name)
+
+
+def upgrade() -> None:
+    if not _has_table("users"):
+        _create_users()
+    if not _has_table("products"):
+        _create_products()
+
+
+def _create_users() -> None:
+    op.create_table(
+        "users",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("tg_id", sa.String(), nullable=True),
+        sa.Column("name", sa.String(), nullable=True),
+        sa.Column("phone", sa.String(), nullable=True),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.text("now()"), nullable=True),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint("tg_id"),
+    )
+    op.create_index("ix_users_id", "users", ["id"])
+
+
+def _create_products() -> None:
+    op.create_table(
+        "products",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("user_id", sa.String(), nullable=True),
+        sa.Column("url", sa.String(), nullable=True),
+        sa.Column("name", sa.String(), nullable=True),
+        sa.Column("description", sa.Text(), nullable=True),
+        sa.Column("image_url", sa.String(), nullable=True),
+        sa.Column("wb_id", sa.BigInteger(), nullable=True),
+        sa.Column("brand", sa.String(), nullable=True),
+        sa.Column("seller", sa.String(), nullable=True),
+        sa.Column("rating", sa.Float(), nullable=True),
+        sa.Column("feedbacks", sa.Integer(), nullable=True),
+        sa.Column("basic_price", sa.Float(), nullable=True),
+        sa.Column("discount", sa.Integer(), nullable=True),
+        sa.Column("stocks", sa.Integer(), nullable=True),
+        sa.Column("stocks_by_size", postgresql.JSONB(), nullable=True),
+        sa.Column("images", postgresql.JSONB(), nullable=True),
+        sa.Column("category", sa.String(length=50), nullable=True),
+        sa.Column("info", postgresql.JSONB(), nullable=True),
+        sa.Column(
+            "status",
+            sa.Enum("processing", "pending", "posted", "canceled", name="productstatus"),
+            nullable=True,
+        ),
+        sa.Column("scheduled_date", sa.DateTime(), nullable=True),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.text("now()"), nullable=True),
+        sa.Column("price", sa.Float(), nullable=True),
+        sa.ForeignKeyConstraint(["user_id"], ["users.tg_id"]),
+        sa.PrimaryKeyConstraint("id"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("products")
+    op.drop_index("ix_users_id", table_name="users")
+    op.drop_table("users")
+    sa.Enum(name="productstatus").drop(op.get_bind(), checkfirst=True)
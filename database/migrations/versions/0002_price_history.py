@@ -0,0 +1,74 @@
+"""price_history (партиционирована по месяцам) и price_latest
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-19 12:05:00
+
+Таблицы могли уже появиться через create_all — тогда пропускаем.
+Партиции на следующие месяцы досоздаёт database.partitions.ensure_partitions_job.
+"""
+from datetime import datetime, timezone
+from typing import Sequence, Union
+
+from alembic import context, op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0002"
+down_revision: Union[str, Sequence[str], None] = "0001"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+MONTHS_AHEAD = 2
+
+
+def _has_table(name: str) -> bool:
+    # в режиме --sql подключения нет — генерируем полный DDL
+    if context.is_offline_mode():
+        return False
+    return sa.inspect(op.get_bind()).has_table(name)
+
+
+def upgrade() -> None:
+    if not _has_table("price_history"):
+        op.create_table(
+            "price_history",
+            sa.Column("wb_id", sa.BigInteger(), nullable=False),
+            sa.Column("ts", sa.DateTime(timezone=True), server_default=sa.text("now()"), nullable=False),
+            sa.Column("price", sa.Integer(), nullable=True),
+            sa.Column("basic_price", sa.Integer(), nullable=True),
+            sa.Column("stocks", sa.Integer(), nullable=True),
+            sa.PrimaryKeyConstraint("wb_id", "ts"),
+            postgresql_partition_by="RANGE (ts)",
+        )
+
+    start = datetime.now(timezone.utc).replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    for _ in range(MONTHS_AHEAD + 1):
+        end = start.replace(year=start.year + 1, month=1) if start.month == 12 else start.replace(month=start.month + 1)
+        op.execute(
+            f"CREATE TABLE IF NOT EXISTS price_history_y{start.year}m{start.month:02d} PARTITION OF price_history "
+            f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+        )
+        start = end
+
+    if not _has_table("price_latest"):
+        op.create_table(
+            "price_latest",
+            sa.Column("wb_id", sa.BigInteger(), autoincrement=False, nullable=False),
+            sa.Column("price", sa.Integer(), nullable=True),
+            sa.Column("prev_price", sa.Integer(), nullable=True),
+            sa.Column("basic_price", sa.Integer(), nullable=True),
+            sa.Column("prev_basic_price", sa.Integer(), nullable=True),
+            sa.Column("stocks", sa.Integer(), nullable=True),
+            sa.Column("prev_stocks", sa.Integer(), nullable=True),
+            sa.Column("updated_at", sa.DateTime(timezone=True), server_default=sa.text("now()"), nullable=True),
+            sa.Column("changed_at", sa.DateTime(timezone=True), nullable=True),
+            sa.PrimaryKeyConstraint("wb_id"),
+        )
+
+
+def downgrade() -> None:
+    op.drop_table("price_latest")
+    # партиции удаляются вместе с родительской таблицей
+    op.drop_table("price_history")
@@ -0,0 +1,62 @@
+"""индексы горячих запросов, строятся CONCURRENTLY (без блокировки записи)
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-19 12:10:00
+
+products.user_id                 — товары пользователя (/api/products/{tg_id})
+products.created_at              — статистика за период (/api/admin/stats)
+products(status, scheduled_date) — выкладка и обновление цен перед выкладкой
+products.wb_id                   — поиск товара по артикулу
+price_latest.changed_at          — /api/prices/drops
+price_latest.updated_at          — /api/prices/changes
+
+CREATE INDEX CONCURRENTLY нельзя выполнять в транзакции, поэтому — autocommit_block.
+Если прошлая попытка оборвалась, после неё остаётся невалидный индекс: удаляем и строим заново.
+"""
+from typing import Sequence, Union
+
+from alembic import context, op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0003"
+down_revision: Union[str, Sequence[str], None] = "0002"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+INDEXES = [
+    ("ix_products_user_id", "products", ["user_id"]),
+    ("ix_products_created_at", "products", ["created_at"]),
+    ("ix_products_status_scheduled_date", "products", ["status", "scheduled_date"]),
+    ("ix_products_wb_id", "products", ["wb_id"]),
+    ("ix_price_latest_changed_at", "price_latest", ["changed_at"]),
+    ("ix_price_latest_updated_at", "price_latest", ["updated_at"]),
+]
+
+
+def _is_invalid(name: str) -> bool:
+    if context.is_offline_mode():
+        return False
+    return bool(op.get_bind().execute(
+        sa.text(
+            "SELECT 1 FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+            "WHERE c.relname = :name AND NOT i.indisvalid"
+        ),
+        {"name": name},
+    ).scalar())
+
+
+def upgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, table, columns in INDEXES:
+            if _is_invalid(name):
+                op.drop_index(name, table_name=table, postgresql_concurrently=True, if_exists=True)
+            op.create_index(name, table, columns, postgresql_concurrently=True, if_not_exists=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, table, _ in reversed(INDEXES):
+            op.drop_index(name, table_name=table, postgresql_concurrently=True, if_exists=True)
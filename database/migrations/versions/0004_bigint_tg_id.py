@@ -0,0 +1,68 @@
+"""Telegram id как BIGINT: users.tg_id и products.user_id (вместо VARCHAR)
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-19 12:20:00
+
+ALTER COLUMN ... TYPE переписывает таблицы и перестраивает их индексы
+(users_tg_id_key, ix_products_user_id) под ACCESS EXCLUSIVE — на объёмах бота это секунды,
+но запускать лучше вне пиковой нагрузки.
+Нечисловые tg_id миграцию останавливают: их нужно сначала поправить вручную.
+"""
+from typing import Sequence, Union
+
+from alembic import context, op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0004"
+down_revision: Union[str, Sequence[str], None] = "0003"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+FK_NAME = "products_user_id_fkey"
+NOT_A_NUMBER = "{col} IS NOT NULL AND btrim({col}) !~ '^-?[0-9]+$'"
+
+
+def _check_numeric() -> None:
+    if context.is_offline_mode():
+        return
+    bind = op.get_bind()
+    for table, col in (("users", "tg_id"), ("products", "user_id")):
+        bad = bind.execute(sa.text(
+            f"SELECT DISTINCT {col} FROM {table} WHERE {NOT_A_NUMBER.format(col=col)} LIMIT 20"
+        )).scalars().all()
+        if bad:
+            raise RuntimeError(f"❌ {table}.{col}: нечисловые значения {bad} — исправьте перед миграцией")
+
+
+def upgrade() -> None:
+    _check_numeric()
+    op.drop_constraint(FK_NAME, "products", type_="foreignkey")
+    op.alter_column(
+        "users", "tg_id",
+        type_=sa.BigInteger(), existing_type=sa.String(),
+        postgresql_using="btrim(tg_id)::bigint",
+    )
+    op.alter_column(
+        "products", "user_id",
+        type_=sa.BigInteger(), existing_type=sa.String(),
+        postgresql_using="btrim(user_id)::bigint",
+    )
+    op.create_foreign_key(FK_NAME, "products", "users", ["user_id"], ["tg_id"])
+
+
+def downgrade() -> None:
+    op.drop_constraint(FK_NAME, "products", type_="foreignkey")
+    op.alter_column(
+        "products", "user_id",
+        type_=sa.String(), existing_type=sa.BigInteger(),
+        postgresql_using="user_id::text",
+    )
+    op.alter_column(
+        "users", "tg_id",
+        type_=sa.String(), existing_type=sa.BigInteger(),
+        postgresql_using="tg_id::text",
+    )
+    op.create_foreign_key(FK_NAME, "products", "users", ["user_id"], ["tg_id"])
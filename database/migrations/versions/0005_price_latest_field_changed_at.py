@@ -0,0 +1,41 @@
+"""price_latest: время смены базовой цены и остатков (changed_at — только для цены)
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-19 12:30:00
+
+Правила change_rules срабатывают по полю, которое изменилось в окне, а не по времени последнего парсинга.
+Колонки nullable без default — ADD COLUMN без переписывания таблицы; индексы строятся CONCURRENTLY, как в 0003.
+У существующих строк колонки пустые: смена базовой цены/остатков до миграции правила не взводит.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0005"
+down_revision: Union[str, Sequence[str], None] = "0004"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+COLUMNS = ["basic_price_changed_at", "stocks_changed_at"]
+
+
+def upgrade() -> None:
+    for column in COLUMNS:
+        op.add_column("price_latest", sa.Column(column, sa.DateTime(timezone=True), nullable=True), if_not_exists=True)
+    with op.get_context().autocommit_block():
+        for column in COLUMNS:
+            op.create_index(f"ix_price_latest_{column}", "price_latest", [column],
+                            postgresql_concurrently=True, if_not_exists=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for column in reversed(COLUMNS):
+            op.drop_index(f"ix_price_latest_{column}", table_name="price_latest",
+                          postgresql_concurrently=True, if_exists=True)
+    for column in reversed(COLUMNS):
+        op.drop_column("price_latest", column)
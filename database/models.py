@@ -1,14 +1,41 @@
 from sqlalchemy import (
     Column, Integer, String, Float, Text, DateTime, ForeignKey,
-    Enum, BigInteger
+    Enum, BigInteger, PrimaryKeyConstraint, Index, TypeDecorator
 )
 from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.sql import func
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import relationship, deferred
 import enum
+from typing import Any, Optional
 from .db import Base
 
 
+def to_tg_id(value: Any) -> Optional[int]:
+    """Telegram id из int или строки WebApp/метаданных YooKassa ('123', ' 123 ') -> int; мусор -> None."""
+    if value is None or isinstance(value, bool):
+        return None
+    if isinstance(value, int):
+        return value
+    try:
+        return int(str(value).strip())
+    except ValueError:
+        return None
+
+
+class TelegramId(TypeDecorator):
+    """BIGINT для Telegram id. Строковые id по-прежнему можно передавать в запросы — приводятся к int при биндинге."""
+    impl = BigInteger
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        tg_id = to_tg_id(value)
+        if tg_id is None:
+            raise ValueError(f"Некорректный Telegram id: {value!r}")
+        return tg_id
+
+
 class ProductStatus(str, enum.Enum):
     processing = "В обработке"
     pending = "Ожидает выкладки"
@@ -19,21 +46,38 @@ class User(Base):
     __tablename__ = "users"
 
     id = Column(Integer, primary_key=True, index=True)
-    tg_id = Column(String, unique=True)
+    tg_id = Column(TelegramId, unique=True)
     name = Column(String)
     phone = Column(String)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     products = relationship("Product", back_populates="user")
 
 
+# Ключ результата парсинга -> колонка products. Совпадающие значения в info.parsed_raw не дублируем
+PARSED_COLUMNS = {
+    "id": "wb_id", "name": "name", "description": "description", "brand": "brand", "seller": "seller",
+    "rating": "rating", "feedbacks": "feedbacks", "price": "price", "basic_price": "basic_price",
+    "discount": "discount", "stocks": "stocks", "stocks_by_size": "stocks_by_size", "images": "images", "url": "url",
+}
+
+
 class Product(Base):
     __tablename__ = "products"
+    # Индексы горячих запросов; в БД создаются миграцией (CREATE INDEX CONCURRENTLY), здесь — для autogenerate
+    __table_args__ = (
+        Index("ix_products_user_id", "user_id"),
+        Index("ix_products_created_at", "created_at"),
+        Index("ix_products_status_scheduled_date", "status", "scheduled_date"),
+        Index("ix_products_wb_id", "wb_id"),
+    )
 
     id = Column(Integer, primary_key=True)
-    user_id = Column(String, ForeignKey("users.tg_id"))
+    user_id = Column(TelegramId, ForeignKey("users.tg_id"))
     url = Column(String)
     name = Column(String)
-    description = Column(Text)
+    # 🧊 «Холодные» поля (group="cold") не грузятся обычными запросами;
+    # там, где нужны, — явно: .options(undefer_group("cold")). Случайное обращение — ошибка.
+    description = deferred(Column(Text), group="cold", raiseload=True)
     image_url = Column(String)
 
     # 🔹 Совместимые с таблицей типы
@@ -45,14 +89,65 @@ class Product(Base):
     basic_price = Column(Float, nullable=True)
     discount = Column(Integer, nullable=True)
     stocks = Column(Integer, nullable=True)
-    stocks_by_size = Column(JSONB, nullable=True)
-    images = Column(JSONB, nullable=True)
+    stocks_by_size = deferred(Column(JSONB, nullable=True), group="cold", raiseload=True)
+    images = deferred(Column(JSONB, nullable=True), group="cold", raiseload=True)
     category = Column(String(50), nullable=True)
 
-    info = Column(JSONB, nullable=True)
+    info = deferred(Column(JSONB, nullable=True), group="cold", raiseload=True)
     status = Column(Enum(ProductStatus), default=ProductStatus.processing)
     scheduled_date = Column(DateTime, nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     price = Column(Float, nullable=True)
 
     user = relationship("User", back_populates="products")
+
+    def set_parsed_raw(self, parsed: dict) -> None:
+        """Кладёт parsed в info.parsed_raw без значений, которые уже совпадают с колонками (вызывать после заполнения колонок)."""
+        self.info = {"parsed_raw": {
+            k: v for k, v in (parsed or {}).items()
+            if k not in PARSED_COLUMNS or getattr(self, PARSED_COLUMNS[k]) != v
+        }}
+
+    def parsed_raw(self) -> dict:
+        """Полный результат парсинга: колонки + отличающиеся значения из info.parsed_raw (нужен undefer_group("cold"))."""
+        raw = {k: getattr(self, col) for k, col in PARSED_COLUMNS.items()}
+        raw.update((self.info or {}).get("parsed_raw") or {})
+        return raw
+
+
+class PriceHistory(Base):
+    """Append-only история цен/остатков. Цены в копейках (int), таблица партиционирована по месяцам."""
+    __tablename__ = "price_history"
+    __table_args__ = (
+        PrimaryKeyConstraint("wb_id", "ts"),
+        {"postgresql_partition_by": "RANGE (ts)"},
+    )
+
+    wb_id = Column(BigInteger, nullable=False)
+    ts = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+    price = Column(Integer, nullable=True)
+    basic_price = Column(Integer, nullable=True)
+    stocks = Column(Integer, nullable=True)
+
+
+class PriceLatest(Base):
+    """Последние и предыдущие отличающиеся значения цены/остатков — для «цена снизилась» и правил без сканирования истории."""
+    __tablename__ = "price_latest"
+    __table_args__ = (
+        Index("ix_price_latest_changed_at", "changed_at"),
+        Index("ix_price_latest_updated_at", "updated_at"),
+        Index("ix_price_latest_basic_price_changed_at", "basic_price_changed_at"),
+        Index("ix_price_latest_stocks_changed_at", "stocks_changed_at"),
+    )
+
+    wb_id = Column(BigInteger, primary_key=True, autoincrement=False)
+    price = Column(Integer, nullable=True)
+    prev_price = Column(Integer, nullable=True)
+    basic_price = Column(Integer, nullable=True)
+    prev_basic_price = Column(Integer, nullable=True)
+    stocks = Column(Integer, nullable=True)
+    prev_stocks = Column(Integer, nullable=True)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now())
+    changed_at = Column(DateTime(timezone=True), nullable=True)  # смена цены
+    basic_price_changed_at = Column(DateTime(timezone=True), nullable=True)
+    stocks_changed_at = Column(DateTime(timezone=True), nullable=True)
@@ -0,0 +1,40 @@
+# partitions.py
+"""
+Месячные партиции price_history. Только DDL, без numpy — проверяется в startup воркера до первого запроса:
+без партиции текущего месяца (DEFAULT-партиции нет) запись истории цен падает.
+"""
+import os
+import logging
+from datetime import datetime, timezone
+from sqlalchemy import text
+from .db import engine
+
+logger = logging.getLogger(__name__)
+
+# На сколько месяцев вперёд держим готовые партиции price_history
+PRICE_HISTORY_MONTHS_AHEAD = int(os.getenv("PRICE_HISTORY_MONTHS_AHEAD", "2"))
+
+
+def _add_month(dt: datetime) -> datetime:
+    return dt.replace(year=dt.year + 1, month=1) if dt.month == 12 else dt.replace(month=dt.month + 1)
+
+
+async def ensure_partitions(conn, months_ahead: int = PRICE_HISTORY_MONTHS_AHEAD) -> None:
+    """Создаёт месячные партиции price_history: текущий месяц + months_ahead вперёд."""
+    start = datetime.now(timezone.utc).replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    for _ in range(months_ahead + 1):
+        end = _add_month(start)
+        name = f"price_history_y{start.year}m{start.month:02d}"
+        await conn.execute(text(
+            f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF price_history "
+            f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+        ))
+        start = end
+
+
+async def ensure_partitions_job():
+    try:
+        async with engine.begin() as conn:
+            await ensure_partitions(conn)
+    except Exception as e:
+        logger.warning("⚠️ Не удалось создать партиции price_history: %s", e)
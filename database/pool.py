@@ -0,0 +1,129 @@
+# pool.py
+"""
+Настройки пула соединений на воркер, проверка «протухших» соединений и статистика насыщения пула.
+"""
+import os
+import time
+import logging
+from collections import deque
+from typing import Any, Callable, Dict, Optional
+from sqlalchemy import event, exc
+
+logger = logging.getLogger(__name__)
+
+# Размер пула на ОДИН воркер gunicorn
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+# Общий бюджет соединений на хост; если задан — делится поровну между WEB_CONCURRENCY воркерами
+DB_MAX_CONNECTIONS = int(os.getenv("DB_MAX_CONNECTIONS", "0"))
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", "1"))
+# Сколько секунд ждать свободное соединение, прежде чем отдать ошибку
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+# Пингуем при выдаче только соединения, простоявшие без дела дольше этого (0 — пинговать всегда)
+DB_PING_IDLE_SECONDS = float(os.getenv("DB_PING_IDLE_SECONDS", "60"))
+# Ожидание соединения дольше этого — пишем предупреждение
+DB_SLOW_CHECKOUT_MS = float(os.getenv("DB_SLOW_CHECKOUT_MS", "200"))
+
+
+def pool_sizing() -> Dict[str, int]:
+    """pool_size/max_overflow для этого воркера."""
+    if DB_MAX_CONNECTIONS > 0:
+        per_worker = max(DB_MAX_CONNECTIONS // max(WEB_CONCURRENCY, 1), 1)
+        # жёсткий потолок: всё в постоянный пул, без overflow
+        return {"pool_size": per_worker, "max_overflow": 0}
+    return {"pool_size": DB_POOL_SIZE, "max_overflow": DB_MAX_OVERFLOW}
+
+
+def install_idle_ping(engine, idle_seconds: float = DB_PING_IDLE_SECONDS) -> None:
+    """
+    Вместо pool_pre_ping на каждой выдаче: пинг только после простоя. Мёртвое соединение
+    отбрасывается (DisconnectionError), пул молча берёт/открывает другое.
+    """
+    sync_engine = engine.sync_engine
+
+    @event.listens_for(sync_engine, "connect")
+    def _on_connect(dbapi_connection, record):
+        record.info["checkin_at"] = time.monotonic()
+
+    @event.listens_for(sync_engine, "checkin")
+    def _on_checkin(dbapi_connection, record):
+        record.info["checkin_at"] = time.monotonic()
+
+    @event.listens_for(sync_engine, "checkout")
+    def _on_checkout(dbapi_connection, record, proxy):
+        if time.monotonic() - record.info.get("checkin_at", 0) < idle_seconds:
+            return
+        try:
+            sync_engine.dialect.do_ping(dbapi_connection)
+        except Exception as e:
+            logger.warning("⚠️ Соединение с БД не отвечает после простоя, переподключаемся: %s", e)
+            raise exc.DisconnectionError() from e
+
+
+class PoolStats:
+    """Насыщение пула: сколько корутин ждут соединение и сколько длится выдача."""
+
+    def __init__(self, window: int = 1024):
+        self.waiting = 0
+        self.max_waiting = 0
+        self.checkouts = 0
+        self.timeouts = 0
+        self.errors = 0
+        self.slow = 0
+        self.max_ms = 0.0
+        self._recent = deque(maxlen=window)
+        # внешний приёмник (метрики): observer(event, value), event — "waiting" | "checkout" | "timeout" | "error"
+        self.observer: Optional[Callable[[str, float], None]] = None
+
+    def _notify(self, event: str, value: float) -> None:
+        if self.observer is not None:
+            self.observer(event, value)
+
+    def begin(self) -> float:
+        self.waiting += 1
+        self.max_waiting = max(self.max_waiting, self.waiting)
+        self._notify("waiting", self.waiting)
+        return time.perf_counter()
+
+    def end(self, started: float) -> None:
+        self.waiting -= 1
+        ms = (time.perf_counter() - started) * 1000
+        self.checkouts += 1
+        self.max_ms = max(self.max_ms, ms)
+        self._recent.append(ms)
+        self._notify("waiting", self.waiting)
+        self._notify("checkout", ms / 1000)
+        if ms >= DB_SLOW_CHECKOUT_MS:
+            self.slow += 1
+            logger.warning("⚠️ Ожидание соединения с БД %.0f мс (ждут ещё %s)", ms, self.waiting)
+
+    def fail(self, timed_out: bool) -> None:
+        self.waiting -= 1
+        if timed_out:
+            self.timeouts += 1
+        else:
+            self.errors += 1
+        self._notify("waiting", self.waiting)
+        self._notify("timeout" if timed_out else "error", 1)
+
+    def snapshot(self, pool: Any = None) -> Dict[str, Any]:
+        recent = sorted(self._recent)
+        pct = lambda q: round(recent[min(int(len(recent) * q), len(recent) - 1)], 2) if recent else None
+        data = {
+            "waiting": self.waiting,
+            "max_waiting": self.max_waiting,
+            "checkouts": self.checkouts,
+            "timeouts": self.timeouts,
+            "errors": self.errors,
+            "slow_checkouts": self.slow,
+            "checkout_ms": {"p50": pct(0.5), "p95": pct(0.95), "p99": pct(0.99), "max": round(self.max_ms, 2)},
+        }
+        if pool is not None and hasattr(pool, "checkedout"):
+            data["pool"] = {
+                "size": pool.size(),
+                "checked_out": pool.checkedout(),
+                "checked_in": pool.checkedin(),
+                "overflow": pool.overflow(),
+            }
+        return data
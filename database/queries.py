@@ -0,0 +1,95 @@
+# queries.py
+"""
+Быстрый путь для горячих чтений: заранее построенные Core-запросы с bindparam, без сборки ORM-сущностей.
+
+Один и тот же объект запроса -> попадание в кэш компиляции SQLAlchemy, одинаковый SQL ->
+в кэш подготовленных выражений asyncpg (размер — DB_STATEMENT_CACHE_SIZE в db.py).
+Результат — кортежи Row или лёгкие записи со __slots__. Запись в БД остаётся за ORM.
+"""
+from typing import Any, List, Optional, Tuple
+from sqlalchemy import select, bindparam, func, exists
+from sqlalchemy.ext.asyncio import AsyncConnection
+from .models import User, Product, ProductStatus
+
+users = User.__table__
+products = Product.__table__
+
+
+class Record:
+    """Запись со __slots__: поля = колонки select в том же порядке."""
+    __slots__ = ()
+
+    def __init__(self, *values):
+        for name, value in zip(self.__slots__, values):
+            setattr(self, name, value)
+
+    def _asdict(self) -> dict:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self._asdict()})"
+
+
+class ProductPost(Record):
+    """Всё, что нужно publish_product для поста в канал."""
+    __slots__ = ("id", "name", "url", "price", "basic_price", "stocks", "wb_id", "category", "image_url")
+
+
+class ProductListItem(Record):
+    """Строка списка товаров пользователя (/api/products/{tg_id})."""
+    __slots__ = ("id", "name", "price", "url", "status", "created_at", "scheduled_date")
+
+
+def _columns(record_cls):
+    return [products.c[name] for name in record_cls.__slots__]
+
+
+USER_EXISTS = select(exists().where(users.c.tg_id == bindparam("tg_id")))
+
+PRODUCT_POST = select(*_columns(ProductPost)).where(products.c.id == bindparam("product_id"))
+
+# LEFT JOIN: одна строка с id=None — пользователь есть, товаров нет; ни одной — пользователя нет
+USER_PRODUCTS = (
+    select(users.c.tg_id.label("user_tg_id"), *_columns(ProductListItem))
+    .select_from(users.outerjoin(products, products.c.user_id == users.c.tg_id))
+    .where(users.c.tg_id == bindparam("tg_id"))
+)
+
+_STATS_COLUMNS = (
+    func.count(products.c.id),
+    func.count(products.c.id).filter(products.c.status == ProductStatus.posted),
+    func.count(products.c.id).filter(products.c.status == ProductStatus.pending),
+)
+STATS_ALL = select(*_STATS_COLUMNS)
+STATS_RANGE = select(*_STATS_COLUMNS).where(
+    products.c.created_at >= bindparam("start"), products.c.created_at < bindparam("end"),
+)
+STATS_FROM = select(*_STATS_COLUMNS).where(products.c.created_at >= bindparam("start"))
+
+
+async def user_exists(conn: AsyncConnection, tg_id: int) -> bool:
+    return bool((await conn.execute(USER_EXISTS, {"tg_id": tg_id})).scalar())
+
+
+async def get_product_post(conn: AsyncConnection, product_id: int) -> Optional[ProductPost]:
+    row = (await conn.execute(PRODUCT_POST, {"product_id": product_id})).first()
+    return ProductPost(*row) if row is not None else None
+
+
+async def get_user_products(conn: AsyncConnection, tg_id: int) -> Optional[List[ProductListItem]]:
+    """None — пользователя нет; иначе список (возможно пустой)."""
+    rows = (await conn.execute(USER_PRODUCTS, {"tg_id": tg_id})).all()
+    if not rows:
+        return None
+    return [ProductListItem(*row[1:]) for row in rows if row.id is not None]
+
+
+async def count_products(conn: AsyncConnection, start: Any = None, end: Any = None) -> Tuple[int, int, int]:
+    """(всего, выложено, ожидает) по products.created_at в [start, end) — одним агрегатом."""
+    if start is not None and end is not None:
+        row = (await conn.execute(STATS_RANGE, {"start": start, "end": end})).one()
+    elif start is not None:
+        row = (await conn.execute(STATS_FROM, {"start": start})).one()
+    else:
+        row = (await conn.execute(STATS_ALL)).one()
+    return tuple(row)
@@ -0,0 +1,18 @@
+# gunicorn.conf.py — gunicorn подхватывает его сам из рабочего каталога
+import os
+import shutil
+
+
+def on_starting(server):
+    """Метрики прошлых запусков удаляем, иначе /metrics суммирует их с текущими."""
+    path = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+    if path:
+        shutil.rmtree(path, ignore_errors=True)
+        os.makedirs(path, exist_ok=True)
+
+
+def child_exit(server, worker):
+    """Gauge'и (livesum) умершего воркера больше не учитываются."""
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,158 @@
+# invoice_registry.py
+import os
+import time
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional
+from bounded_cache import sampled_sizeof
+
+logger = logging.getLogger(__name__)
+
+# Сколько живёт запись об инвойсе (сек) и сколько записей держим максимум
+INVOICE_TTL_SECONDS = int(os.getenv("INVOICE_TTL_SECONDS", str(60 * 15)))
+INVOICE_REGISTRY_MAX = int(os.getenv("INVOICE_REGISTRY_MAX", "10000"))
+# Сколько delete_message выполняем одновременно
+INVOICE_DELETE_CONCURRENCY = int(os.getenv("INVOICE_DELETE_CONCURRENCY", "8"))
+# Как часто бот удаляет из чатов сообщения истёкших записей (сек)
+INVOICE_SWEEP_SECONDS = float(os.getenv("INVOICE_SWEEP_SECONDS", "60"))
+
+
+class InvoiceRegistry:
+    """
+    Хранилище отправленных инвойсов/кнопок оплаты: ключ -> info (dict с chat_id и message_id).
+    Индексируется по chat_id, записи истекают по TTL, общий размер ограничен.
+    С keep_expired=True info истёкших и вытесненных записей копятся до pop_expired/delete_expired,
+    чтобы их сообщения удалить из чатов, а не оставить висеть без учёта.
+    """
+
+    def __init__(self, ttl: float = INVOICE_TTL_SECONDS, max_size: int = INVOICE_REGISTRY_MAX,
+                 keep_expired: bool = False):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.keep_expired = keep_expired
+        # key -> (ts, info); порядок вставки = порядок истечения
+        self._items: "OrderedDict[str, tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._by_chat: Dict[int, set] = {}
+        self._expired: List[Dict[str, Any]] = []
+
+    def __len__(self) -> int:
+        self._expire()
+        return len(self._items)
+
+    def __contains__(self, key: str) -> bool:
+        return self.get(key) is not None
+
+    def keys(self) -> List[str]:
+        self._expire()
+        return list(self._items.keys())
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        entry = self._items.get(key)
+        if entry is None:
+            return None
+        ts, info = entry
+        if time.monotonic() - ts > self.ttl:
+            self._evict(key)
+            return None
+        return info
+
+    def add(self, key: str, info: Dict[str, Any]) -> None:
+        if key in self._items:
+            self._remove(key)
+        self._items[key] = (time.monotonic(), info)
+        self._by_chat.setdefault(info["chat_id"], set()).add(key)
+        self._expire()
+        # 🧹 Ограничение размера — выкидываем самые старые
+        while len(self._items) > self.max_size:
+            self._evict(next(iter(self._items)))
+
+    def pop(self, key: str, default: Any = None) -> Any:
+        info = self.get(key)
+        if info is None:
+            return default
+        self._remove(key)
+        return info
+
+    def pop_chat(self, chat_id: int) -> Dict[str, Dict[str, Any]]:
+        """Забирает все живые записи чата: {key: info}."""
+        self._expire()
+        keys = self._by_chat.pop(chat_id, set())
+        return {k: self._items.pop(k)[1] for k in keys if k in self._items}
+
+    def pop_message(self, chat_id: int, message_id: int) -> Optional[Dict[str, Any]]:
+        """Забирает запись по сообщению (когда его удалили напрямую), чтобы не удалять повторно."""
+        for key in list(self._by_chat.get(chat_id, ())):
+            entry = self._items.get(key)
+            if entry is not None and entry[1].get("message_id") == message_id:
+                self._remove(key)
+                return entry[1]
+        return None
+
+    def pop_expired(self) -> List[Dict[str, Any]]:
+        """Забирает info записей, выбывших по TTL или размеру с прошлого вызова (только при keep_expired)."""
+        self._expire()
+        expired, self._expired = self._expired, []
+        return expired
+
+    def stats(self) -> Dict[str, Any]:
+        self._expire()
+        return {
+            "entries": len(self._items),
+            "max_entries": self.max_size,
+            "chats": len(self._by_chat),
+            "expired_pending": len(self._expired),
+            "bytes": sampled_sizeof(self._items) + sampled_sizeof(self._by_chat),
+        }
+
+    def _remove(self, key: str) -> None:
+        entry = self._items.pop(key, None)
+        if entry is None:
+            return
+        chat_id = entry[1]["chat_id"]
+        keys = self._by_chat.get(chat_id)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._by_chat[chat_id]
+
+    def _evict(self, key: str) -> None:
+        entry = self._items.get(key)
+        if entry is not None and self.keep_expired:
+            self._expired.append(entry[1])
+        self._remove(key)
+
+    def _expire(self) -> None:
+        deadline = time.monotonic() - self.ttl
+        while self._items:
+            key, (ts, _) = next(iter(self._items.items()))
+            if ts > deadline:
+                break
+            self._evict(key)
+
+
+async def delete_messages(bot, items: Iterable[Dict[str, Any]], concurrency: int = INVOICE_DELETE_CONCURRENCY) -> List[bool]:
+    """
+    Удаляет сообщения (info с chat_id/message_id) параллельно, не более concurrency одновременно.
+    Возвращает список успехов в порядке items.
+    """
+    sem = asyncio.Semaphore(concurrency)
+
+    async def _delete(info: Dict[str, Any]) -> bool:
+        async with sem:
+            try:
+                await bot.delete_message(chat_id=info["chat_id"], message_id=info["message_id"])
+                return True
+            except Exception as e:
+                logger.warning("⚠️ Could not delete message %s in chat %s: %s", info.get("message_id"), info.get("chat_id"), e)
+                return False
+
+    return await asyncio.gather(*[_delete(info) for info in items])
+
+
+async def delete_expired(bot, registry: InvoiceRegistry) -> int:
+    """Удаляет из чатов сообщения записей, выбывших из реестра. Возвращает число удалённых."""
+    expired = registry.pop_expired()
+    if not expired:
+        return 0
+    return sum(await delete_messages(bot, expired))
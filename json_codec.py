@@ -0,0 +1,105 @@
+# json_codec.py
+"""
+Единый JSON-кодек: ответы API, разбор ответов WB/YooKassa/backend, JSONB-колонки, общий кэш парсинга.
+
+JSON_CODEC=auto (по умолчанию) — orjson, если установлен, иначе стандартный json; orjson | stdlib — явно.
+Оба варианта пишут UTF-8 без \\u-экранирования кириллицы, datetime/date — ISO 8601 (как isoformat()),
+Enum — значение, Decimal — число, numpy-массивы и записи database.queries (_asdict) — списки/объекты.
+Отличие — NaN/Infinity: orjson пишет null, stdlib отказывается (ValueError, как JSONResponse starlette),
+а не выдаёт невалидный токен NaN.
+
+- dumps(obj) -> bytes, dumps_str(obj) -> str, loads(bytes | str);
+- FastJSONResponse — ответ FastAPI. Возвращённый из обработчика напрямую, он минует
+  jsonable_encoder (обход всего ответа на Python) — так отдаются крупные ответы backend.py.
+"""
+import os
+import json
+import enum
+import uuid
+from datetime import date, datetime, time
+from decimal import Decimal
+from typing import Any, Union
+
+JSON_CODEC = os.getenv("JSON_CODEC", "auto")
+
+
+def _default(obj: Any) -> Any:
+    """То, что кодек не умеет сам (у stdlib — в том числе даты и Enum)."""
+    if isinstance(obj, (datetime, date, time)):
+        return obj.isoformat()
+    if isinstance(obj, enum.Enum):
+        return obj.value
+    if isinstance(obj, Decimal):
+        return int(obj) if obj == obj.to_integral_value() else float(obj)
+    if isinstance(obj, uuid.UUID):
+        return str(obj)
+    if isinstance(obj, (set, frozenset, tuple)):
+        return list(obj)
+    if hasattr(obj, "_asdict"):
+        return obj._asdict()
+    if hasattr(obj, "tolist"):
+        # numpy-массивы и скаляры
+        return obj.tolist()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def _load_orjson():
+    if JSON_CODEC == "stdlib":
+        return None
+    try:
+        import orjson
+    except ImportError:
+        if JSON_CODEC == "orjson":
+            raise
+        return None
+    return orjson
+
+
+_orjson = _load_orjson()
+
+if _orjson is not None:
+    NAME = "orjson"
+    # datetime, UUID, dataclass и Enum orjson пишет сам; numpy и нестроковые ключи — по флагам
+    _OPTIONS = _orjson.OPT_SERIALIZE_NUMPY | _orjson.OPT_NON_STR_KEYS
+
+    def dumps(obj: Any) -> bytes:
+        return _orjson.dumps(obj, default=_default, option=_OPTIONS)
+
+    def dumps_str(obj: Any) -> str:
+        return _orjson.dumps(obj, default=_default, option=_OPTIONS).decode()
+
+    loads = _orjson.loads
+else:
+    NAME = "stdlib"
+    _encoder = json.JSONEncoder(ensure_ascii=False, separators=(",", ":"), allow_nan=False, default=_default)
+
+    def dumps(obj: Any) -> bytes:
+        return _encoder.encode(obj).encode("utf-8")
+
+    def dumps_str(obj: Any) -> str:
+        return _encoder.encode(obj)
+
+    def loads(data: Union[bytes, bytearray, memoryview, str]) -> Any:
+        if isinstance(data, memoryview):
+            data = bytes(data)
+        return json.loads(data)
+
+
+def _fast_json_response():
+    from starlette.responses import JSONResponse
+
+    class FastJSONResponse(JSONResponse):
+        """JSONResponse на кодеке модуля: даты, Enum и numpy — без jsonable_encoder."""
+
+        def render(self, content: Any) -> bytes:
+            return dumps(content)
+
+    return FastJSONResponse
+
+
+def __getattr__(name):
+    # starlette нужен только backend; бот в режиме polling импортирует кодек без него
+    if name == "FastJSONResponse":
+        cls = globals()[name] = _fast_json_response()
+        return cls
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,210 @@
+# loop_monitor.py
+"""
+Монитор event loop для backend и бота: задержка цикла и «кто его держит».
+
+- Пульс: корутина спит LOOP_LAG_INTERVAL и меряет, насколько позже проснулась — это лаг цикла.
+- Сторож: отдельный поток; если пульс молчит дольше LOOP_BLOCK_MS, снимает стек потока
+  event loop (sys._current_frames) — это и есть блокирующий код, пойманный на месте.
+- Когда цикл отпустило, длительность блокировки приписывается стеку, который чаще всего
+  попадался в снимках. Худшие места — в snapshot(): /api/admin/loop (backend), /loop_stats (бот)
+  и периодически в лог (LOOP_REPORT_INTERVAL).
+"""
+import os
+import sys
+import time
+import asyncio
+import logging
+import threading
+import traceback
+from collections import Counter, deque
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+LOOP_MONITOR_ENABLED = os.getenv("LOOP_MONITOR_ENABLED", "1") == "1"
+# Период пульса (сек)
+LOOP_LAG_INTERVAL = float(os.getenv("LOOP_LAG_INTERVAL", "0.1"))
+# Блокировка дольше этого (мс) — снимаем стеки и считаем нарушителя
+LOOP_BLOCK_MS = float(os.getenv("LOOP_BLOCK_MS", "100"))
+# Раз в сколько секунд писать худшие места в лог (0 — не писать)
+LOOP_REPORT_INTERVAL = float(os.getenv("LOOP_REPORT_INTERVAL", "300"))
+# Сколько разных мест держим в таблице нарушителей
+LOOP_MAX_OFFENDERS = int(os.getenv("LOOP_MAX_OFFENDERS", "50"))
+LOOP_STACK_DEPTH = int(os.getenv("LOOP_STACK_DEPTH", "15"))
+
+_PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+UNKNOWN_SITE = "<короче периода сторожа — стек не снят>"
+
+
+def _is_project_frame(filename: str) -> bool:
+    return filename.startswith(_PROJECT_DIR) and "site-packages" not in filename
+
+
+def _format_frame(fs: traceback.FrameSummary) -> str:
+    filename = fs.filename
+    if filename.startswith(_PROJECT_DIR):
+        filename = os.path.relpath(filename, _PROJECT_DIR)
+    return f"{filename}:{fs.lineno} {fs.name}"
+
+
+class Offender:
+    """Место, где цикл блокировался: самый глубокий кадр нашего кода + стек последнего снимка."""
+
+    __slots__ = ("site", "blocks", "blocked_ms", "max_ms", "stack", "last_seen")
+
+    def __init__(self, site: str):
+        self.site = site
+        self.blocks = 0
+        self.blocked_ms = 0.0
+        self.max_ms = 0.0
+        self.stack: List[str] = []
+        self.last_seen = 0.0
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "site": self.site,
+            "blocks": self.blocks,
+            "blocked_ms": round(self.blocked_ms, 1),
+            "max_ms": round(self.max_ms, 1),
+            "last_seen": self.last_seen,
+            "stack": self.stack,
+        }
+
+
+class LoopMonitor:
+    def __init__(self, interval: float = LOOP_LAG_INTERVAL, block_ms: float = LOOP_BLOCK_MS,
+                 max_offenders: int = LOOP_MAX_OFFENDERS, window: int = 1024):
+        self.interval = interval
+        self.block_ms = block_ms
+        self.max_offenders = max_offenders
+        self.name = "loop"
+        self.ticks = 0
+        self.blocks = 0
+        self.max_lag_ms = 0.0
+        self.offenders: Dict[str, Offender] = {}
+        # внешний приёмник (метрики): observer(event, value), event — "lag" | "block"
+        self.observer: Optional[Callable[[str, float], None]] = None
+        self._recent = deque(maxlen=window)
+        self._beat = 0.0
+        self._loop_thread_id: Optional[int] = None
+        self._samples: List[tuple] = []  # (site, stack) из потока-сторожа, пока цикл стоит
+        self._lock = threading.Lock()
+        self._tasks: List[asyncio.Task] = []
+        self._stop = threading.Event()
+        self._reported_blocks = 0
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks)
+
+    def start(self, name: str = "loop", report_interval: float = LOOP_REPORT_INTERVAL) -> None:
+        """Вызывать из работающего event loop (startup/post_init). Повторный вызов ничего не делает."""
+        if self.running or not LOOP_MONITOR_ENABLED:
+            return
+        self.name = name
+        self._loop_thread_id = threading.get_ident()
+        self._beat = time.perf_counter()
+        self._stop.clear()
+        self._tasks.append(asyncio.create_task(self._heartbeat()))
+        if report_interval > 0:
+            self._tasks.append(asyncio.create_task(self._report_loop(report_interval)))
+        threading.Thread(target=self._watchdog, name=f"{name}-loop-watchdog", daemon=True).start()
+        logger.info("🩺 Монитор event loop (%s): пульс %s с, порог блокировки %s мс",
+                    name, self.interval, self.block_ms)
+
+    def stop(self) -> None:
+        self._stop.set()
+        for task in self._tasks:
+            task.cancel()
+        self._tasks.clear()
+
+    async def _heartbeat(self) -> None:
+        while True:
+            started = time.perf_counter()
+            self._beat = started
+            await asyncio.sleep(self.interval)
+            self._on_tick((time.perf_counter() - started - self.interval) * 1000)
+
+    def _on_tick(self, lag_ms: float) -> None:
+        lag_ms = max(lag_ms, 0.0)
+        self.ticks += 1
+        self._recent.append(lag_ms)
+        self.max_lag_ms = max(self.max_lag_ms, lag_ms)
+        with self._lock:
+            samples, self._samples = self._samples, []
+        if self.observer is not None:
+            self.observer("lag", lag_ms / 1000)
+        if lag_ms < self.block_ms:
+            return
+
+        self.blocks += 1
+        if self.observer is not None:
+            self.observer("block", lag_ms / 1000)
+        # вся блокировка — на самое частое место среди снимков сторожа
+        if samples:
+            site = Counter(s for s, _ in samples).most_common(1)[0][0]
+            stack = next(st for s, st in reversed(samples) if s == site)
+        else:
+            site, stack = UNKNOWN_SITE, []
+        offender = self.offenders.get(site)
+        if offender is None:
+            if len(self.offenders) >= self.max_offenders:
+                # вытесняем наименее «тяжёлое» место
+                weakest = min(self.offenders.values(), key=lambda o: o.blocked_ms)
+                del self.offenders[weakest.site]
+            offender = self.offenders[site] = Offender(site)
+        offender.blocks += 1
+        offender.blocked_ms += lag_ms
+        offender.max_ms = max(offender.max_ms, lag_ms)
+        offender.stack = stack
+        offender.last_seen = time.time()
+
+    def _watchdog(self) -> None:
+        period = max(self.block_ms / 2000, 0.01)
+        threshold = self.interval + self.block_ms / 1000
+        while not self._stop.wait(period):
+            if time.perf_counter() - self._beat < threshold:
+                continue
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is None:
+                continue
+            summary = traceback.extract_stack(frame, limit=LOOP_STACK_DEPTH)
+            del frame
+            stack = [_format_frame(fs) for fs in summary]
+            project = [fs for fs in summary if _is_project_frame(fs.filename)]
+            site = _format_frame(project[-1]) if project else (stack[-1] if stack else UNKNOWN_SITE)
+            with self._lock:
+                self._samples.append((site, stack))
+
+    async def _report_loop(self, interval: float) -> None:
+        while True:
+            await asyncio.sleep(interval)
+            if self.blocks == self._reported_blocks:
+                continue
+            self._reported_blocks = self.blocks
+            for o in self.top(5):
+                logger.warning(
+                    "🐢 Event loop (%s) блокировался в %s: %s раз, всего %.0f мс, максимум %.0f мс\n    %s",
+                    self.name, o.site, o.blocks, o.blocked_ms, o.max_ms, "\n    ".join(o.stack[-6:]),
+                )
+
+    def top(self, n: int = 10) -> List[Offender]:
+        return sorted(self.offenders.values(), key=lambda o: o.blocked_ms, reverse=True)[:n]
+
+    def snapshot(self, n: int = 10) -> Dict[str, Any]:
+        recent = sorted(self._recent)
+        pct = lambda q: round(recent[min(int(len(recent) * q), len(recent) - 1)], 2) if recent else None
+        return {
+            "name": self.name,
+            "running": self.running,
+            "interval_s": self.interval,
+            "block_threshold_ms": self.block_ms,
+            "ticks": self.ticks,
+            "blocks": self.blocks,
+            "lag_ms": {"p50": pct(0.5), "p99": pct(0.99), "max": round(self.max_lag_ms, 2)},
+            "offenders": [o.as_dict() for o in self.top(n)],
+        }
+
+
+# Один монитор на процесс (бот и backend могут делить один цикл при BOT_WEBHOOK_IN_BACKEND=1)
+MONITOR = LoopMonitor()
@@ -5,40 +5,77 @@ from typing import Optional
 from dotenv import load_dotenv
 from telegram import Update, ReplyKeyboardMarkup, KeyboardButton, WebAppInfo, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes, PreCheckoutQueryHandler, CallbackQueryHandler
-from new_parser import parse_wb_product_api
+from invoice_registry import InvoiceRegistry, delete_messages, delete_expired, INVOICE_SWEEP_SECONDS
+from bot_concurrency import KeyedUpdateProcessor
+from backend_client import BackendClient, create_backend_client, BackendError
+from bounded_cache import BoundedCache
+from shared_cache import get_shared_cache
+from metrics import (
+    MetricsHTTPXRequest, upstream_trace_config, start_bot_metrics_server, instrument_loop_monitor,
+    instrument_memory_monitor,
+)
+from loop_monitor import MONITOR as LOOP_MONITOR
+from memory_monitor import MONITOR as MEMORY_MONITOR
+from tracing import set_service, join_trace
 import aiohttp
 from telegram import LabeledPrice
 from datetime import datetime, timedelta, timezone
-import pytz
 import calendar
-import base64
-import json as _json
 import time
 import uuid
+import html
 import logging
+from app_logging import setup_logging, Redacted
+from json_codec import loads
 
 load_dotenv()
+logger = logging.getLogger("bot")
 
 BOT_TOKEN = os.getenv('BOT_TOKEN')
 WEB_APP_URL = "https://wb-artem.vercel.app/"
 # WEB_APP_URL = "https://wb-miniapp-demo.loca.lt"
-# BACKEND_URL = "http://127.0.0.1:8000"
-BACKEND_URL = "https://api.zepovvv.ru"
+# Транспорт до backend (https | unix | inprocess) — см. backend_client.py;
+# inprocess-клиент со своими функциями передаёт backend.py: build_application(backend=...)
+BACKEND = create_backend_client()
 SUPPORT_USERNAME = "@zabiroff_rielt"
+# polling | webhook (параметры webhook — в bot_webhook.py)
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
 # CHANNEL_ID = '@wbsellers_test'
 CHANNEL_ID = '@wbsupervygoda'
-PENDING_MESSAGES = {}
-SENT_INVOICES = {}   
+# Отправленные кнопки оплаты: по order_id и по payload (индекс по chat_id, TTL, лимит размера).
+# Одно и то же сообщение лежит в обоих реестрах — удаляем его по истечении только через SENT_INVOICES
+PENDING_MESSAGES = InvoiceRegistry()
+SENT_INVOICES = InvoiceRegistry(keep_expired=True)
+INVOICE_SWEEPER: Optional[asyncio.Task] = None
 
 # 🔐 Список Telegram ID администраторов
 ADMIN_IDS = {933791537, 8025721564, 5374012866, 455197004}  # замени на свои tg_id
 
-# Кэш для хранения результатов парсинга
-parsing_cache = {}
+# Кэш для хранения результатов парсинга (LRU + TTL + бюджет памяти)
+parsing_cache = BoundedCache(
+    "parsing_cache",
+    ttl=int(os.getenv("PARSING_CACHE_TTL", "3600")),
+    max_entries=int(os.getenv("PARSING_CACHE_MAX_ENTRIES", "2000")),
+    max_bytes=int(os.getenv("PARSING_CACHE_MAX_BYTES", str(32 * 1024 * 1024))),
+)
+# Неоплаченные заказы: tg_id -> {payload: meta} (раньше жили в context.user_data и не чистились).
+# Копия — в общем кэше хоста (PENDING_ORDERS_NS): successful_payment может прийти в процесс, который
+# заказ не создавал (перезапуск бота, другой процесс) — см. remember_order / find_order
+PENDING_ORDERS_NS = "pending_orders"
+PENDING_ORDERS = BoundedCache(
+    "pending_orders",
+    ttl=int(os.getenv("PENDING_ORDERS_TTL", str(24 * 3600))),
+    max_entries=int(os.getenv("PENDING_ORDERS_MAX_ENTRIES", "10000")),
+    max_bytes=int(os.getenv("PENDING_ORDERS_MAX_BYTES", str(16 * 1024 * 1024))),
+)
 
 # --- Конфиг для YooKassa (из env) ---
 YOOKASSA_ACCOUNT = os.getenv("YOOKASSA_SHOP_ID")
 YOOKASSA_SECRET = os.getenv("YOOKASSA_SECRET_KEY")
+# Базовые адреса API (для нагрузочных прогонов — на локальные заглушки standin.py)
+YOOKASSA_API_URL = os.getenv("YOOKASSA_API_URL", "https://api.yookassa.ru/v3").rstrip("/")
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL", "https://api.telegram.org").rstrip("/")
 YK_PENDING = {}
 BOT = None
 PROCESSED_PAYMENTS: dict[str, dict] = {}
@@ -53,15 +90,15 @@ async def fetch_yk_payment(payment_id: str) -> Optional[dict]:
         return None
     try:
         auth = aiohttp.BasicAuth(YOOKASSA_ACCOUNT, YOOKASSA_SECRET)
-        async with aiohttp.ClientSession() as session:
-            async with session.get(f"https://api.yookassa.ru/v3/payments/{payment_id}", auth=auth, timeout=10.0) as resp:
+        async with aiohttp.ClientSession(trace_configs=[upstream_trace_config()]) as session:
+            async with session.get(f"{YOOKASSA_API_URL}/payments/{payment_id}", auth=auth, timeout=10.0) as resp:
                 if resp.status == 200:
-                    return await resp.json()
+                    return await resp.json(loads=loads)
                 else:
                     text = await resp.text()
-                    print(f"⚠️ YooKassa fetch returned {resp.status}: {text}")
+                    logger.warning("⚠️ YooKassa fetch returned %s: %s", resp.status, text)
     except Exception as e:
-        print(f"❌ Ошибка fetch_yk_payment: {e}")
+        logger.error("❌ Ошибка fetch_yk_payment: %s", e)
     return None
 
 async def cancel_yk_payment(payment_id: str) -> tuple[int, str]:
@@ -70,12 +107,12 @@ async def cancel_yk_payment(payment_id: str) -> tuple[int, str]:
         return (0, "missing_credentials_or_id")
     try:
         auth = aiohttp.BasicAuth(YOOKASSA_ACCOUNT, YOOKASSA_SECRET)
-        async with aiohttp.ClientSession() as session:
-            async with session.post(f"https://api.yookassa.ru/v3/payments/{payment_id}/cancel", auth=auth, timeout=10.0) as resp:
+        async with aiohttp.ClientSession(trace_configs=[upstream_trace_config()]) as session:
+            async with session.post(f"{YOOKASSA_API_URL}/payments/{payment_id}/cancel", auth=auth, timeout=10.0) as resp:
                 text = await resp.text()
                 return (resp.status, text)
     except Exception as e:
-        print(f"❌ Ошибка cancel_yk_payment: {e}")
+        logger.error("❌ Ошибка cancel_yk_payment: %s", e)
         return (0, str(e))
 
 # ---------- Конец вспомогательных функций ----------
@@ -138,19 +175,11 @@ async def handle_contact(update: Update, context: ContextTypes.DEFAULT_TYPE):
     contact = update.message.contact
     user = update.effective_user
 
-    print(f"📞 Получен контакт: {contact.phone_number} от пользователя {user.id}")
+    logger.info("📞 Получен контакт от пользователя %s", user.id)
 
     # Отправляем данные на бэкенд для регистрации
-    payload = {
-        "tg_id": user.id,
-        "name": user.first_name,
-        "phone": contact.phone_number,
-    }
-
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.post(f"{BACKEND_URL}/api/users/register", json=payload) as resp:
-                result = await resp.json()
+        result = await BACKEND.register_user(user.id, user.first_name, contact.phone_number)
 
         if result.get("success"):
             await update.message.reply_text(
@@ -162,10 +191,10 @@ async def handle_contact(update: Update, context: ContextTypes.DEFAULT_TYPE):
             await update.message.reply_text(
                 "❌ Ошибка при регистрации. Попробуйте позже."
             )
-            print("Ошибка при регистрации:", result)
+            logger.warning("⚠️ Ошибка при регистрации: %s", result)
 
     except Exception as e:
-        print(f"❌ Ошибка при обращении к бэкенду: {e}")
+        logger.error("❌ Ошибка при обращении к бэкенду: %s", e)
         await update.message.reply_text("⚠️ Не удалось сохранить контакт в БД.")
 
 async def handle_product_parsing(update: Update, product_url: str):
@@ -174,7 +203,8 @@ async def handle_product_parsing(update: Update, product_url: str):
         # Отправляем сообщение о начале парсинга
         parsing_msg = await update.message.reply_text("🔍 Парсим информацию о товаре через API...")
         
-        # Используем API парсер
+        # Используем API парсер (модуль — при первом парсинге: в webhook-режиме его импортирует каждый воркер backend)
+        from new_parser import parse_wb_product_api
         product_data = await parse_wb_product_api(product_url)
         
         if product_data.get('success'):
@@ -184,7 +214,7 @@ async def handle_product_parsing(update: Update, product_url: str):
             
             # Сохраняем в кэш для использования в приложении
             cache_key = f"product_{update.effective_user.id}"
-            parsing_cache[cache_key] = product_data
+            parsing_cache.set(cache_key, product_data)
             
         else:
             await parsing_msg.edit_text(
@@ -194,7 +224,7 @@ async def handle_product_parsing(update: Update, product_url: str):
             )
             
     except Exception as e:
-        print(f"❌ Ошибка при парсинге: {e}")
+        logger.error("❌ Ошибка при парсинге: %s", e)
         await update.message.reply_text(
             "❌ Произошла ошибка при получении информации о товаре"
         )
@@ -246,14 +276,14 @@ def format_api_product_message(product_data: dict) -> str:
 
 async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not update.message or not update.message.text:
-        print("⚠️ Обновление без текстового сообщения — пропускаем")
+        logger.warning("⚠️ Обновление без текстового сообщения — пропускаем")
         return
 
     text = update.message.text
     user_id = update.effective_user.id
 
     if text == "📱 Открыть приложение":
-        print(f"🔗 Пользователь {user_id} пытается открыть Web App")
+        logger.info("🔗 Пользователь %s пытается открыть Web App", user_id)
 
         # Проверяем регистрацию
         registered = await is_user_registered(user_id)
@@ -291,13 +321,9 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def is_user_registered(tg_id: int) -> bool:
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(f"{BACKEND_URL}/api/users/{tg_id}") as resp:
-                if resp.status == 200:
-                    data = await resp.json()
-                    return data.get("exists", False)
+        return await BACKEND.user_exists(tg_id)
     except Exception as e:
-        print(f"⚠️ Ошибка проверки пользователя: {e}")
+        logger.warning("⚠️ Ошибка проверки пользователя: %s", e)
     return False
 
 async def get_main_keyboard(user_id: int):
@@ -317,31 +343,53 @@ def get_parsed_product(user_id: int) -> dict:
     return parsing_cache.get(f"product_{user_id}")
 
 
+def forget_invoice_message(chat_id: int, message_id: int) -> None:
+    """Сообщение-кнопку удалили напрямую — убираем его из реестров, иначе invoice_sweep_loop удалит его ещё раз."""
+    SENT_INVOICES.pop_message(chat_id, message_id)
+    PENDING_MESSAGES.pop_message(chat_id, message_id)
+
+
+async def remember_order(tg_id: int, payload: str, meta: dict) -> None:
+    """Неоплаченный заказ пользователя (один на пользователя) — в память процесса и в общий кэш хоста."""
+    orders = {payload: meta}
+    PENDING_ORDERS.set(tg_id, orders)
+    cache = get_shared_cache()
+    if cache is not None:
+        await cache.aset(PENDING_ORDERS_NS, str(tg_id), orders, PENDING_ORDERS.ttl)
+
+
+async def find_order(tg_id: int, payload: str) -> dict:
+    """meta заказа по payload: из памяти процесса, иначе из общего кэша."""
+    orders = PENDING_ORDERS.get(tg_id)
+    if orders is None:
+        cache = get_shared_cache()
+        orders = (await cache.aget(PENDING_ORDERS_NS, str(tg_id)) if cache is not None else None) or {}
+    return orders.get(payload) or {}
+
+
+async def forget_orders(tg_id: int) -> None:
+    PENDING_ORDERS.pop(tg_id)
+    cache = get_shared_cache()
+    if cache is not None:
+        await cache.adelete(PENDING_ORDERS_NS, str(tg_id))
+
+
 async def cancel_all_pending_invoices(context, chat_id):
     """Удаляет ВСЕ висящие инвойсы у пользователя"""
-    to_remove = []
-
-    for payload, info in list(SENT_INVOICES.items()):
-        if info["chat_id"] == chat_id:
-            try:
-                await context.bot.delete_message(
-                    chat_id=chat_id,
-                    message_id=info["message_id"]
-                )
-                print(f"🗑 Removed pending invoice msg={info['message_id']} payload={payload}")
-                to_remove.append(payload)
-            except Exception as e:
-                print(f"⚠️ Could not remove invoice {payload}: {e}")
+    invoices = SENT_INVOICES.pop_chat(chat_id)
+    if not invoices:
+        return
 
-    # Чистим словарь
-    for payload in to_remove:
-        SENT_INVOICES.pop(payload, None)
+    results = await delete_messages(context.bot, invoices.values())
+    for (payload, info), ok in zip(invoices.items(), results):
+        if ok:
+            logger.info("🗑 Removed pending invoice msg=%s payload=%s", info['message_id'], payload)
   
 async def maybe_cancel_yk_after_delay(payment_id: str, chat_id: int, delay_seconds: int = 25, reason_msg: str = None):
     await asyncio.sleep(delay_seconds)
     
     if payment_id in PROCESSED_PAYMENTS:
-        print(f"⚠️ Payment {payment_id } already processed, skipping cancel")
+        logger.warning("⚠️ Payment %s already processed, skipping cancel", payment_id)
         return
 
 
@@ -349,18 +397,18 @@ async def maybe_cancel_yk_after_delay(payment_id: str, chat_id: int, delay_secon
         # если уже обработан как succeeded — не трогаем
         pinfo = PROCESSED_PAYMENTS.get(payment_id)
         if pinfo and pinfo.get("status") == "succeeded":
-            print(f"✅ Delayed check: платеж {payment_id} уже успешен, не отменяем")
+            logger.info("✅ Delayed check: платеж %s уже успешен, не отменяем", payment_id)
             # очистим YK_PENDING если осталось
             YK_PENDING.pop(payment_id, None)
             return
 
         yk = await fetch_yk_payment(payment_id)
         if not yk:
-            print(f"ℹ️ cannot fetch yk payment {payment_id} after delay")
+            logger.info("ℹ️ cannot fetch yk payment %s after delay", payment_id)
             return
 
         status = yk.get("status")
-        print(f"ℹ️ Post-delay YooKassa status for {payment_id}: {status}")
+        logger.info("ℹ️ Post-delay YooKassa status for %s: %s", payment_id, status)
 
         # если платеж уже успешен — помечаем и выходим
         if status in ("succeeded", "captured"):
@@ -372,13 +420,13 @@ async def maybe_cancel_yk_after_delay(payment_id: str, chat_id: int, delay_secon
                     pending["cancel_task"].cancel()
                 except Exception:
                     pass
-            print(f"✅ Delayed check: платеж {payment_id} завершён — не отменяем")
+            logger.info("✅ Delayed check: платеж %s завершён — не отменяем", payment_id)
             return
 
         # отменяем только если он всё ещё в состоянии ожидается
         if status in ("pending", "waiting_for_capture"):
             code, text = await cancel_yk_payment(payment_id)
-            print(f"🗑 Auto-cancel attempt for {payment_id} -> {code} {text}")
+            logger.info("🗑 Auto-cancel attempt for %s -> %s %s", payment_id, code, text)
 
             # уведомим пользователя и почистим локальные структуры, только если запись была в YK_PENDING
             pending = YK_PENDING.pop(payment_id, None)
@@ -392,25 +440,26 @@ async def maybe_cancel_yk_after_delay(payment_id: str, chat_id: int, delay_secon
                     #         parse_mode="HTML"
                     #     )
                 except Exception as e:
-                    print("Ошибка отправки сообщения после автo-отмены:", e)
+                    logger.warning("⚠️ Ошибка отправки сообщения после автo-отмены: %s", e)
 
                 # удалим отправленное ранее сообщение-кнопку (если известно)
                 try:
                     if pending.get("invoice_message_id") and BOT:
+                        forget_invoice_message(pending["chat_id"], pending["invoice_message_id"])
                         await BOT.delete_message(chat_id=pending["chat_id"], message_id=pending["invoice_message_id"])
                 except Exception as e:
-                    print("⚠️ Ошибка при удалении invoice message после автo-отмены:", e)
+                    logger.warning("⚠️ Ошибка при удалении invoice message после автo-отмены: %s", e)
 
             # пометим как canceled
             PROCESSED_PAYMENTS[payment_id] = {"status": "canceled", "ts": time.time()}
 
         else:
-            print(f"ℹ️ Delayed check: статус {status} — никаких действий")
+            logger.info("ℹ️ Delayed check: статус %s — никаких действий", status)
     except asyncio.CancelledError:
         # задача могла быть отменена законно — игнорируем
         return
     except Exception as e:
-        print("Ошибка maybe_cancel_yk_after_delay:", e)
+        logger.error("❌ Ошибка maybe_cancel_yk_after_delay: %s", e)
 
 async def handle_web_app_data(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработка данных из Web App — с подробным логированием invoice"""
@@ -419,29 +468,30 @@ async def handle_web_app_data(update: Update, context: ContextTypes.DEFAULT_TYPE
 
     try:
         data = json.loads(update.message.web_app_data.data)
-        print("📦 WebApp data received:", data)
+        logger.info("📦 WebApp data received: %s", Redacted(data))
 
         # ==========================
         #  ОБРАБОТКА ОПЛАТЫ
         # ==========================
         if data.get("success") and "prices" in data:
             await cancel_all_pending_invoices(context, update.effective_chat.id)
-            context.user_data["pending_orders"] = {}
+            await forget_orders(update.effective_user.id)
 
             raw_key = data.get("payload") or "order"
             payload = generate_unique_payload(raw_key)
             data["payload"] = payload
 
-            print(f"🔐 Generated payload via function: {payload}")
+            logger.info("🔐 Generated payload via function: %s", payload)
 
             # удаляем старый message, если был
             old = PENDING_MESSAGES.get(raw_key)
             if old:
                 try:
+                    forget_invoice_message(old["chat_id"], old["message_id"])
                     await context.bot.delete_message(chat_id=old["chat_id"], message_id=old["message_id"])
-                    print(f"🗑 Deleted old invoice message {old['message_id']} for key {raw_key}")
+                    logger.info("🗑 Deleted old invoice message %s for key %s", old['message_id'], raw_key)
                 except Exception as e:
-                    print(f"⚠️ Could not delete old invoice {old}: {e}")
+                    logger.warning("⚠️ Could not delete old invoice %s: %s", old.get("message_id"), e)
                 PENDING_MESSAGES.pop(raw_key, None)
 
             # проверяем incoming yookassa id (как раньше)
@@ -449,14 +499,14 @@ async def handle_web_app_data(update: Update, context: ContextTypes.DEFAULT_TYPE
             accepted_yk = None
             yk_info = None
             if incoming_yk:
-                print("ℹ️ WebApp provided yookassa_payment_id:", incoming_yk)
+                logger.info("ℹ️ WebApp provided yookassa_payment_id: %s", incoming_yk)
                 yk_info = await fetch_yk_payment(incoming_yk)
                 if not yk_info:
-                    print("⚠️ Не удалось получить данные по YooKassa платежу — игнорируем incoming id")
+                    logger.warning("⚠️ Не удалось получить данные по YooKassa платежу — игнорируем incoming id")
                 else:
                     yk_status = yk_info.get("status")
                     created_at = yk_info.get("created_at")
-                    print(f"ℹ️ YooKassa status={yk_status}, created_at={created_at} for id={incoming_yk}")
+                    logger.info("ℹ️ YooKassa status=%s, created_at=%s for id=%s", yk_status, created_at, incoming_yk)
 
                     age_seconds = None
                     if created_at:
@@ -468,23 +518,23 @@ async def handle_web_app_data(update: Update, context: ContextTypes.DEFAULT_TYPE
                                 created_dt = created_dt.replace(tzinfo=timezone.utc)
                             age_seconds = (now_utc - created_dt).total_seconds()
                         except Exception as e:
-                            print("⚠️ Не удалось распарсить created_at:", e)
+                            logger.warning("⚠️ Не удалось распарсить created_at: %s", e)
 
                     if yk_status in ("pending", "waiting_for_capture"):
                         if age_seconds is None:
-                            print("⚠️ Не удалось получить возраст платежа — игнорируем incoming id")
+                            logger.warning("⚠️ Не удалось получить возраст платежа — игнорируем incoming id")
                         else:
-                            print(f"ℹ️ YooKassa payment age={age_seconds:.1f}s (threshold={YK_AGE_CANCEL_THRESHOLD}s)")
+                            logger.info("ℹ️ YooKassa payment age=%.1fs (threshold=%ss)", age_seconds, YK_AGE_CANCEL_THRESHOLD)
                             if age_seconds > YK_AGE_CANCEL_THRESHOLD:
                                 code, text = await cancel_yk_payment(incoming_yk)
-                                print(f"🗑 Cancel attempt for {incoming_yk} -> {code} {text}")
+                                logger.info("🗑 Cancel attempt for %s -> %s %s", incoming_yk, code, text)
                             else:
-                                print("⚠️ YooKassa payment is fresh but to avoid duplicates we will ignore incoming id and let Telegram create a new one.")
+                                logger.warning("⚠️ YooKassa payment is fresh but to avoid duplicates we will ignore incoming id and let Telegram create a new one.")
                     elif yk_status in ("succeeded", "succeeded_by_provider", "captured"):
                         accepted_yk = incoming_yk
-                        print("✅ YooKassa payment already succeeded — accepting incoming id.")
+                        logger.info("✅ YooKassa payment already succeeded — accepting incoming id.")
                     else:
-                        print("⚠️ YooKassa payment in unexpected status -> ignoring:", yk_status)
+                        logger.warning("⚠️ YooKassa payment in unexpected status -> ignoring: %s", yk_status)
 
             # receipt/provider_data формируем как раньше
             prices = [LabeledPrice(**p) for p in data["prices"]]
@@ -513,10 +563,10 @@ async def handle_web_app_data(update: Update, context: ContextTypes.DEFAULT_TYPE
                 pending_meta["yookassa_payment_id"] = accepted_yk
             else:
                 if data.get("yookassa_payment_id"):
-                    print("ℹ️ Ignoring incoming yookassa_payment_id to avoid duplicate submits.")
+                    logger.info("ℹ️ Ignoring incoming yookassa_payment_id to avoid duplicate submits.")
 
             # сохраняем meta по payload
-            context.user_data.setdefault("pending_orders", {})[payload] = { **pending_meta, "raw_key": raw_key }
+            await remember_order(update.effective_user.id, payload, {**pending_meta, "raw_key": raw_key})
 
             # --- получаем или вычисляем confirmation_url ---
             confirmation_url = data.get("confirmation_url")
@@ -534,6 +584,8 @@ async def handle_web_app_data(update: Update, context: ContextTypes.DEFAULT_TYPE
 
             # --- ORDER ID для сопоставления ---
             order_id = metadata.get("order_id") or raw_key
+            # 🧵 апдейт — часть трассы заказа, начатой в /api/payments/create
+            join_trace(metadata.get("traceparent"), order_id=order_id)
 
             # --- Отправляем кнопку с внешней ссылкой (если есть confirmation_url) ---
             if confirmation_url:
@@ -550,7 +602,7 @@ async def handle_web_app_data(update: Update, context: ContextTypes.DEFAULT_TYPE
                         "order_id": order_id,
                     }
                     # asyncio.create_task(maybe_cancel_yk_after_delay(yk_id_from_backend, int(tg_id), delay_seconds=25))
-                    print(f"🧾 Registered pending yk id from backend: {yk_id_from_backend}")
+                    logger.info("🧾 Registered pending yk id from backend: %s", yk_id_from_backend)
 
                 # регистрируем PENDING_MESSAGES по order_id
                 info = {
@@ -561,15 +613,15 @@ async def handle_web_app_data(update: Update, context: ContextTypes.DEFAULT_TYPE
                     "raw_key": raw_key,
                     "order_id": order_id,
                 }
-                PENDING_MESSAGES[order_id] = info
-                SENT_INVOICES[payload] = info
+                PENDING_MESSAGES.add(order_id, info)
+                SENT_INVOICES.add(payload, info)
 
-                print(f"✅ Sent payment button. payload={payload} chat={info['chat_id']} msg={info['message_id']}")
+                logger.info("✅ Sent payment button. payload=%s chat=%s msg=%s", payload, info['chat_id'], info['message_id'])
                 return
 
             # если нет confirmation_url — можно fallback на reply_invoice (опционально)
             # тут можно оставить прежний reply_invoice или вернуть ошибку
-            print("⚠️ confirmation_url not found — falling back to reply_invoice (or abort).")
+            logger.warning("⚠️ confirmation_url not found — falling back to reply_invoice (or abort).")
             # (опционально) отправим ошибочный ответ
             await update.message.reply_text("⚠️ Не удалось сформировать ссылку для оплаты. Попробуйте снова.")
             return
@@ -591,23 +643,22 @@ async def handle_web_app_data(update: Update, context: ContextTypes.DEFAULT_TYPE
             await update.message.reply_text("✅ Данные получены!")
 
     except Exception as e:
-        print(f"❌ Error handling WebApp data: {e}")
+        logger.error("❌ Error handling WebApp data: %s", e)
         await update.message.reply_text("❌ Ошибка обработки данных от приложения")
 
 async def handle_successful_payment(update: Update, context: ContextTypes.DEFAULT_TYPE):
     payment = update.message.successful_payment
     payload = payment.invoice_payload
-    pending_orders = context.user_data.setdefault("pending_orders", {})
-    pending_meta = pending_orders.get(payload, {}) or {}
+    pending_meta = await find_order(update.effective_user.id, payload)
 
     yk_id = pending_meta.get("yookassa_payment_id")
     
     if yk_id and yk_id in YK_PENDING:
-        print(f"💰 Payment succeeded, removing {yk_id} from YK_PENDING")
+        logger.info("💰 Payment succeeded, removing %s from YK_PENDING", yk_id)
         YK_PENDING.pop(yk_id, None)
 
     if not yk_id:
-        print("⚠️ yookassa_payment_id не найден в context.user_data, пробуем provider_payment_charge_id как fallback")
+        logger.warning("⚠️ yookassa_payment_id не найден в PENDING_ORDERS для payload %s, пробуем provider_payment_charge_id как fallback", payload)
         yk_id = payment.provider_payment_charge_id
 
     # Получаем ключи
@@ -617,31 +668,33 @@ async def handle_successful_payment(update: Update, context: ContextTypes.DEFAUL
     message = update.message or \
         (update.callback_query.message if update.callback_query else None)
     if not message:
-        print("⚠️ successful_payment пришёл, но message нет!")
+        logger.warning("⚠️ successful_payment пришёл, но message нет!")
         return
 
     payment = message.successful_payment
-    print("🎉 PAYMENT DATA:", payment.to_dict())
+    logger.info("🎉 PAYMENT DATA: %s", Redacted(payment))
         
     # Если есть yk_id и креды — делаем запрос в YooKassa, чтобы получить официальные metadata
     remote_meta = {}
     if yk_id and yookassa_account and yookassa_secret:
         try:
             auth = aiohttp.BasicAuth(yookassa_account, yookassa_secret)
-            async with aiohttp.ClientSession() as session:
-                async with session.get(f"https://api.yookassa.ru/v3/payments/{yk_id}", auth=auth) as resp:
+            async with aiohttp.ClientSession(trace_configs=[upstream_trace_config()]) as session:
+                async with session.get(f"{YOOKASSA_API_URL}/payments/{yk_id}", auth=auth) as resp:
                     if resp.status == 200:
-                        payment_data = await resp.json()
-                        print(f"📦 Ответ YooKassa: {json.dumps(payment_data, ensure_ascii=False, indent=2)}")
+                        payment_data = await resp.json(loads=loads)
+                        logger.debug("📦 Ответ YooKassa: %s", Redacted(payment_data))
                         remote_meta = payment_data.get("metadata", {}) or {}
                     else:
                         text = await resp.text()
-                        print(f"⚠️ YooKassa returned {resp.status}: {text}")
+                        logger.warning("⚠️ YooKassa returned %s: %s", resp.status, text)
         except Exception as e:
-            print(f"❌ Ошибка при запросе к YooKassa: {e}")
+            logger.error("❌ Ошибка при запросе к YooKassa: %s", e)
 
     # Если remote_meta пустой — используем pending_meta, иначе используем remote_meta (точнее)
     meta = remote_meta or pending_meta or {}
+    # 🧵 оплата и добавление товара — в трассу заказа (traceparent из metadata платежа)
+    join_trace(meta.get("traceparent"), order_id=meta.get("order_id"), payment_id=yk_id)
 
     # Гарантируем наличие category
     category = meta.get("category") or "Не указана"
@@ -655,36 +708,32 @@ async def handle_successful_payment(update: Update, context: ContextTypes.DEFAUL
 
     if not (user_id and url and name and scheduled_date):
         await update.message.reply_text("⚠️ Не удалось получить все данные заказа из платежа. Обратитесь в поддержку.")
-        print("❌ Недостаточно данных для добавления товара:", meta)
+        logger.error("❌ Недостаточно данных для добавления товара: %s", Redacted(meta))
         return
 
     # Отправляем на backend /api/products/add
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.post(
-                f"{BACKEND_URL}/api/products/add",
-                json={
-                    "user_id": user_id,
-                    "url": url,
-                    "name": name,
-                    "description": meta.get("description") or "",
-                    "image_url": meta.get("image_url") or None,
-                    "price": float(meta.get("price") or 0),
-                    "scheduled_date": scheduled_date,
-                    "category": category,
-                },
-            ) as resp:
-                result = await resp.json()
-                print(f"📦 Ответ от /api/products/add: {result}")
+        result = await BACKEND.add_product({
+            "user_id": user_id,
+            "url": url,
+            "name": name,
+            "description": meta.get("description") or "",
+            "image_url": meta.get("image_url") or None,
+            "price": float(meta.get("price") or 0),
+            "scheduled_date": scheduled_date,
+            "category": category,
+            "parse_token": meta.get("parse_token"),
+        })
+        logger.info("📦 Ответ от /api/products/add: %s", result)
 
         if result.get("success"):
             await update.message.reply_text("✅ Оплата подтверждена! Товар добавлен в очередь на выкладку.")
-            if payload in pending_orders:
-                del pending_orders[payload]
+            if pending_meta:
+                await forget_orders(update.effective_user.id)
         else:
             await update.message.reply_text(f"⚠️ Оплата прошла, но не удалось добавить товар: {result.get('error')}")
     except Exception as e:
-        print(f"❌ Ошибка при добавлении товара после оплаты: {e}")
+        logger.error("❌ Ошибка при добавлении товара после оплаты: %s", e)
         await update.message.reply_text("❌ Ошибка при добавлении товара в базу.")
 
 async def pre_checkout_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -694,7 +743,7 @@ async def pre_checkout_handler(update: Update, context: ContextTypes.DEFAULT_TYP
     payload = query.invoice_payload
     chat_id = query.from_user.id
 
-    print("💳 pre_checkout:", yk_id, payload)
+    logger.info("💳 pre_checkout: %s %s", yk_id, payload)
 
     # попытка найти message_id для данного payload (если уже отправляли invoice)
     invoice_info = SENT_INVOICES.get(payload)
@@ -707,7 +756,7 @@ async def pre_checkout_handler(update: Update, context: ContextTypes.DEFAULT_TYP
         #     "invoice_message_id": invoice_msg_id,
         #     "created_at": time.time(),
         # }
-        print(f"🧾 Registered pending yk id from precheckout: {yk_id} -> msg={invoice_msg_id}")
+        logger.info("🧾 Registered pending yk id from precheckout: %s -> msg=%s", yk_id, invoice_msg_id)
 
         # (опционально) создаём кратковременную задачу-страховку
         asyncio.create_task(
@@ -739,15 +788,15 @@ async def auto_cancel_yookassa_loop():
                 # перепроверим реальный статус у YooKassa
                 yk_info = await fetch_yk_payment(payment_id )
                 if not yk_info:
-                    print(f"ℹ️ auto_cancel: не удалось fetch yk {payment_id }, пропускаем")
+                    logger.info("ℹ️ auto_cancel: не удалось fetch yk %s, пропускаем", payment_id)
                     continue
                 status = yk_info.get("status")
-                print(f"ℹ️ auto_cancel: status for {payment_id } = {status} (age={age:.1f}s)")
+                logger.info("ℹ️ auto_cancel: status for %s = %s (age=%.1fs)", payment_id, status, age)
 
                 # отменяем только если реально в pending
                 if status in ("pending", "waiting_for_capture"):
                     code, text = await cancel_yk_payment(payment_id )
-                    print(f"🗑 YK cancel {payment_id } → {code} {text}")
+                    logger.info("🗑 YK cancel %s → %s %s", payment_id, code, text)
 
                     # уведомим пользователя
                     # try:
@@ -763,65 +812,99 @@ async def auto_cancel_yookassa_loop():
                     # попытка удалить сообщение-кнопку
                     try:
                         if info.get("invoice_message_id") and BOT:
+                            forget_invoice_message(info["chat_id"], info["invoice_message_id"])
                             await BOT.delete_message(chat_id=info["chat_id"], message_id=info["invoice_message_id"])
                     except Exception as e:
-                        print("⚠️ Ошибка при удалении invoice message после автo-отмены:", e)
+                        logger.warning("⚠️ Ошибка при удалении invoice message после автo-отмены: %s", e)
 
                     PROCESSED_PAYMENTS[payment_id ] = {"status": "canceled", "ts": time.time()}
                     expired.append(payment_id )
                 else:
                     # если уже succeeded/captured — просто убираем pending и не шлём cancel уведомление
                     if status in ("succeeded", "captured"):
-                        print(f"✅ auto_cancel: {payment_id } уже {status} — убираем из очереди")
+                        logger.info("✅ auto_cancel: %s уже %s — убираем из очереди", payment_id, status)
                         expired.append(payment_id )
 
             except Exception as e:
-                print("⚠️ Ошибка в auto_cancel loop при обработке", payment_id , e)
+                logger.warning("⚠️ Ошибка в auto_cancel loop при обработке %s %s", payment_id, e)
 
         for payment_id  in expired:
             YK_PENDING.pop(payment_id , None)
 
         await asyncio.sleep(5)
+async def invoice_sweep_loop(bot):
+    """Удаляет из чатов кнопки оплаты, записи о которых истекли по TTL или вытеснены по размеру."""
+    while True:
+        await asyncio.sleep(INVOICE_SWEEP_SECONDS)
+        try:
+            deleted = await delete_expired(bot, SENT_INVOICES)
+            if deleted:
+                logger.info("🗑 Removed %s expired invoice messages", deleted)
+        except Exception as e:
+            logger.warning("⚠️ Ошибка при удалении истёкших инвойсов: %s", e)
+
+
 async def on_startup(application):
-    global BOT
+    global BOT, INVOICE_SWEEPER
     # application — это Application из python-telegram-bot; у него есть .bot
     BOT = application.bot
     # запускаем цикл авто-отмен
     # asyncio.create_task(auto_cancel_yookassa_loop())
-    print("🚀 Auto-cancel loop started — bot attached")
+    logger.info("🚀 Auto-cancel loop started — bot attached")
+    # 🩺 лаг event loop и стеки блокирующих обработчиков (в webhook-режиме уже запущен backend'ом)
+    instrument_loop_monitor(LOOP_MONITOR)
+    LOOP_MONITOR.start("bot")
+    # 🧮 размеры реестров бота и RSS в лог/метрики (в webhook-режиме — в отчёте backend)
+    instrument_memory_monitor(MEMORY_MONITOR)
+    for name, registry in (
+        ("parsing_cache", parsing_cache), ("pending_orders", PENDING_ORDERS),
+        ("PENDING_MESSAGES", PENDING_MESSAGES), ("SENT_INVOICES", SENT_INVOICES),
+        ("YK_PENDING", YK_PENDING), ("PROCESSED_PAYMENTS", PROCESSED_PAYMENTS),
+    ):
+        MEMORY_MONITOR.register(f"bot.{name}", registry)
+    MEMORY_MONITOR.start("bot")
+    INVOICE_SWEEPER = asyncio.create_task(invoice_sweep_loop(application.bot))
+
+async def on_shutdown(application):
+    # закрываем переиспользуемую HTTP-сессию до backend
+    await BACKEND.close()
+    LOOP_MONITOR.stop()
+    MEMORY_MONITOR.stop()
+    if INVOICE_SWEEPER is not None:
+        INVOICE_SWEEPER.cancel()
 
 async def precheckout_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.pre_checkout_query
     try:
         invoice_payload = query.invoice_payload
-        print(f"➡️ PreCheckout received. invoice_payload={invoice_payload} from user={query.from_user.id}")
+        logger.info("➡️ PreCheckout received. invoice_payload=%s from user=%s", invoice_payload, query.from_user.id)
 
         # логируем соответствие сохранённых инвойсов
         sent = SENT_INVOICES.get(invoice_payload)
         if sent:
-            print(f"🔎 Matched sent invoice: {sent}")
+            logger.debug("🔎 Matched sent invoice: %s", Redacted(sent))
             # можно дополнительно проверить возраст инвойса
             age = int(time.time()) - sent["ts"]
             if age > 60 * 11:  # 15 минут
-                print("⚠️ Invoice older than 15min, rejecting precheckout to force new flow.")
+                logger.warning("⚠️ Invoice older than 15min, rejecting precheckout to force new flow.")
                 await query.answer(ok=False, error_message="Срок формы оплаты истёк — откройте форму снова.")
                 return
 
             # всё ок — подтверждаем
             await query.answer(ok=True)
-            print(f"✅ PreCheckout confirmed: {invoice_payload}")
+            logger.info("✅ PreCheckout confirmed: %s", invoice_payload)
         else:
             # Нет соответствия — логируем ВАЖНО и НЕ подтверждаем, чтобы не создавать неотслеживаемые оплаты
-            print(f"❌ PreCheckout payload NOT FOUND in SENT_INVOICES! payload={invoice_payload}")
+            logger.error("❌ PreCheckout payload NOT FOUND in SENT_INVOICES! payload=%s", invoice_payload)
             # Включаем подробное состояние pending keys
-            print("CURRENT PENDING_KEYS:", list(PENDING_MESSAGES.keys()))
-            print("CURRENT SENT_PAYLOADS:", list(SENT_INVOICES.keys())[:50])
+            logger.debug("CURRENT PENDING_KEYS: %s", PENDING_MESSAGES.keys())
+            logger.debug("CURRENT SENT_PAYLOADS: %s", SENT_INVOICES.keys()[:50])
             # можно временно ответить false, чтобы клиент увидел ошибку и не продолжал
             await query.answer(ok=False, error_message="Не найдено соответствие инвойсу. Откройте оплату снова.")
             return
 
     except Exception as e:
-        print(f"❌ Ошибка precheckout: {e}")
+        logger.error("❌ Ошибка precheckout: %s", e)
         try:
             await query.answer(ok=False, error_message="Ошибка при подготовке оплаты. Попробуйте снова.")
         except Exception:
@@ -890,13 +973,11 @@ async def month_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
 
     # Получаем статистику за месяц
-    async with aiohttp.ClientSession() as session:
-        url = f"{BACKEND_URL}/api/admin/stats?type=month&year={year}&month={month}"
-        async with session.get(url) as resp:
-            if resp.status != 200:
-                await query.edit_message_text("⚠️ Ошибка при запросе статистики.")
-                return
-            data = await resp.json()
+    try:
+        data = await BACKEND.admin_stats("month", year=year, month=month)
+    except BackendError:
+        await query.edit_message_text("⚠️ Ошибка при запросе статистики.")
+        return
 
     if not data.get("success") or "stats" not in data:
         await query.edit_message_text("⚠️ Ошибка ответа от сервера.")
@@ -952,13 +1033,11 @@ async def week_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     start_day = 1 + (week - 1) * 7
     end_day = min(start_day + 6, days_in_month)
 
-    async with aiohttp.ClientSession() as session:
-        url = f"{BACKEND_URL}/api/admin/stats?type=week&year={year}&month={month}&week={week}"
-        async with session.get(url) as resp:
-            if resp.status != 200:
-                await query.edit_message_text("⚠️ Ошибка при запросе статистики.")
-                return
-            data = await resp.json()
+    try:
+        data = await BACKEND.admin_stats("week", year=year, month=month, week=week)
+    except BackendError:
+        await query.edit_message_text("⚠️ Ошибка при запросе статистики.")
+        return
 
     if not data.get("success") or "stats" not in data:
         await query.edit_message_text("⚠️ Ошибка данных с сервера.")
@@ -983,13 +1062,11 @@ async def stats_today_callback(update: Update, context: ContextTypes.DEFAULT_TYP
     query = update.callback_query
     await query.answer()
 
-    async with aiohttp.ClientSession() as session:
-        url = f"{BACKEND_URL}/api/admin/stats?type=day"
-        async with session.get(url) as resp:
-            if resp.status != 200:
-                await query.edit_message_text("⚠️ Ошибка при запросе статистики.")
-                return
-            data = await resp.json()
+    try:
+        data = await BACKEND.admin_stats("day")
+    except BackendError:
+        await query.edit_message_text("⚠️ Ошибка при запросе статистики.")
+        return
 
     if not data.get("success") or "stats" not in data:
         await query.edit_message_text("⚠️ Ошибка ответа от сервера.")
@@ -1008,6 +1085,77 @@ async def stats_today_callback(update: Update, context: ContextTypes.DEFAULT_TYP
 
     await query.edit_message_text(msg, parse_mode="HTML", reply_markup=kb)
 
+async def cache_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Заполненность и вытеснения in-memory кэшей бота (только для админов)"""
+    if update.effective_user.id not in ADMIN_IDS:
+        await update.message.reply_text("⛔ У вас нет доступа.")
+        return
+
+    lines = ["🧠 <b>Кэши бота</b>"]
+    for cache in (parsing_cache, PENDING_ORDERS):
+        st = cache.stats()
+        ev = st["evictions"]
+        lines.append(
+            f"\n<b>{st['name']}</b>: {st['entries']}/{st['max_entries']} записей, "
+            f"{st['bytes'] // 1024}/{st['max_bytes'] // 1024} КБ\n"
+            f"hit/miss: {st['hits']}/{st['misses']}, "
+            f"вытеснено: ttl={ev['ttl']} lru={ev['lru']} memory={ev['memory']}"
+        )
+    await update.message.reply_text("\n".join(lines), parse_mode="HTML")
+
+async def loop_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Лаг event loop и худшие блокирующие места со стеками (только для админов)"""
+    if update.effective_user.id not in ADMIN_IDS:
+        await update.message.reply_text("⛔ У вас нет доступа.")
+        return
+
+    snap = LOOP_MONITOR.snapshot(5)
+    lag = snap["lag_ms"]
+    lines = [
+        f"🩺 <b>Event loop ({snap['name']})</b>",
+        f"лаг p50/p99/max: {lag['p50']}/{lag['p99']}/{lag['max']} мс",
+        f"блокировок &gt; {snap['block_threshold_ms']:.0f} мс: {snap['blocks']}",
+    ]
+    for o in snap["offenders"]:
+        stack = html.escape("\n".join(o["stack"][-4:]))
+        lines.append(
+            f"\n<b>{html.escape(o['site'])}</b>: {o['blocks']} раз, "
+            f"всего {o['blocked_ms']:.0f} мс, максимум {o['max_ms']:.0f} мс\n<pre>{stack}</pre>"
+        )
+    await update.message.reply_text("\n".join(lines), parse_mode="HTML")
+
+async def mem_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """RSS, размеры реестров и топ аллокаций (только для админов). /mem_stats on|off — tracemalloc"""
+    if update.effective_user.id not in ADMIN_IDS:
+        await update.message.reply_text("⛔ У вас нет доступа.")
+        return
+
+    if context.args and context.args[0] == "on":
+        MEMORY_MONITOR.start_tracing()
+    elif context.args and context.args[0] == "off":
+        MEMORY_MONITOR.stop_tracing()
+
+    summary = await MEMORY_MONITOR.heap_summary(top=8)
+    mem = summary["memory"]
+    mb = lambda v: f"{v / 2**20:.0f}" if v else "?"
+    lines = [
+        f"🧮 <b>Память ({summary['name']}, pid {summary['pid']})</b>",
+        f"RSS: {mb(mem['rss'])} МБ, пик: {mb(mem['peak'])} МБ",
+        "",
+    ]
+    for name, st in summary["registries"].items():
+        lines.append(f"<b>{html.escape(name)}</b>: {st['entries']} записей, {st['bytes'] // 1024} КБ")
+    if summary["tracing"]:
+        traced = summary["traced"]
+        lines.append(f"\n🔬 tracemalloc: {mb(traced['current'])} МБ (пик {mb(traced['peak'])} МБ)")
+        rows = summary["last_diff"]["top"] or traced["top"]
+        for row in rows:
+            diff = f"{row['kb_diff']:+.0f}" if "kb_diff" in row else f"{row['kb']:.0f}"
+            lines.append(f"<code>{diff} КБ {html.escape(row['where'])}</code>")
+    else:
+        lines.append("\n🔬 tracemalloc выключен (/mem_stats on)")
+    await update.message.reply_text("\n".join(lines), parse_mode="HTML")
+
 async def debug_channel(update: Update, context: ContextTypes.DEFAULT_TYPE):
     try:
         chat = await context.bot.get_chat(CHANNEL_ID)
@@ -1041,33 +1189,75 @@ async def debug_channel(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def remove_webhook_before_start(application):
     await application.bot.delete_webhook(drop_pending_updates=True)
 
+def build_application(with_updater: bool = True, backend: Optional[BackendClient] = None) -> Application:
+    """
+    Собирает Application со всеми обработчиками. Без Updater — для webhook-режима.
+    backend — клиент вместо созданного по BACKEND_TRANSPORT (InProcessBackendClient из backend.py).
+    """
+    global BACKEND
+    if backend is not None:
+        BACKEND = backend
+    if BACKEND is None:
+        raise RuntimeError("BACKEND_TRANSPORT=inprocess: клиент передаёт backend.py (BOT_WEBHOOK_IN_BACKEND=1)")
+    builder = (
+        Application.builder()
+        .token(BOT_TOKEN)
+        .base_url(f"{TELEGRAM_API_URL}/bot")
+        .post_init(on_startup)
+        .post_shutdown(on_shutdown)
+        # метрики вызовов Bot API; размеры пулов — как у ApplicationBuilder по умолчанию
+        .request(MetricsHTTPXRequest(connection_pool_size=256))
+        .get_updates_request(MetricsHTTPXRequest(connection_pool_size=1))
+        # параллельно для разных пользователей, по порядку — для одного
+        .concurrent_updates(KeyedUpdateProcessor())
+    )
+    if not with_updater:
+        builder = builder.updater(None)
+    app = builder.build()
+
+    # Обработчики
+    app.add_handler(CommandHandler("start", start))
+    app.add_handler(MessageHandler(filters.CONTACT, handle_contact))
+    app.add_handler(MessageHandler(filters.StatusUpdate.WEB_APP_DATA, handle_web_app_data))
+    app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
+    app.add_handler(PreCheckoutQueryHandler(pre_checkout_handler))
+    app.add_handler(MessageHandler(filters.SUCCESSFUL_PAYMENT, handle_successful_payment))
+    app.add_handler(CommandHandler("stats", admin_stats))
+    app.add_handler(CommandHandler("debug_channel", debug_channel))
+    app.add_handler(CommandHandler("cache_stats", cache_stats))
+    app.add_handler(CommandHandler("loop_stats", loop_stats))
+    app.add_handler(CommandHandler("mem_stats", mem_stats))
+    app.add_handler(CallbackQueryHandler(stats_months_callback, pattern="^stats_months$"))
+    app.add_handler(CallbackQueryHandler(stats_today_callback, pattern="^stats_today$"))
+    app.add_handler(CallbackQueryHandler(month_callback, pattern=r"^month:\d{4}:\d{1,2}$"))
+    app.add_handler(CallbackQueryHandler(week_callback, pattern=r"^week:\d{4}:\d{1,2}:\d+$"))
+    return app
+
 if __name__ == "__main__":
     print("🚀 Запускаю бота для Wildberries...")
     print(f"🔑 Токен: {BOT_TOKEN[:10]}...")
     print(f"🌐 Web App URL: {WEB_APP_URL}")
     print(f"📞 Поддержка: {SUPPORT_USERNAME}")
-    
+    print(f"⚙️ Режим: {BOT_MODE}")
+
+    # логи — через очередь и фоновый поток; DEBUG httpx (каждый запрос к Bot API) — только явно
+    setup_logging(LOG_LEVEL)
+    start_bot_metrics_server()
+    set_service("bot")
+
     try:
-        app = Application.builder().token(BOT_TOKEN).post_init(on_startup).build()
-        
-        # Обработчики
-        app.add_handler(CommandHandler("start", start))
-        app.add_handler(MessageHandler(filters.CONTACT, handle_contact))
-        app.add_handler(MessageHandler(filters.StatusUpdate.WEB_APP_DATA, handle_web_app_data))
-        app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
-        app.add_handler(PreCheckoutQueryHandler(pre_checkout_handler))
-        app.add_handler(MessageHandler(filters.SUCCESSFUL_PAYMENT, handle_successful_payment))
-        app.add_handler(CommandHandler("stats", admin_stats))
-        app.add_handler(CommandHandler("stats", admin_stats))
-        app.add_handler(CommandHandler("debug_channel", debug_channel))
-        app.add_handler(CallbackQueryHandler(stats_months_callback, pattern="^stats_months$"))
-        app.add_handler(CallbackQueryHandler(stats_today_callback, pattern="^stats_today$"))
-        app.add_handler(CallbackQueryHandler(month_callback, pattern=r"^month:\d{4}:\d{1,2}$"))
-        app.add_handler(CallbackQueryHandler(week_callback, pattern=r"^week:\d{4}:\d{1,2}:\d+$"))
-        app.add_handler(PreCheckoutQueryHandler(pre_checkout_handler))
-        
-        print("✅ Бот запущен!")
-        logging.basicConfig(level=logging.DEBUG)
-        app.run_polling(allowed_updates=Update.ALL_TYPES, poll_interval=0.3)
+        if BOT_MODE == "webhook":
+            import uvicorn
+            from fastapi import FastAPI
+            from bot_webhook import mount_bot_webhook, WEBHOOK_LISTEN, WEBHOOK_PORT
+
+            api = FastAPI()
+            mount_bot_webhook(api, build_application(with_updater=False))
+            print(f"✅ Бот запущен (webhook) на {WEBHOOK_LISTEN}:{WEBHOOK_PORT}")
+            uvicorn.run(api, host=WEBHOOK_LISTEN, port=WEBHOOK_PORT, log_level="warning")
+        else:
+            app = build_application()
+            print("✅ Бот запущен!")
+            app.run_polling(allowed_updates=Update.ALL_TYPES, poll_interval=0.3)
     except Exception as e:
         print(f"❌ Ошибка: {e}")
@@ -0,0 +1,212 @@
+# memory_monitor.py
+"""
+Память долгоживущих процессов (бот, воркеры backend): что растёт между перезапусками.
+
+- Реестры: module-level структуры (кэши, ожидающие платежи, инвойсы, задачи планировщика)
+  регистрируются через register(); их число записей и примерный размер пишутся в лог
+  раз в MEMORY_REPORT_INTERVAL вместе с RSS и уходят в метрики. Это дёшево, включено всегда.
+- tracemalloc (MEMORY_TRACE=1 или включение из админки): периодические снимки и разница
+  с предыдущим — какие строки кода набрали больше всего памяти. С MEMORY_TRACE_FRAMES=1
+  накладные расходы умеренные, но не нулевые — по умолчанию выключено.
+- heap_summary(): сводка по запросу админа (/api/admin/memory, /mem_stats в боте).
+"""
+import os
+import gc
+import time
+import asyncio
+import logging
+import tracemalloc
+from collections import Counter
+from typing import Any, Callable, Dict, List, Optional
+
+from bounded_cache import sampled_sizeof
+
+logger = logging.getLogger(__name__)
+
+# Период отчёта в лог и обновления метрик (сек, 0 — не запускать)
+MEMORY_REPORT_INTERVAL = float(os.getenv("MEMORY_REPORT_INTERVAL", "600"))
+# Включить tracemalloc при старте
+MEMORY_TRACE = os.getenv("MEMORY_TRACE", "0") == "1"
+# Глубина стека на аллокацию: 1 — только строка выделения, дешевле всего
+MEMORY_TRACE_FRAMES = int(os.getenv("MEMORY_TRACE_FRAMES", "1"))
+# Сколько строк топа аллокаций показывать
+MEMORY_TOP = int(os.getenv("MEMORY_TOP", "15"))
+
+# Служебные аллокации, которые только шумят в топе
+_TRACE_FILTERS = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, "<unknown>"),
+)
+
+
+def rss_bytes() -> Dict[str, Optional[int]]:
+    """Текущий и пиковый RSS процесса (Linux: /proc/self/status)."""
+    out: Dict[str, Optional[int]] = {"rss": None, "peak": None}
+    try:
+        with open("/proc/self/status", encoding="ascii") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    out["rss"] = int(line.split()[1]) * 1024
+                elif line.startswith("VmHWM:"):
+                    out["peak"] = int(line.split()[1]) * 1024
+    except OSError:
+        import resource
+        out["peak"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    return out
+
+
+def _format_stat(stat) -> Dict[str, Any]:
+    frame = stat.traceback[0]
+    row = {"where": f"{frame.filename}:{frame.lineno}", "kb": round(stat.size / 1024, 1), "count": stat.count}
+    if hasattr(stat, "size_diff"):
+        row["kb_diff"] = round(stat.size_diff / 1024, 1)
+        row["count_diff"] = stat.count_diff
+    return row
+
+
+class MemoryMonitor:
+    def __init__(self):
+        self.name = "process"
+        # имя -> объект или функция без аргументов, возвращающая объект для замера
+        self.registries: Dict[str, Any] = {}
+        # внешний приёмник (метрики): observer(kind, name, value), kind — "entries" | "bytes" | "rss"
+        self.observer: Optional[Callable[[str, str, int], None]] = None
+        self.last_diff: List[Dict[str, Any]] = []
+        self.last_diff_at: Optional[float] = None
+        self._snapshot: Optional[tracemalloc.Snapshot] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def register(self, name: str, source: Any) -> None:
+        """source — BoundedCache/InvoiceRegistry (есть stats()), dict/list или callable, возвращающий их."""
+        self.registries[name] = source
+
+    def registry_sizes(self) -> Dict[str, Dict[str, int]]:
+        sizes = {}
+        for name, source in self.registries.items():
+            try:
+                obj = source() if callable(source) else source
+                st = obj.stats() if hasattr(obj, "stats") else None
+                if st is not None and "bytes" in st:
+                    sizes[name] = {"entries": st["entries"], "bytes": st["bytes"]}
+                else:
+                    sizes[name] = {"entries": len(obj), "bytes": sampled_sizeof(obj)}
+            except Exception as e:
+                logger.warning("⚠️ Не удалось измерить реестр %s: %s", name, e)
+        if self.observer is not None:
+            for name, st in sizes.items():
+                self.observer("entries", name, st["entries"])
+                self.observer("bytes", name, st["bytes"])
+        return sizes
+
+    # --- tracemalloc ---
+
+    @property
+    def tracing(self) -> bool:
+        return tracemalloc.is_tracing()
+
+    def start_tracing(self, frames: int = MEMORY_TRACE_FRAMES) -> None:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+            self._snapshot = None
+            logger.info("🔬 tracemalloc включён (%s, кадров: %s)", self.name, frames)
+
+    def stop_tracing(self) -> None:
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+            self._snapshot = None
+            logger.info("🔬 tracemalloc выключен (%s)", self.name)
+
+    def _take_diff(self, top: int) -> List[Dict[str, Any]]:
+        """Снимок и разница с предыдущим по строкам кода. Тяжело — вызывать в отдельном потоке."""
+        snapshot = tracemalloc.take_snapshot().filter_traces(_TRACE_FILTERS)
+        previous, self._snapshot = self._snapshot, snapshot
+        if previous is None:
+            return []
+        stats = [s for s in snapshot.compare_to(previous, "lineno") if s.size_diff]
+        return [_format_stat(s) for s in stats[:top]]
+
+    async def snapshot_diff(self, top: int = MEMORY_TOP) -> List[Dict[str, Any]]:
+        if not self.tracing:
+            return []
+        diff = await asyncio.to_thread(self._take_diff, top)
+        if diff:
+            self.last_diff, self.last_diff_at = diff, time.time()
+        return diff
+
+    # --- периодический отчёт ---
+
+    def start(self, name: str = "process", interval: float = MEMORY_REPORT_INTERVAL) -> None:
+        """Вызывать из работающего event loop. Повторный вызов ничего не делает."""
+        if self._task is not None or interval <= 0:
+            return
+        self.name = name
+        if MEMORY_TRACE:
+            self.start_tracing()
+        self._task = asyncio.create_task(self._report_loop(interval))
+
+    def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _report_loop(self, interval: float) -> None:
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.report()
+            except Exception as e:
+                logger.warning("⚠️ Отчёт о памяти (%s) не удался: %s", self.name, e)
+
+    async def report(self) -> None:
+        rss = rss_bytes()
+        if self.observer is not None and rss["rss"] is not None:
+            self.observer("rss", self.name, rss["rss"])
+        sizes = self.registry_sizes()
+        logger.info(
+            "🧮 Память (%s): RSS %s МБ (пик %s МБ); %s", self.name,
+            rss["rss"] and rss["rss"] // 2**20, rss["peak"] and rss["peak"] // 2**20,
+            ", ".join(f"{n}={s['entries']}/{s['bytes'] // 1024}КБ" for n, s in sizes.items()),
+        )
+        for row in await self.snapshot_diff():
+            logger.info("🧮   %+.1f КБ (%+d блоков) %s", row["kb_diff"], row["count_diff"], row["where"])
+
+    # --- по запросу админа ---
+
+    def _heap_summary(self, top: int, objects: bool) -> Dict[str, Any]:
+        summary: Dict[str, Any] = {
+            "name": self.name,
+            "pid": os.getpid(),
+            "memory": rss_bytes(),
+            "gc": {"counts": gc.get_count(), "garbage": len(gc.garbage)},
+            "tracing": self.tracing,
+        }
+        if self.tracing:
+            current, peak = tracemalloc.get_traced_memory()
+            snapshot = tracemalloc.take_snapshot().filter_traces(_TRACE_FILTERS)
+            summary["traced"] = {
+                "current": current,
+                "peak": peak,
+                "overhead": tracemalloc.get_tracemalloc_memory(),
+                "top": [_format_stat(s) for s in snapshot.statistics("lineno")[:top]],
+            }
+            summary["last_diff"] = {"at": self.last_diff_at, "top": self.last_diff}
+        if objects:
+            # обход всех объектов кучи: десятки-сотни мс под GIL — event loop стоит всё это время
+            # (поток не помогает), поэтому только по явному запросу админа
+            types = Counter(type(o).__name__ for o in gc.get_objects())
+            summary["objects"] = dict(types.most_common(top))
+        return summary
+
+    async def heap_summary(self, top: int = MEMORY_TOP, objects: bool = False) -> Dict[str, Any]:
+        # реестры меряем в потоке event loop (их меняют обработчики), остальное — в отдельном потоке.
+        # GIL он не отпускает: снимок tracemalloc и обход кучи всё равно задерживают loop на своё время
+        registries = self.registry_sizes()
+        summary = await asyncio.to_thread(self._heap_summary, top, objects)
+        summary["registries"] = registries
+        return summary
+
+
+# Один монитор на процесс
+MONITOR = MemoryMonitor()
@@ -0,0 +1,298 @@
+# metrics.py
+"""
+Метрики в формате Prometheus для backend (GET /metrics) и бота (BOT_METRICS_PORT).
+
+Несколько воркеров gunicorn: multiprocess-режим prometheus_client. Каталог PROMETHEUS_MULTIPROC_DIR
+задаётся в backend.service, очищается при старте мастера и чистится от умерших воркеров
+в gunicorn.conf.py; /metrics собирает значения всех живых воркеров.
+
+Те же точки (исходящие запросы в WB/YooKassa/Bot API) пишут и спаны tracing.py, если трассировка включена.
+"""
+import os
+import time
+import asyncio
+import logging
+from urllib.parse import urlsplit
+import httpx
+from prometheus_client import (
+    Counter, Histogram, Gauge, CollectorRegistry, REGISTRY, CONTENT_TYPE_LATEST, generate_latest, start_http_server,
+)
+from prometheus_client import multiprocess
+from tracing import span, start_span, NOOP_SPAN
+
+logger = logging.getLogger(__name__)
+
+PROMETHEUS_MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+# Отдельный /metrics для бота в режиме polling/webhook (0 — не поднимать)
+BOT_METRICS_PORT = int(os.getenv("BOT_METRICS_PORT", "0"))
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+HTTP_REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds", "Время обработки запроса к backend", ["method", "route", "status"],
+    buckets=LATENCY_BUCKETS,
+)
+UPSTREAM_REQUESTS = Counter("upstream_requests_total", "Запросы во внешние сервисы", ["group", "outcome"])
+UPSTREAM_SECONDS = Histogram(
+    "upstream_request_duration_seconds", "Время запроса во внешний сервис", ["group"], buckets=LATENCY_BUCKETS,
+)
+IMAGE_PROBES = Histogram(
+    "wb_image_probes_per_parse", "Проверок URL картинок на один поиск CDN товара",
+    buckets=(0, 1, 10, 50, 100, 250, 500, 720, 1000),
+)
+CACHE_REQUESTS = Counter("cache_requests_total", "Обращения к кэшам", ["cache", "result"])
+SCHEDULER_JOBS = Gauge("scheduler_jobs", "Задач в очереди APScheduler", multiprocess_mode="livesum")
+SCHEDULER_LAG = Histogram(
+    "scheduler_job_lag_seconds", "Задержка запуска задачи относительно плана", ["job"],
+    buckets=(0.1, 0.5, 1, 5, 15, 60, 300, 900),
+)
+SCHEDULER_RUNS = Counter("scheduler_job_runs_total", "Запуски задач планировщика", ["job", "outcome"])
+TELEGRAM_REQUESTS = Counter("telegram_api_requests_total", "Вызовы Bot API", ["method", "outcome"])
+TELEGRAM_SECONDS = Histogram(
+    "telegram_api_request_duration_seconds", "Время вызова Bot API", ["method"], buckets=LATENCY_BUCKETS,
+)
+DB_CHECKOUT_SECONDS = Histogram(
+    "db_pool_checkout_seconds", "Ожидание соединения из пула БД",
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 5, 10),
+)
+DB_CHECKOUT_FAILURES = Counter("db_pool_checkout_failures_total", "Не удалось получить соединение", ["reason"])
+DB_POOL_WAITING = Gauge("db_pool_waiting", "Корутин в ожидании соединения", multiprocess_mode="livesum")
+EVENT_LOOP_LAG = Histogram(
+    "event_loop_lag_seconds", "Задержка пробуждения пульса event loop",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5),
+)
+EVENT_LOOP_BLOCKS = Counter("event_loop_blocks_total", "Блокировки event loop дольше порога LOOP_BLOCK_MS")
+REGISTRY_ENTRIES = Gauge("memory_registry_entries", "Записей в in-memory реестре", ["registry"], multiprocess_mode="livesum")
+REGISTRY_BYTES = Gauge(
+    "memory_registry_bytes", "Примерный размер in-memory реестра", ["registry"], multiprocess_mode="livesum",
+)
+PROCESS_RSS = Gauge("memory_process_rss_bytes", "RSS процесса на момент отчёта", ["process"], multiprocess_mode="liveall")
+
+
+def host_group(url) -> str:
+    """Хост -> группа с ограниченным числом значений (метка метрики)."""
+    host = urlsplit(str(url)).hostname or ""
+    if host.endswith("wbbasket.ru"):
+        return "wb_basket"
+    if host.startswith("card.wb.ru"):
+        return "wb_card"
+    if host.endswith("wb.ru") or host.endswith("wildberries.ru"):
+        return "wb_site"
+    if host.endswith("yookassa.ru"):
+        return "yookassa"
+    return "other"
+
+
+def observe_upstream(group: str, seconds: float, outcome: str) -> None:
+    UPSTREAM_REQUESTS.labels(group, outcome).inc()
+    UPSTREAM_SECONDS.labels(group).observe(seconds)
+
+
+def status_outcome(status: int) -> str:
+    return f"{status // 100}xx"
+
+
+def exception_outcome(e: BaseException) -> str:
+    return "timeout" if isinstance(e, asyncio.TimeoutError) else "error"
+
+
+def upstream_trace_config():
+    """Для aiohttp.ClientSession(trace_configs=[...]): счётчик и время каждого запроса по группе хоста."""
+    import aiohttp
+
+    async def on_start(session, ctx, params):
+        ctx.started = time.perf_counter()
+        ctx.span = start_span(f"{params.method} {host_group(params.url)}", kind="CLIENT", url=str(params.url)[:200])
+
+    async def on_end(session, ctx, params):
+        observe_upstream(host_group(params.url), time.perf_counter() - ctx.started, status_outcome(params.response.status))
+        ctx.span.set(status=params.response.status)
+        ctx.span.end()
+
+    async def on_exception(session, ctx, params):
+        observe_upstream(host_group(params.url), time.perf_counter() - ctx.started, exception_outcome(params.exception))
+        ctx.span.end(params.exception)
+
+    trace = aiohttp.TraceConfig()
+    trace.on_request_start.append(on_start)
+    trace.on_request_end.append(on_end)
+    trace.on_request_exception.append(on_exception)
+    return trace
+
+
+class UpstreamMetricsTransport(httpx.AsyncHTTPTransport):
+    """Транспорт для httpx.AsyncClient(transport=...): счётчик и время запросов под фиксированной группой."""
+
+    def __init__(self, group: str, **kwargs):
+        super().__init__(**kwargs)
+        self.group = group
+
+    async def handle_async_request(self, request):
+        started = time.perf_counter()
+        outcome = "error"
+        with span(f"{request.method} {self.group}", kind="CLIENT") as s:
+            try:
+                response = await super().handle_async_request(request)
+                outcome = status_outcome(response.status_code)
+                s.set(status=response.status_code)
+                return response
+            except BaseException as e:
+                outcome = "timeout" if isinstance(e, httpx.TimeoutException) else exception_outcome(e)
+                raise
+            finally:
+                observe_upstream(self.group, time.perf_counter() - started, outcome)
+
+
+def _metrics_httpx_request():
+    from telegram.request import HTTPXRequest
+
+    class MetricsHTTPXRequest(HTTPXRequest):
+        """HTTPXRequest для python-telegram-bot, считающий исходы и время каждого вызова Bot API."""
+
+        async def do_request(self, url, method, *args, **kwargs):
+            api_method = url.rsplit("/", 1)[-1]
+            started = time.perf_counter()
+            outcome = "error"
+            # getUpdates — long polling: в трассы не пишем
+            with span(f"telegram.{api_method}", kind="CLIENT") if api_method != "getUpdates" else NOOP_SPAN:
+                try:
+                    code, payload = await super().do_request(url, method, *args, **kwargs)
+                    outcome = status_outcome(code)
+                    return code, payload
+                except BaseException as e:
+                    outcome = exception_outcome(e)
+                    raise
+                finally:
+                    TELEGRAM_REQUESTS.labels(api_method, outcome).inc()
+                    # getUpdates — long polling, его «время» — это таймаут ожидания, а не задержка
+                    if api_method != "getUpdates":
+                        TELEGRAM_SECONDS.labels(api_method).observe(time.perf_counter() - started)
+
+    return MetricsHTTPXRequest
+
+
+def __getattr__(name):
+    # python-telegram-bot импортируется при первом обращении к MetricsHTTPXRequest: backend без
+    # отправки в Bot API (и остальные потребители метрик) не платят за него при старте
+    if name == "MetricsHTTPXRequest":
+        cls = globals()[name] = _metrics_httpx_request()
+        return cls
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+class MetricsMiddleware:
+    """ASGI-middleware: гистограмма времени ответа по шаблону маршрута (/api/products/{tg_id}), а не по URL."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        started = time.perf_counter()
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            HTTP_REQUEST_SECONDS.labels(
+                scope["method"], getattr(route, "path", "unmatched"), str(status),
+            ).observe(time.perf_counter() - started)
+
+
+def instrument_scheduler(scheduler) -> None:
+    """Глубина очереди, задержка старта и исходы задач APScheduler (job id «publish_42» -> метка «publish»)."""
+    from apscheduler.events import (
+        EVENT_JOB_ADDED, EVENT_JOB_REMOVED, EVENT_ALL_JOBS_REMOVED, EVENT_JOB_SUBMITTED, EVENT_JOB_EXECUTED,
+        EVENT_JOB_ERROR, EVENT_JOB_MISSED,
+    )
+    outcomes = {EVENT_JOB_EXECUTED: "ok", EVENT_JOB_ERROR: "error", EVENT_JOB_MISSED: "missed"}
+
+    def job_kind(job_id: str) -> str:
+        return "publish" if job_id.startswith("publish_") else job_id
+
+    # id задач ведём по событиям добавления/удаления: get_jobs() на каждое событие — копия всего
+    # хранилища под его блокировкой. Множество, а не счётчик: replace_existing тоже шлёт EVENT_JOB_ADDED
+    job_ids = {job.id for job in scheduler.get_jobs()}
+
+    def on_event(event):
+        if event.code == EVENT_JOB_ADDED:
+            job_ids.add(event.job_id)
+            SCHEDULER_JOBS.set(len(job_ids))
+        elif event.code == EVENT_JOB_REMOVED:
+            job_ids.discard(event.job_id)
+            SCHEDULER_JOBS.set(len(job_ids))
+        elif event.code == EVENT_ALL_JOBS_REMOVED:
+            job_ids.clear()
+            SCHEDULER_JOBS.set(0)
+        elif event.code == EVENT_JOB_SUBMITTED and event.scheduled_run_times:
+            # задержка старта: от самого раннего планового запуска до передачи в executor
+            lag = time.time() - min(event.scheduled_run_times).timestamp()
+            SCHEDULER_LAG.labels(job_kind(event.job_id)).observe(max(lag, 0))
+        elif event.code in outcomes:
+            SCHEDULER_RUNS.labels(job_kind(event.job_id), outcomes[event.code]).inc()
+
+    scheduler.add_listener(
+        on_event,
+        EVENT_JOB_ADDED | EVENT_JOB_REMOVED | EVENT_ALL_JOBS_REMOVED | EVENT_JOB_SUBMITTED | EVENT_JOB_EXECUTED
+        | EVENT_JOB_ERROR | EVENT_JOB_MISSED,
+    )
+    SCHEDULER_JOBS.set(len(job_ids))
+
+
+def instrument_db_pool(stats) -> None:
+    """Подписывает метрики на database.pool.PoolStats."""
+    def observer(event: str, value: float):
+        if event == "waiting":
+            DB_POOL_WAITING.set(value)
+        elif event == "checkout":
+            DB_CHECKOUT_SECONDS.observe(value)
+        else:
+            DB_CHECKOUT_FAILURES.labels(event).inc()
+
+    stats.observer = observer
+
+
+def instrument_loop_monitor(monitor) -> None:
+    """Подписывает метрики на loop_monitor.LoopMonitor."""
+    def observer(event: str, value: float):
+        if event == "lag":
+            EVENT_LOOP_LAG.observe(value)
+        else:
+            EVENT_LOOP_BLOCKS.inc()
+
+    monitor.observer = observer
+
+
+def instrument_memory_monitor(monitor) -> None:
+    """Подписывает метрики на memory_monitor.MemoryMonitor."""
+    gauges = {"entries": REGISTRY_ENTRIES, "bytes": REGISTRY_BYTES, "rss": PROCESS_RSS}
+
+    def observer(kind: str, name: str, value: int):
+        gauges[kind].labels(name).set(value)
+
+    monitor.observer = observer
+
+
+def render_metrics() -> tuple:
+    """(тело, content-type) для /metrics; в multiprocess-режиме — сумма по всем живым воркерам."""
+    if PROMETHEUS_MULTIPROC_DIR:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+def start_bot_metrics_server() -> None:
+    if BOT_METRICS_PORT:
+        start_http_server(BOT_METRICS_PORT, addr="127.0.0.1")
+        logger.info("📈 Метрики бота: http://127.0.0.1:%s/metrics", BOT_METRICS_PORT)
@@ -1,17 +1,58 @@
 # new_parser.py
+import os
 import aiohttp
 import re
 import asyncio
 import logging
+from urllib.parse import urlsplit
 from typing import Dict, Optional, List, Any
+from shared_cache import get_shared_cache, PARSE_CACHE_TTL, IMAGE_BASE_CACHE_TTL
+from metrics import upstream_trace_config, IMAGE_PROBES
+from json_codec import loads
+from tracing import traced, set_attrs
+from app_logging import sampled
 
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Подмена WB на локальный стенд (wb_replay.py): https://<host>/<path> -> {WB_UPSTREAM_URL}/<host>/<path>
+WB_UPSTREAM_URL = os.getenv("WB_UPSTREAM_URL")
+# Точки истории цен (price_history) при каждом реальном ответе WB; 0 — не писать (процесс без БД)
+RECORD_PRICE_HISTORY = os.getenv("RECORD_PRICE_HISTORY", "1") == "1"
+
+# Ссылки на фоновые записи истории, чтобы задачи не собрал GC до завершения
+_history_tasks: set = set()
+
+
+def record_prices(items: List[Dict[str, Any]]) -> None:
+    """
+    📈 Наблюдения цен/остатков в историю — фоном, не задерживая парсинг.
+    Только со свежих ответов WB: попадание в общий кэш (до PARSE_CACHE_TTL) — не новое наблюдение.
+    """
+    if not RECORD_PRICE_HISTORY or not items:
+        return
+    from price_history import record_observations_background
+    task = asyncio.create_task(record_observations_background(items))
+    _history_tasks.add(task)
+    task.add_done_callback(_history_tasks.discard)
+
+
 class WBParser:
+    def __init__(self, upstream_url: Optional[str] = WB_UPSTREAM_URL, trace_configs: Optional[List] = None):
+        self.session = None
+        self.upstream_url = upstream_url.rstrip("/") if upstream_url else None
+        # дополнительные aiohttp.TraceConfig (запись фикстур wb_replay.Recorder)
+        self.trace_configs = list(trace_configs or [])
+
+    def _url(self, url: str) -> str:
+        if not self.upstream_url:
+            return url
+        parts = urlsplit(url)
+        return f"{self.upstream_url}/{parts.netloc}{parts.path}" + (f"?{parts.query}" if parts.query else "")
+
     async def setup(self):
         if not hasattr(self, 'session') or self.session is None:
-            self.session = aiohttp.ClientSession()
+            # 📈 счётчики/время запросов в WB по группам хостов (card, basket, ...)
+            self.session = aiohttp.ClientSession(trace_configs=[upstream_trace_config(), *self.trace_configs])
             logger.info("✅ Сессия aiohttp создана")
 
     async def close(self):
@@ -30,6 +71,7 @@ class WBParser:
             return m2.group(1)
         return None
 
+    @traced("wb.card_json")
     async def parse_card_json(self, articul: str) -> Dict[str, Any]:
         """
         Парсинг card.json (если доступен) — собираем name, brand, description, images (полные url).
@@ -41,9 +83,9 @@ class WBParser:
         part = articul[:6]
         json_url = f"https://sam-basket-cdn-01mt.geobasket.ru/vol{vol}/part{part}/{articul}/info/ru/card.json"
         try:
-            async with self.session.get(json_url, timeout=10) as resp:
+            async with self.session.get(self._url(json_url), timeout=10) as resp:
                 if resp.status == 200:
-                    data = await resp.json()
+                    data = await resp.json(loads=loads)
                     name = data.get("imt_name") or data.get("name") or ""
                     brand = data.get("selling", {}).get("brand_name") or data.get("brand") or ""
                     description = data.get("description") or data.get("shortDescription") or ""
@@ -82,7 +124,7 @@ class WBParser:
                         "images": images,
                     }
         except Exception as e:
-            logger.debug(f"❌ Ошибка при получении card.json {json_url}: {e}", exc_info=True)
+            logger.debug("❌ Ошибка при получении card.json %s: %s", json_url, e, exc_info=True)
 
         return {}
 
@@ -90,7 +132,7 @@ class WBParser:
         if not self.session:
             await self.setup()
         try:
-            async with self.session.head(url, timeout=timeout, allow_redirects=True) as resp:
+            async with self.session.head(self._url(url), timeout=timeout, allow_redirects=True) as resp:
                 if resp.status == 200:
                     ctype = resp.headers.get("Content-Type", "")
                     if ctype and "image" in ctype:
@@ -98,13 +140,14 @@ class WBParser:
                     return True  # WB часто без content-type
         except Exception:
             try:
-                async with self.session.get(url, timeout=timeout, allow_redirects=True) as resp:
+                async with self.session.get(self._url(url), timeout=timeout, allow_redirects=True) as resp:
                     if resp.status == 200:
                         return True
             except Exception:
                 return False
         return False
     
+    @traced("wb.find_images")
     async def _find_valid_images(
         self, articul: str, candidate_idxs: List[int] = None, max_images: int = 3
     ) -> List[str]:
@@ -123,6 +166,17 @@ class WBParser:
         vol = nm_id // 100000
         part = nm_id // 1000
 
+        # 💾 Уже найденный CDN для товара (общий кэш процессов) — без перебора хостов
+        cache = get_shared_cache()
+        if cache:
+            cached_base = await cache.aget("image_base", str(nm_id))
+            if cached_base:
+                IMAGE_PROBES.observe(0)
+                domain, subdir, ext = cached_base
+                subdir_path = f"/{subdir}" if subdir else ""
+                base_url = f"{domain}/vol{vol}/part{part}/{nm_id}/images{subdir_path}/"
+                return [f"{base_url}{i}.{ext}" for i in candidate_idxs][:max_images]
+
         # Расширенный диапазон basket (на 2025 — до 31+, берём с запасом до 40)
         baskets = list(range(1, 41))
 
@@ -146,51 +200,41 @@ class WBParser:
                 return (domain, subdir, ext)
             return None
 
+        IMAGE_PROBES.observe(len(test_urls))
         results = await asyncio.gather(*[check_candidate(info) for info in test_urls])
 
         valid = next((r for r in results if r), None)
         if not valid:
-            logger.warning(f"⚠️ Изображения не найдены на basket CDN для {articul}")
+            logger.warning("⚠️ Изображения не найдены на basket CDN для %s", articul)
             return []  # fallback на card.json
 
         domain, subdir, ext = valid
+        if cache:
+            await cache.aset("image_base", str(nm_id), [domain, subdir, ext], IMAGE_BASE_CACHE_TTL)
         subdir_path = f"/{subdir}" if subdir else ""
-        logger.info(f"🖼️ Найден CDN: {domain}/vol{vol}/part{part}/{nm_id}/images{subdir_path}/*.{ext}")
+        logger.info("🖼️ Найден CDN: %s/vol%s/part%s/%s/images%s/*.%s", domain, vol, part, nm_id, subdir_path, ext,
+                    extra=sampled())
 
         base_url = f"{domain}/vol{vol}/part{part}/{nm_id}/images{subdir_path}/"
         images = [f"{base_url}{i}.{ext}" for i in candidate_idxs]
 
         return images[:max_images]
-    async def parse_api_detail(self, articul: str) -> Dict[str, Any]:
-        if not self.session:
-            await self.setup()
-
-        url = f"https://card.wb.ru/cards/v4/detail?appType=1&curr=rub&dest=-1257786&spp=0&nm={articul}"
-        logger.info(f"📩 Запрос к WB API: {url}")
-
-        try:
-            async with self.session.get(url, timeout=10) as resp:
-                if resp.status != 200:
-                    logger.error(f"❌ WB API вернул статус {resp.status} для артикула {articul}")
-                    return {}
-                data = await resp.json()
-        except Exception as e:
-            logger.error(f"❌ Ошибка запроса к WB API для артикула {articul}: {e}", exc_info=True)
-            return {}
 
+    @staticmethod
+    def _products_from_response(data: Dict[str, Any]) -> List[Dict[str, Any]]:
         # ИСПРАВЛЕНИЕ: products на верхнем уровне в v4
         products = data.get("products") or []
         if not products:
             # fallback на старый формат
             products = data.get("data", {}).get("products") or []
-            if not products:
-                logger.warning(f"⚠️ В ответе WB API нет products для артикула {articul}")
-                return {}
+        return products
 
-        p = products[0]
+    @staticmethod
+    def _extract_prices_stocks(p: Dict[str, Any]) -> Dict[str, Any]:
+        """Цены, скидка и остатки из карточки card.wb.ru (v4)."""
         sizes = p.get("sizes") or []
 
-        logger.info(f"💰 WB RAW: salePriceU={p.get('salePriceU')}, priceU={p.get('priceU')} | sizes_count={len(sizes)}")
+        logger.debug("💰 WB RAW: salePriceU=%s, priceU=%s | sizes_count=%s", p.get('salePriceU'), p.get('priceU'), len(sizes))
 
         # --- Цены ---
         sale_price = 0.0
@@ -215,7 +259,7 @@ class WBParser:
                     sale_price = float(price_info.get("product", 0)) / 100.0
                     basic_price = float(price_info.get("basic", 0)) / 100.0
                     if sale_price:
-                        logger.info(f"💰 Fallback price from sizes: {sale_price}/{basic_price}")
+                        logger.debug("💰 Fallback price from sizes: %s/%s", sale_price, basic_price)
                         break
 
         discount = int(100 - (sale_price / basic_price * 100)) if basic_price else 0
@@ -235,6 +279,72 @@ class WBParser:
             })
         total_stocks = sum(i["qty"] for i in stocks_by_size)
 
+        return {
+            "price": round(sale_price, 2),
+            "basic_price": round(basic_price, 2),
+            "discount": discount,
+            "stocks": total_stocks,
+            "stocks_by_size": stocks_by_size,
+        }
+
+    @traced("wb.details_batch")
+    async def parse_api_details_batch(self, articuls: List[str]) -> Dict[str, Dict[str, Any]]:
+        """
+        Цены/остатки сразу для нескольких артикулов одним запросом к card.wb.ru (nm=1;2;3).
+        Без картинок — для фонового обновления. Возвращает {articul: {...}}; пропавшие товары отсутствуют.
+        """
+        if not articuls:
+            return {}
+        if not self.session:
+            await self.setup()
+
+        nm = ";".join(str(a) for a in articuls)
+        url = f"https://card.wb.ru/cards/v4/detail?appType=1&curr=rub&dest=-1257786&spp=0&nm={nm}"
+        logger.info("📩 Пакетный запрос к WB API: %s артикулов", len(articuls))
+
+        try:
+            async with self.session.get(self._url(url), timeout=15) as resp:
+                if resp.status != 200:
+                    logger.error("❌ WB API вернул статус %s для пакета из %s артикулов", resp.status, len(articuls))
+                    return {}
+                data = await resp.json(loads=loads)
+        except Exception as e:
+            logger.error("❌ Ошибка пакетного запроса к WB API: %s", e, exc_info=True)
+            return {}
+
+        result: Dict[str, Dict[str, Any]] = {}
+        for p in self._products_from_response(data):
+            if p.get("id"):
+                result[str(p["id"])] = self._extract_prices_stocks(p)
+        record_prices([{**item, "wb_id": articul} for articul, item in result.items()])
+        return result
+
+    @traced("wb.api_detail")
+    async def parse_api_detail(self, articul: str) -> Dict[str, Any]:
+        if not self.session:
+            await self.setup()
+
+        url = f"https://card.wb.ru/cards/v4/detail?appType=1&curr=rub&dest=-1257786&spp=0&nm={articul}"
+        logger.info("📩 Запрос к WB API: %s", url, extra=sampled())
+
+        try:
+            async with self.session.get(self._url(url), timeout=10) as resp:
+                if resp.status != 200:
+                    logger.error("❌ WB API вернул статус %s для артикула %s", resp.status, articul)
+                    return {}
+                data = await resp.json(loads=loads)
+        except Exception as e:
+            logger.error("❌ Ошибка запроса к WB API для артикула %s: %s", articul, e, exc_info=True)
+            return {}
+
+        products = self._products_from_response(data)
+        if not products:
+            logger.warning("⚠️ В ответе WB API нет products для артикула %s", articul)
+            return {}
+
+        p = products[0]
+        prices_stocks = self._extract_prices_stocks(p)
+
         # --- Изображения ---
         pics_count = int(p.get("pics") or 0)
         if pics_count > 0:
@@ -250,21 +360,18 @@ class WBParser:
             "seller": p.get("supplierName") or p.get("supplier"),
             "rating": p.get("reviewRating") or p.get("rating") or 0,
             "feedbacks": p.get("feedbacks") or 0,
-            "price": round(sale_price, 2),
-            "basic_price": round(basic_price, 2),
-            "discount": discount,
-            "stocks": total_stocks,
-            "stocks_by_size": stocks_by_size,
+            **prices_stocks,
             "images": images,
         }
 
         logger.info(
-            f"✅ Итог для {articul}: price={result['price']} base={result['basic_price']} "
-            f"stocks={result['stocks']} images={len(images)}"
+            "✅ Итог для %s: price=%s base=%s stocks=%s images=%s",
+            articul, result['price'], result['basic_price'], result['stocks'], len(images), extra=sampled(),
         )
 
         return result
 
+    @traced("wb.parse_product")
     async def parse_product(self, url: str) -> Dict[str, Any]:
         """
         Основной метод: объединяем card.json и API (api_data имеет приоритет).
@@ -272,7 +379,26 @@ class WBParser:
         articul = self.extract_articul(url)
         if not articul:
             return {"success": False, "error": "Не удалось извлечь артикул из URL", "url": url}
+        set_attrs(articul=articul)
+
+        # 💾 Общий кэш: один запрос в WB на товар за TTL для всех процессов хоста
+        cache = get_shared_cache()
+        if cache is None:
+            return await self._parse_product(url, articul)
+
+        result = await cache.get_or_fill(
+            "product",
+            articul,
+            PARSE_CACHE_TTL,
+            lambda: self._parse_product(url, articul),
+            cacheable=lambda r: bool(r and r.get("success")),
+        )
+        if result.get("success"):
+            result = {**result, "url": url}
+        return result
 
+    @traced("wb.fetch_product")
+    async def _parse_product(self, url: str, articul: str) -> Dict[str, Any]:
         await self.setup()
 
         card_data = await self.parse_card_json(articul)
@@ -293,11 +419,14 @@ class WBParser:
         if not merged.get("images") or len(merged.get("images")) == 0:
             if card_data.get("images"):
                 merged["images"] = card_data.get("images")
-                logger.info(f"🔄 Использованы изображения из card.json ({len(merged['images'])})")
+                logger.info("🔄 Использованы изображения из card.json (%s)", len(merged['images']), extra=sampled())
 
         if merged.get("supplier") and not merged.get("seller"):
             merged["seller"] = merged.get("supplier")
 
+        # заполнение общего кэша = реальный запрос в WB
+        if api_data:
+            record_prices([merged])
         return merged
 
 
@@ -314,3 +443,7 @@ async def get_parser() -> WBParser:
 async def parse_wb_product_api(url: str) -> Dict:
     parser = await get_parser()
     return await parser.parse_product(url)
+
+async def parse_wb_details_batch(articuls: List[str]) -> Dict[str, Dict[str, Any]]:
+    parser = await get_parser()
+    return await parser.parse_api_details_batch(articuls)
@@ -0,0 +1,68 @@
+# parse_snapshots.py
+import os
+import hmac
+import time
+import uuid
+import hashlib
+import logging
+from typing import Any, Dict, Optional
+from shared_cache import get_shared_cache
+from new_parser import WBParser, parse_wb_product_api
+
+logger = logging.getLogger(__name__)
+
+# Снимок превью-парсинга живёт до оплаты; старше MAX_AGE — считаем устаревшим и парсим заново
+PARSE_SNAPSHOT_MAX_AGE = int(os.getenv("PARSE_SNAPSHOT_MAX_AGE", "3600"))
+PARSE_TOKEN_SECRET = os.getenv("PARSE_TOKEN_SECRET") or os.getenv("BOT_TOKEN") or ""
+
+
+def _sign(snapshot_id: str, ts: int, articul: str) -> str:
+    msg = f"{snapshot_id}.{ts}.{articul}".encode()
+    return hmac.new(PARSE_TOKEN_SECRET.encode(), msg, hashlib.sha256).hexdigest()[:24]
+
+
+async def save_snapshot(parsed: Dict[str, Any]) -> Optional[str]:
+    """
+    Сохраняет результат /api/products/parse и возвращает подписанный токен «id.ts.sig».
+    Токен проходит через metadata YooKassa и после оплаты позволяет не ходить в WB повторно.
+    """
+    cache = get_shared_cache()
+    articul = str(parsed.get("articul") or "")
+    if cache is None or not articul or not PARSE_TOKEN_SECRET:
+        return None
+
+    snapshot_id = uuid.uuid4().hex
+    ts = int(time.time())
+    await cache.aset("snapshot", snapshot_id, parsed, PARSE_SNAPSHOT_MAX_AGE)
+    return f"{snapshot_id}.{ts}.{_sign(snapshot_id, ts, articul)}"
+
+
+async def load_snapshot(token: Optional[str], url: str) -> Optional[Dict[str, Any]]:
+    """Снимок по токену, если подпись верна, он про этот же товар и не устарел. Иначе None."""
+    cache = get_shared_cache()
+    if not token or cache is None or not PARSE_TOKEN_SECRET:
+        return None
+
+    try:
+        snapshot_id, ts_s, sig = token.split(".")
+        ts = int(ts_s)
+    except ValueError:
+        return None
+
+    articul = WBParser.extract_articul(url or "") or ""
+    if not hmac.compare_digest(sig, _sign(snapshot_id, ts, articul)):
+        logger.warning("⚠️ Неверная подпись parse_token для %s", url)
+        return None
+    if time.time() - ts > PARSE_SNAPSHOT_MAX_AGE:
+        return None
+
+    return await cache.aget("snapshot", snapshot_id)
+
+
+async def get_parsed_for_checkout(url: str, parse_token: Optional[str]) -> Dict[str, Any]:
+    """Данные товара для вставки после оплаты: снимок превью, а если его нет — свежий парсинг."""
+    parsed = await load_snapshot(parse_token, url)
+    if parsed:
+        logger.info("♻️ Использован снимок превью-парсинга для %s", url)
+        return parsed
+    return await parse_wb_product_api(url)
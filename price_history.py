@@ -0,0 +1,165 @@
+# price_history.py
+import logging
+from datetime import datetime, timezone, timedelta
+from typing import Any, Dict, Iterable, List
+import numpy as np
+from sqlalchemy import case
+from sqlalchemy.future import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from database.db import session_scope
+from database.models import PriceHistory, PriceLatest
+
+logger = logging.getLogger(__name__)
+
+BUCKETS = {"hour": 3600, "day": 86400, "week": 7 * 86400}
+
+
+def _kopecks(value: Any):
+    if value is None:
+        return None
+    try:
+        return int(round(float(value) * 100))
+    except (TypeError, ValueError):
+        return None
+
+
+async def record_observations(session: AsyncSession, items: Iterable[Dict[str, Any]]) -> int:
+    """
+    Дописывает точки истории (wb_id/id, price, basic_price, stocks) и обновляет price_latest.
+    Коммит — за вызывающим кодом. Возвращает число записанных товаров.
+    """
+    now = datetime.now(timezone.utc)
+    latest: Dict[int, Dict[str, Any]] = {}
+    for item in items:
+        wb_id = item.get("wb_id") or item.get("id") or item.get("articul")
+        if not wb_id:
+            continue
+        latest[int(wb_id)] = {
+            "wb_id": int(wb_id),
+            "price": _kopecks(item.get("price")),
+            "basic_price": _kopecks(item.get("basic_price")),
+            "stocks": item.get("stocks"),
+        }
+    if not latest:
+        return 0
+
+    rows = list(latest.values())
+    await session.execute(
+        pg_insert(PriceHistory).values([{**r, "ts": now} for r in rows]).on_conflict_do_nothing()
+    )
+
+    stmt = pg_insert(PriceLatest).values([
+        {**r, "updated_at": now, "changed_at": now, "basic_price_changed_at": now, "stocks_changed_at": now}
+        for r in rows
+    ])
+    excluded = stmt.excluded
+    changed = PriceLatest.price.is_distinct_from(excluded.price)
+    basic_changed = PriceLatest.basic_price.is_distinct_from(excluded.basic_price)
+    stocks_changed = PriceLatest.stocks.is_distinct_from(excluded.stocks)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[PriceLatest.wb_id],
+        set_={
+            # prev_price — предыдущая ОТЛИЧАЮЩАЯСЯ цена, чтобы «цена снизилась» было видно и после повторных парсингов
+            "prev_price": case((changed, PriceLatest.price), else_=PriceLatest.prev_price),
+            "changed_at": case((changed, excluded.updated_at), else_=PriceLatest.changed_at),
+            "prev_basic_price": case((basic_changed, PriceLatest.basic_price), else_=PriceLatest.prev_basic_price),
+            "basic_price_changed_at": case(
+                (basic_changed, excluded.updated_at), else_=PriceLatest.basic_price_changed_at,
+            ),
+            "prev_stocks": case((stocks_changed, PriceLatest.stocks), else_=PriceLatest.prev_stocks),
+            "stocks_changed_at": case((stocks_changed, excluded.updated_at), else_=PriceLatest.stocks_changed_at),
+            "price": excluded.price,
+            "basic_price": excluded.basic_price,
+            "stocks": excluded.stocks,
+            "updated_at": excluded.updated_at,
+        },
+    )
+    await session.execute(stmt)
+    return len(rows)
+
+
+async def record_observations_background(items: List[Dict[str, Any]]) -> None:
+    """Запись истории отдельной сессией — не влияет на основной запрос/транзакцию."""
+    try:
+        async with session_scope() as session:
+            await record_observations(session, items)
+            await session.commit()
+    except Exception as e:
+        logger.warning("⚠️ Не удалось записать историю цен: %s", e)
+
+
+def downsample(ts: np.ndarray, values: np.ndarray, bucket_seconds: int) -> Dict[str, np.ndarray]:
+    """
+    min/max/last по корзинам фиксированной ширины. ts — секунды (int64), отсортированы по возрастанию;
+    values — float с NaN на месте пропусков.
+    """
+    if ts.size == 0:
+        empty = np.empty(0)
+        return {"ts": empty.astype(np.int64), "min": empty, "max": empty, "last": empty}
+
+    buckets = ts // bucket_seconds
+    starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+    ends = np.r_[starts[1:], ts.size] - 1
+    return {
+        "ts": buckets[starts] * bucket_seconds,
+        "min": np.fmin.reduceat(values, starts),
+        "max": np.fmax.reduceat(values, starts),
+        "last": values[ends],
+    }
+
+
+async def get_price_series(session: AsyncSession, wb_id: int, days: int, bucket: str) -> Dict[str, Any]:
+    """Прорежённый ряд цены и остатков товара за days дней."""
+    bucket_seconds = BUCKETS[bucket]
+    since = datetime.now(timezone.utc) - timedelta(days=days)
+    result = await session.execute(
+        select(PriceHistory.ts, PriceHistory.price, PriceHistory.stocks)
+        .where(PriceHistory.wb_id == wb_id, PriceHistory.ts >= since)
+        .order_by(PriceHistory.ts)
+    )
+    rows = result.all()
+
+    ts = np.fromiter((int(r.ts.timestamp()) for r in rows), dtype=np.int64, count=len(rows))
+    price = np.array([np.nan if r.price is None else r.price / 100 for r in rows], dtype=np.float64)
+    stocks = np.array([np.nan if r.stocks is None else r.stocks for r in rows], dtype=np.float64)
+
+    p = downsample(ts, price, bucket_seconds)
+    s = downsample(ts, stocks, bucket_seconds)
+
+    def _list(arr):
+        return [None if np.isnan(v) else float(v) for v in arr]
+
+    return {
+        "wb_id": wb_id,
+        "bucket": bucket,
+        "points": int(ts.size),
+        "ts": [datetime.fromtimestamp(int(t), timezone.utc).isoformat() for t in p["ts"]],
+        "price": {"min": _list(p["min"]), "max": _list(p["max"]), "last": _list(p["last"])},
+        "stocks": {"min": _list(s["min"]), "max": _list(s["max"]), "last": _list(s["last"])},
+    }
+
+
+async def get_price_drops(session: AsyncSession, min_pct: float, hours: int, limit: int = 100) -> List[Dict[str, Any]]:
+    """Товары, у которых последняя смена цены — снижение минимум на min_pct% за последние hours часов."""
+    since = datetime.now(timezone.utc) - timedelta(hours=hours)
+    result = await session.execute(
+        select(PriceLatest)
+        .where(
+            PriceLatest.changed_at >= since,
+            PriceLatest.prev_price.isnot(None),
+            (PriceLatest.prev_price - PriceLatest.price) * 100 >= PriceLatest.prev_price * min_pct,
+        )
+        .order_by(PriceLatest.changed_at.desc())
+        .limit(limit)
+    )
+    return [
+        {
+            "wb_id": r.wb_id,
+            "price": r.price / 100 if r.price is not None else None,
+            "prev_price": r.prev_price / 100,
+            "drop_pct": round((r.prev_price - r.price) * 100 / r.prev_price, 2) if r.prev_price else None,
+            "changed_at": r.changed_at.isoformat() if r.changed_at else None,
+        }
+        for r in result.scalars().all()
+    ]
@@ -0,0 +1,135 @@
+# product_refresh.py
+import os
+import asyncio
+import logging
+import numpy as np
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Tuple
+from sqlalchemy import update
+from sqlalchemy.future import select
+from database.db import session_scope
+from database.models import Product, ProductStatus
+from new_parser import parse_wb_details_batch
+from shared_cache import get_shared_cache
+from change_rules import to_arrays, evaluate
+
+logger = logging.getLogger(__name__)
+
+# Обновляем цены/остатки товаров, которые выйдут в ближайшие REFRESH_WINDOW_MINUTES минут
+REFRESH_WINDOW_MINUTES = int(os.getenv("REFRESH_WINDOW_MINUTES", "30"))
+REFRESH_INTERVAL_MINUTES = int(os.getenv("REFRESH_INTERVAL_MINUTES", "5"))
+# Сколько артикулов в одном запросе к card.wb.ru
+REFRESH_BATCH_SIZE = int(os.getenv("REFRESH_BATCH_SIZE", "50"))
+# Пороги «устаревания» по полям: число — абсолютная разница, «N%» — относительная
+REFRESH_THRESHOLDS = os.getenv("REFRESH_THRESHOLDS", "price=0.5%,basic_price=0.5%,discount=1,stocks=1")
+
+
+def parse_thresholds(spec: str) -> Dict[str, Tuple[float, bool]]:
+    """'price=0.5%,stocks=1' -> {'price': (0.5, True), 'stocks': (1.0, False)}"""
+    thresholds = {}
+    for part in spec.split(","):
+        if "=" not in part:
+            continue
+        field, value = (x.strip() for x in part.split("=", 1))
+        relative = value.endswith("%")
+        thresholds[field] = (float(value.rstrip("%")), relative)
+    return thresholds
+
+
+def changed_fields(current: Dict[str, Any], fresh: Dict[str, Any], thresholds: Dict[str, Tuple[float, bool]]) -> Dict[str, Any]:
+    """Поля из fresh, которые отличаются от current больше порога."""
+    changes = {}
+    for field, (limit, relative) in thresholds.items():
+        new, old = fresh.get(field), current.get(field)
+        if new is None or new == old:
+            continue
+        if old is None:
+            changes[field] = new
+            continue
+        delta = abs(new - old)
+        if relative:
+            delta = delta / abs(old) * 100 if old else float("inf")
+        if delta >= limit:
+            changes[field] = new
+
+    # товар закончился — пишем всегда, независимо от порога
+    if fresh.get("stocks") == 0 and current.get("stocks"):
+        changes["stocks"] = 0
+    if "stocks" in changes:
+        changes["stocks_by_size"] = fresh.get("stocks_by_size")
+    return changes
+
+
+async def refresh_due_products(window_minutes: int = REFRESH_WINDOW_MINUTES) -> int:
+    """
+    Перепарсивает (пакетно) товары в статусе pending, которые выйдут в ближайшие window_minutes,
+    и одним bulk UPDATE записывает изменившиеся поля. Возвращает число обновлённых товаров.
+    """
+    thresholds = parse_thresholds(REFRESH_THRESHOLDS)
+    # scheduled_date хранится как naive локальное время (см. normalize_datetime в backend.py)
+    now = datetime.now()
+    until = now + timedelta(minutes=window_minutes)
+
+    async with session_scope() as session:
+        result = await session.execute(
+            select(Product.id, Product.wb_id, Product.price, Product.basic_price, Product.discount, Product.stocks)
+            .where(
+                Product.status == ProductStatus.pending,
+                Product.scheduled_date >= now,
+                Product.scheduled_date < until,
+                Product.wb_id.isnot(None),
+            )
+        )
+        rows = result.all()
+        if not rows:
+            return 0
+
+        articuls = sorted({str(r.wb_id) for r in rows})
+        batches = [articuls[i:i + REFRESH_BATCH_SIZE] for i in range(0, len(articuls), REFRESH_BATCH_SIZE)]
+        fresh: Dict[str, Dict[str, Any]] = {}
+        for batch_result in await asyncio.gather(*[parse_wb_details_batch(b) for b in batches]):
+            fresh.update(batch_result)
+
+        # 🚨 Правила изменений (скидка перешла порог, товар закончился, ...) — векторно по всем товарам
+        matched_rows = [r for r in rows if str(r.wb_id) in fresh]
+        if matched_rows:
+            prev = to_arrays(*([getattr(r, f) for r in matched_rows] for f in ("price", "basic_price", "stocks")))
+            cur = to_arrays(*([fresh[str(r.wb_id)].get(f) for r in matched_rows] for f in ("price", "basic_price", "stocks")))
+            ids = np.fromiter((r.id for r in matched_rows), dtype=np.int64, count=len(matched_rows))
+            for rule_name, product_ids in evaluate(ids, prev, cur).items():
+                if product_ids.size:
+                    logger.info("🚨 Правило %s: товары %s", rule_name, product_ids.tolist())
+
+        updates: List[Dict[str, Any]] = []
+        for r in rows:
+            item = fresh.get(str(r.wb_id))
+            if not item:
+                continue
+            changes = changed_fields(r._asdict(), item, thresholds)
+            if changes:
+                updates.append({"id": r.id, **changes})
+
+        if updates:
+            # ORM bulk UPDATE по первичному ключу — один executemany вместо загрузки сущностей
+            await session.execute(update(Product), updates)
+            await session.commit()
+
+    # 📈 свежие наблюдения в историю цен пишет parse_wb_details_batch (new_parser.record_prices)
+    logger.info("🔄 Обновление перед выкладкой: %s товаров проверено, %s обновлено", len(rows), len(updates))
+    return len(updates)
+
+
+async def refresh_due_products_job():
+    """Задача планировщика: в каждом интервале выполняется только одним воркером хоста."""
+    cache = get_shared_cache()
+    if cache is not None:
+        lease_ttl = max(REFRESH_INTERVAL_MINUTES * 60 - 10, 10)
+        try:
+            if not await asyncio.to_thread(cache.try_lease, "refresh", "due_products", lease_ttl):
+                return
+        except Exception as e:
+            logger.warning("⚠️ Не удалось взять lease на обновление, обновляем сами: %s", e)
+    try:
+        await refresh_due_products()
+    except Exception as e:
+        logger.warning("⚠️ Ошибка обновления товаров перед выкладкой: %s", e)
@@ -0,0 +1,220 @@
+# shared_cache.py
+import os
+import time
+import uuid
+import random
+import sqlite3
+import asyncio
+import logging
+import tempfile
+import threading
+from typing import Any, Awaitable, Callable, Optional
+from metrics import CACHE_REQUESTS
+from json_codec import dumps_str, loads
+
+logger = logging.getLogger(__name__)
+
+# Общий для всех процессов хоста (бот + воркеры backend) кэш результатов парсинга на SQLite в WAL-режиме.
+# Файл — в /run/wbsellers (RuntimeDirectory обоих unit'ов), а не в /tmp: при PrivateTmp у каждого
+# unit'а свой /tmp, и бот с backend молча перестали бы делить кэш и аренды.
+# Вне systemd (локально, без /run/wbsellers) — во временном каталоге
+PARSE_CACHE_ENABLED = os.getenv("PARSE_CACHE_ENABLED", "1") == "1"
+RUN_DIR = "/run/wbsellers"
+PARSE_CACHE_PATH = os.getenv(
+    "PARSE_CACHE_PATH",
+    os.path.join(RUN_DIR, "parse_cache.sqlite3") if os.path.isdir(RUN_DIR)
+    else os.path.join(tempfile.gettempdir(), "wbsellers_parse_cache.sqlite3"),
+)
+# TTL (сек) по пространствам имён
+PARSE_CACHE_TTL = int(os.getenv("PARSE_CACHE_TTL", "600"))
+IMAGE_BASE_CACHE_TTL = int(os.getenv("IMAGE_BASE_CACHE_TTL", str(7 * 24 * 3600)))
+# Лимит строк на пространство имён
+PARSE_CACHE_MAX_ROWS = int(os.getenv("PARSE_CACHE_MAX_ROWS", "50000"))
+# Сколько ждём, пока другой процесс заполнит ключ, прежде чем идти в WB самим
+PARSE_CACHE_LEASE_WAIT = float(os.getenv("PARSE_CACHE_LEASE_WAIT", "15"))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    ns TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value TEXT NOT NULL,
+    expires_at REAL NOT NULL,
+    PRIMARY KEY (ns, key)
+);
+CREATE INDEX IF NOT EXISTS entries_expires ON entries (ns, expires_at);
+CREATE TABLE IF NOT EXISTS leases (
+    ns TEXT NOT NULL,
+    key TEXT NOT NULL,
+    owner TEXT NOT NULL,
+    expires_at REAL NOT NULL,
+    PRIMARY KEY (ns, key)
+);
+"""
+
+
+class SharedCache:
+    """
+    Дисковый кэш «ns/key → JSON» с TTL, общий для процессов одного хоста.
+    Заполнение кооперативное: ключ заполняет тот, кто взял lease, остальные ждут результат.
+    """
+
+    def __init__(self, path: str = PARSE_CACHE_PATH, max_rows: int = PARSE_CACHE_MAX_ROWS):
+        self.path = path
+        self.max_rows = max_rows
+        self.owner = uuid.uuid4().hex
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(_SCHEMA)
+            self._conn = conn
+        return self._conn
+
+    # --- синхронные операции (выполняются в потоке) ---
+
+    def get(self, ns: str, key: str) -> Optional[Any]:
+        with self._lock:
+            row = self._connect().execute(
+                "SELECT value FROM entries WHERE ns = ? AND key = ? AND expires_at > ?",
+                (ns, key, time.time()),
+            ).fetchone()
+        return loads(row[0]) if row else None
+
+    def set(self, ns: str, key: str, value: Any, ttl: float) -> None:
+        payload = dumps_str(value)
+        with self._lock:
+            self._connect().execute(
+                "INSERT OR REPLACE INTO entries (ns, key, value, expires_at) VALUES (?, ?, ?, ?)",
+                (ns, key, payload, time.time() + ttl),
+            )
+        # чистку делаем изредка, чтобы не платить за неё на каждой записи
+        if random.random() < 0.01:
+            self.prune(ns)
+
+    def delete(self, ns: str, key: str) -> None:
+        with self._lock:
+            self._connect().execute("DELETE FROM entries WHERE ns = ? AND key = ?", (ns, key))
+
+    def try_lease(self, ns: str, key: str, ttl: float) -> bool:
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            conn.execute("DELETE FROM leases WHERE ns = ? AND key = ? AND expires_at <= ?", (ns, key, now))
+            cur = conn.execute(
+                "INSERT OR IGNORE INTO leases (ns, key, owner, expires_at) VALUES (?, ?, ?, ?)",
+                (ns, key, self.owner, now + ttl),
+            )
+        return cur.rowcount == 1
+
+    def release(self, ns: str, key: str) -> None:
+        with self._lock:
+            self._connect().execute(
+                "DELETE FROM leases WHERE ns = ? AND key = ? AND owner = ?", (ns, key, self.owner)
+            )
+
+    def prune(self, ns: str) -> None:
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            conn.execute("DELETE FROM entries WHERE ns = ? AND expires_at <= ?", (ns, now))
+            conn.execute("DELETE FROM leases WHERE expires_at <= ?", (now,))
+            # лимит размера — выкидываем те, что истекут раньше всех
+            conn.execute(
+                """
+                DELETE FROM entries WHERE ns = ? AND key IN (
+                    SELECT key FROM entries WHERE ns = ?
+                    ORDER BY expires_at DESC LIMIT -1 OFFSET ?
+                )
+                """,
+                (ns, ns, self.max_rows),
+            )
+
+    # --- async-обёртки ---
+
+    async def aget(self, ns: str, key: str) -> Optional[Any]:
+        try:
+            return await asyncio.to_thread(self.get, ns, key)
+        except sqlite3.Error as e:
+            logger.warning("⚠️ shared cache get %s/%s: %s", ns, key, e)
+            return None
+
+    async def aset(self, ns: str, key: str, value: Any, ttl: float) -> None:
+        try:
+            await asyncio.to_thread(self.set, ns, key, value, ttl)
+        except sqlite3.Error as e:
+            logger.warning("⚠️ shared cache set %s/%s: %s", ns, key, e)
+
+    async def adelete(self, ns: str, key: str) -> None:
+        try:
+            await asyncio.to_thread(self.delete, ns, key)
+        except sqlite3.Error as e:
+            logger.warning("⚠️ shared cache delete %s/%s: %s", ns, key, e)
+
+    async def get_or_fill(
+        self,
+        ns: str,
+        key: str,
+        ttl: float,
+        fill: Callable[[], Awaitable[Any]],
+        cacheable: Callable[[Any], bool] = lambda v: v is not None,
+    ) -> Any:
+        """Значение из кэша; иначе fill() — одним процессом на хосте, остальные дожидаются результата."""
+        value = await self.aget(ns, key)
+        if value is not None:
+            CACHE_REQUESTS.labels(f"shared_{ns}", "hit").inc()
+            return value
+
+        try:
+            leased = await asyncio.to_thread(self.try_lease, ns, key, PARSE_CACHE_LEASE_WAIT)
+        except sqlite3.Error as e:
+            logger.warning("⚠️ shared cache lease %s/%s: %s", ns, key, e)
+            CACHE_REQUESTS.labels(f"shared_{ns}", "miss").inc()
+            return await fill()
+
+        if not leased:
+            # кто-то уже идёт в WB за этим ключом — ждём его результат.
+            # Аренда освободилась без значения (fill() упал или результат не кэшируется) — заполняем сами
+            deadline = time.monotonic() + PARSE_CACHE_LEASE_WAIT
+            while not leased and time.monotonic() < deadline:
+                await asyncio.sleep(0.1)
+                value = await self.aget(ns, key)
+                if value is not None:
+                    CACHE_REQUESTS.labels(f"shared_{ns}", "wait").inc()
+                    return value
+                try:
+                    leased = await asyncio.to_thread(self.try_lease, ns, key, PARSE_CACHE_LEASE_WAIT)
+                except sqlite3.Error:
+                    pass
+            if not leased:
+                CACHE_REQUESTS.labels(f"shared_{ns}", "miss").inc()
+                return await fill()
+
+        CACHE_REQUESTS.labels(f"shared_{ns}", "miss").inc()
+        try:
+            value = await fill()
+            if cacheable(value):
+                await self.aset(ns, key, value, ttl)
+            return value
+        finally:
+            try:
+                await asyncio.to_thread(self.release, ns, key)
+            except sqlite3.Error:
+                pass
+
+
+_cache: Optional[SharedCache] = None
+
+
+def get_shared_cache() -> Optional[SharedCache]:
+    """Кэш процесса или None, если выключен через PARSE_CACHE_ENABLED=0."""
+    global _cache
+    if not PARSE_CACHE_ENABLED:
+        return None
+    if _cache is None:
+        _cache = SharedCache()
+        logger.info("🗄 Общий кэш парсинга: %s", _cache.path)
+    return _cache
@@ -0,0 +1,268 @@
+# standin.py
+"""
+Локальные заглушки внешних API для нагрузочных прогонов и проверок без сети.
+
+- StandInServer: основа — aiohttp.web в своём потоке и event loop, счётчики запросов.
+- FakeTelegramServer: Bot API (/bot<token>/<method>) — sendMessage/sendPhoto/... отвечают
+  правдоподобным Message, остальное — true. Задержка, доля 5xx и 429 с retry_after настраиваются.
+- FakeYooKassaServer: /v3/payments — создание (с Idempotence-Key), получение и отмена платежа;
+  notification() собирает уведомление payment.succeeded, как его прислала бы YooKassa.
+- Заглушка WB — wb_replay.ReplayServer.
+
+Backend/бот направляются на заглушки через TELEGRAM_API_URL, YOOKASSA_API_URL и WB_UPSTREAM_URL.
+Отдельным процессом (чтобы не делить GIL с генератором нагрузки):
+    python -m standin telegram --port 8901
+    python -m standin yookassa --port 8902
+"""
+import time
+import uuid
+import random
+import asyncio
+import logging
+import argparse
+import threading
+from abc import ABC, abstractmethod
+from collections import Counter
+from typing import Any, Dict, Optional
+
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+
+class StandInServer(ABC):
+    """aiohttp.web-стенд: start()/stop() в текущем цикле или start_in_thread()/stop_thread()."""
+
+    def __init__(self, seed: Optional[int] = None):
+        self.random = random.Random(seed)
+        self.stats: Counter = Counter()
+        self.url: Optional[str] = None
+        self._thread: Optional[threading.Thread] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._runner: Optional[web.AppRunner] = None
+
+    @abstractmethod
+    def setup_routes(self, app: web.Application) -> None:
+        ...
+
+    def reset_stats(self) -> None:
+        self.stats.clear()
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        app = web.Application(client_max_size=16 * 1024 * 1024)
+        self.setup_routes(app)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        sock = site._server.sockets[0]
+        self.url = f"http://{host}:{sock.getsockname()[1]}"
+        return self.url
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    def start_in_thread(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        """Стенд в своём потоке и event loop — чтобы не делить цикл с измеряемым клиентом."""
+        started = threading.Event()
+
+        def run():
+            self._loop = asyncio.new_event_loop()
+            self._loop.run_until_complete(self.start(host, port))
+            started.set()
+            self._loop.run_forever()
+            self._loop.run_until_complete(self.stop())
+            self._loop.close()
+
+        self._thread = threading.Thread(target=run, name=type(self).__name__, daemon=True)
+        self._thread.start()
+        started.wait()
+        return self.url
+
+    def stop_thread(self) -> None:
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+            self._loop = None
+
+    async def serve_forever(self, host: str, port: int) -> None:
+        logger.info("🎭 %s: %s", type(self).__name__, await self.start(host, port))
+        try:
+            await asyncio.Event().wait()
+        finally:
+            await self.stop()
+            logger.info("📊 %s", dict(self.stats))
+
+
+async def _params(request: web.Request) -> Dict[str, Any]:
+    """Параметры вызова Bot API: PTB шлёт форму (или multipart с файлами), другие клиенты — JSON."""
+    if request.content_type == "application/json":
+        try:
+            return await request.json()
+        except ValueError:
+            return {}
+    return dict(await request.post())
+
+
+class FakeTelegramServer(StandInServer):
+    MESSAGE_METHODS = {"sendMessage", "sendPhoto", "sendInvoice", "sendDocument", "editMessageText", "copyMessage"}
+
+    def __init__(self, latency_ms: float = 30.0, error_rate: float = 0.0, rate_429: float = 0.0,
+                 seed: Optional[int] = None):
+        super().__init__(seed)
+        self.latency_ms = latency_ms
+        self.error_rate = error_rate
+        self.rate_429 = rate_429
+        self._message_id = 0
+
+    def setup_routes(self, app: web.Application) -> None:
+        app.router.add_route("*", "/bot{token}/{method}", self._handle)
+
+    def _message(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        self._message_id += 1
+        chat_id = params.get("chat_id", 0)
+        try:
+            chat = {"id": int(chat_id), "type": "private", "first_name": "Load"}
+        except (TypeError, ValueError):
+            # @channel
+            chat = {"id": -1000000000001, "type": "channel", "title": str(chat_id), "username": str(chat_id).lstrip("@")}
+        message = {"message_id": self._message_id, "date": int(time.time()), "chat": chat}
+        if params.get("text"):
+            message["text"] = params["text"]
+        if params.get("caption"):
+            message["caption"] = params["caption"]
+        return message
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        self.stats["requests"] += 1
+        self.stats[f"method:{method}"] += 1
+        params = await _params(request)
+        await asyncio.sleep(self.latency_ms * self.random.uniform(0.5, 1.5) / 1000)
+
+        roll = self.random.random()
+        if roll < self.rate_429:
+            self.stats["status:429"] += 1
+            return web.json_response({
+                "ok": False, "error_code": 429, "description": "Too Many Requests: retry after 1",
+                "parameters": {"retry_after": 1},
+            }, status=429)
+        if roll < self.rate_429 + self.error_rate:
+            self.stats["status:502"] += 1
+            return web.json_response({"ok": False, "error_code": 502, "description": "Bad Gateway"}, status=502)
+
+        if method == "getMe":
+            result: Any = {"id": 1, "is_bot": True, "first_name": "LoadTest", "username": "loadtest_bot",
+                           "can_join_groups": True, "can_read_all_group_messages": False,
+                           "supports_inline_queries": False}
+        elif method in self.MESSAGE_METHODS:
+            result = self._message(params)
+        else:
+            result = True
+        self.stats["status:200"] += 1
+        return web.json_response({"ok": True, "result": result})
+
+
+class FakeYooKassaServer(StandInServer):
+    def __init__(self, latency_ms: float = 80.0, error_rate: float = 0.0, seed: Optional[int] = None):
+        super().__init__(seed)
+        self.latency_ms = latency_ms
+        self.error_rate = error_rate
+        self.payments: Dict[str, Dict[str, Any]] = {}
+        self._by_key: Dict[str, str] = {}
+
+    def setup_routes(self, app: web.Application) -> None:
+        app.router.add_post("/v3/payments", self._create)
+        app.router.add_get("/v3/payments/{id}", self._get)
+        app.router.add_post("/v3/payments/{id}/cancel", self._cancel)
+
+    async def _delay(self, kind: str) -> Optional[web.Response]:
+        self.stats["requests"] += 1
+        self.stats[f"call:{kind}"] += 1
+        await asyncio.sleep(self.latency_ms * self.random.uniform(0.5, 1.5) / 1000)
+        if self.random.random() < self.error_rate:
+            self.stats["status:500"] += 1
+            return web.json_response({"type": "error", "code": "internal_server_error"}, status=500)
+        return None
+
+    async def _create(self, request: web.Request) -> web.Response:
+        failed = await self._delay("create")
+        if failed:
+            return failed
+        body = await request.json()
+        key = request.headers.get("Idempotence-Key")
+        if key and key in self._by_key:
+            return web.json_response(self.payments[self._by_key[key]])
+        pid = str(uuid.uuid4())
+        self.payments[pid] = {
+            "id": pid, "status": "pending", "paid": False, "test": True,
+            "amount": body.get("amount"), "description": body.get("description"),
+            "metadata": body.get("metadata") or {},
+            "confirmation": {"type": "redirect", "confirmation_url": f"{self.url}/checkout/{pid}"},
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%S.000Z", time.gmtime()),
+            "recipient": {"account_id": "000000", "gateway_id": "000000"},
+        }
+        if key:
+            self._by_key[key] = pid
+        self.stats["status:200"] += 1
+        return web.json_response(self.payments[pid])
+
+    async def _get(self, request: web.Request) -> web.Response:
+        failed = await self._delay("get")
+        if failed:
+            return failed
+        payment = self.payments.get(request.match_info["id"])
+        if payment is None:
+            return web.json_response({"type": "error", "code": "not_found"}, status=404)
+        return web.json_response(payment)
+
+    async def _cancel(self, request: web.Request) -> web.Response:
+        failed = await self._delay("cancel")
+        if failed:
+            return failed
+        payment = self.payments.get(request.match_info["id"])
+        if payment is None:
+            return web.json_response({"type": "error", "code": "not_found"}, status=404)
+        if payment["status"] == "pending":
+            payment["status"] = "canceled"
+        return web.json_response(payment)
+
+    @staticmethod
+    def notification(payment: Dict[str, Any], event: str = "payment.succeeded") -> Dict[str, Any]:
+        """Тело уведомления на /api/payments/callback для платежа (ответа GET /v3/payments/{id})."""
+        obj = dict(payment)
+        if event == "payment.succeeded":
+            obj.update(status="succeeded", paid=True, captured_at=time.strftime("%Y-%m-%dT%H:%M:%S.000Z", time.gmtime()))
+        elif event == "payment.canceled":
+            obj.update(status="canceled")
+        return {"type": "notification", "event": event, "object": obj}
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Заглушки внешних API")
+    ap.add_argument("service", choices=("telegram", "yookassa"))
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, required=True)
+    ap.add_argument("--latency-ms", type=float, default=None)
+    ap.add_argument("--error-rate", type=float, default=0.0)
+    ap.add_argument("--rate-429", type=float, default=0.0, help="только для telegram")
+    args = ap.parse_args()
+    from app_logging import setup_logging
+    setup_logging()
+
+    if args.service == "telegram":
+        server = FakeTelegramServer(error_rate=args.error_rate, rate_429=args.rate_429)
+    else:
+        server = FakeYooKassaServer(error_rate=args.error_rate)
+    if args.latency_ms is not None:
+        server.latency_ms = args.latency_ms
+    try:
+        asyncio.run(server.serve_forever(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
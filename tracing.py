@@ -0,0 +1,485 @@
+# tracing.py
+"""
+Трассировка заказа через все хопы: апдейт бота -> /api/payments/create -> YooKassa -> callback /
+successful_payment -> /api/products/add -> парсер WB -> планировщик -> publish_product.
+
+Текущий спан — в contextvars; между процессами контекст едет заголовком W3C traceparent
+(бот -> backend) и полем metadata.traceparent платежа YooKassa, в задачу планировщика — аргументом.
+Спаны копятся у локального корня и целиком уходят в фоновый поток: JSONL-файл (TRACE_FILE)
+и/или коллектор в формате Zipkin v2 (TRACE_COLLECTOR_URL — Zipkin, Jaeger, OTel Collector).
+Без экспортёров трассировка выключена: span() ничего не делает, traced() не оборачивает функцию.
+
+Водопад по заказу (order_id) или trace id:
+    python -m tracing <order_id|trace_id> [--file /var/log/wbsellers/traces.jsonl]
+"""
+import os
+import sys
+import json
+import time
+import queue
+import random
+import atexit
+import argparse
+import functools
+import threading
+import contextvars
+import urllib.request
+from typing import Any, Dict, List, Optional, Tuple
+
+# Куда писать спаны: JSONL-файл (общий для бота и воркеров backend) и/или Zipkin-совместимый коллектор
+TRACE_FILE = os.getenv("TRACE_FILE", "")
+TRACE_COLLECTOR_URL = os.getenv("TRACE_COLLECTOR_URL", "")  # например http://127.0.0.1:9411/api/v2/spans
+TRACE_ENABLED = bool(TRACE_FILE or TRACE_COLLECTOR_URL)
+# Доля новых трасс, которые пишем (продолжения чужих трасс следуют флагу из traceparent)
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "1.0"))
+# Сколько трасс может ждать экспорта; сверх — выбрасываем, а не копим память
+TRACE_QUEUE_MAX = int(os.getenv("TRACE_QUEUE_MAX", "10000"))
+# Потолок спанов на одну локальную трассу (длинные циклы не раздувают буфер)
+TRACE_MAX_SPANS = int(os.getenv("TRACE_MAX_SPANS", "2000"))
+
+_service = os.getenv("TRACE_SERVICE_NAME", "wbsellers")
+_current: contextvars.ContextVar = contextvars.ContextVar("trace_span", default=None)
+
+
+def set_service(name: str) -> None:
+    """Имя процесса в спанах (localEndpoint.serviceName): bot, backend, ..."""
+    global _service
+    _service = os.getenv("TRACE_SERVICE_NAME", name)
+
+
+def _new_id(bits: int) -> str:
+    return f"{random.getrandbits(bits):0{bits // 4}x}"
+
+
+def parse_traceparent(value: Any) -> Optional[Tuple[str, str, bool]]:
+    """'00-<trace 32 hex>-<span 16 hex>-<flags>' -> (trace_id, span_id, sampled) или None."""
+    if not isinstance(value, str):
+        return None
+    parts = value.strip().split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16 or len(parts[3]) != 2:
+        return None
+    try:
+        int(parts[1], 16), int(parts[2], 16)
+        flags = int(parts[3], 16)
+    except ValueError:
+        return None
+    if parts[1] == "0" * 32 or parts[2] == "0" * 16:
+        return None
+    return parts[1], parts[2], bool(flags & 1)
+
+
+class Span:
+    """
+    Интервал работы. Корень локальной трассы (root is self) держит trace id, флаг сэмплирования
+    и буфер завершённых потомков; потомки читают trace id у корня при экспорте, так что
+    join_trace() переносит в трассу заказа и уже завершённые спаны.
+    """
+
+    __slots__ = (
+        "name", "span_id", "parent_id", "root", "kind", "attrs", "error", "start_us", "duration_us", "_t0",
+        "trace_id", "sampled", "buffer", "finished",
+    )
+
+    def __init__(self, name: str, parent: "Optional[Span]" = None,
+                 remote: Optional[Tuple[str, str, bool]] = None, kind: Optional[str] = None,
+                 attrs: Optional[Dict[str, Any]] = None):
+        self.name = name
+        self.span_id = _new_id(64)
+        self.kind = kind
+        self.attrs = {k: v for k, v in attrs.items() if v is not None} if attrs else {}
+        self.error = None
+        self.duration_us = None
+        if parent is not None:
+            self.root = parent.root
+            self.parent_id = parent.span_id
+        else:
+            self.root = self
+            self.buffer = []
+            self.finished = False
+            if remote is not None:
+                self.trace_id, self.parent_id, self.sampled = remote
+            else:
+                self.trace_id, self.parent_id = _new_id(128), None
+                self.sampled = random.random() < TRACE_SAMPLE_RATE
+        self.start_us = time.time_ns() // 1000
+        self._t0 = time.perf_counter_ns()
+
+    def set(self, **attrs) -> None:
+        self.attrs.update((k, v) for k, v in attrs.items() if v is not None)
+
+    def traceparent(self) -> str:
+        return f"00-{self.root.trace_id}-{self.span_id}-{'01' if self.root.sampled else '00'}"
+
+    def end(self, error: Optional[BaseException] = None) -> None:
+        if self.duration_us is not None:
+            return
+        self.duration_us = max((time.perf_counter_ns() - self._t0) // 1000, 1)
+        if error is not None:
+            self.error = f"{type(error).__name__}: {error}"[:300]
+        root = self.root
+        if self is root:
+            root.finished = True
+            if root.sampled:
+                _exporter.put(root.buffer + [root])
+            root.buffer = None
+        elif root.finished:
+            # фоновая задача пережила свой корень — отправляем спан отдельно
+            if root.sampled:
+                _exporter.put([self])
+        elif len(root.buffer) < TRACE_MAX_SPANS:
+            root.buffer.append(self)
+
+    def to_zipkin(self) -> Dict[str, Any]:
+        tags = {k: str(v) for k, v in self.attrs.items()}
+        if self.error:
+            tags["error"] = self.error
+        record = {
+            "traceId": self.root.trace_id,
+            "id": self.span_id,
+            "name": self.name,
+            "timestamp": self.start_us,
+            "duration": self.duration_us,
+            "localEndpoint": {"serviceName": _service},
+            "tags": tags,
+        }
+        if self.parent_id:
+            record["parentId"] = self.parent_id
+        if self.kind:
+            record["kind"] = self.kind
+        return record
+
+
+class _NoopSpan:
+    """Заглушка при выключенной трассировке: тот же интерфейс, ноль работы."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def set(self, **attrs) -> None:
+        pass
+
+    def end(self, error: Optional[BaseException] = None) -> None:
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class _SpanScope:
+    """with span(...): спан становится текущим на время блока."""
+
+    __slots__ = ("span", "_token")
+
+    def __init__(self, span: Span):
+        self.span = span
+        self._token = None
+
+    def __enter__(self) -> Span:
+        self._token = _current.set(self.span)
+        return self.span
+
+    def __exit__(self, exc_type, exc, tb):
+        _current.reset(self._token)
+        self.span.end(exc)
+        return False
+
+
+def _make_span(name: str, parent: Optional[str], kind: Optional[str], attrs: Dict[str, Any]) -> Span:
+    remote = parse_traceparent(parent) if parent else None
+    if remote is not None:
+        return Span(name, remote=remote, kind=kind, attrs=attrs)
+    return Span(name, parent=_current.get(), kind=kind, attrs=attrs)
+
+
+def span(name: str, parent: Optional[str] = None, kind: Optional[str] = None, **attrs):
+    """
+    Контекстный менеджер спана. parent — traceparent из другого процесса (заголовок, metadata);
+    без него спан — потомок текущего или новый корень.
+    """
+    if not TRACE_ENABLED:
+        return NOOP_SPAN
+    return _SpanScope(_make_span(name, parent, kind, attrs))
+
+
+def start_span(name: str, kind: Optional[str] = None, **attrs):
+    """Спан с ручным end(), не становится текущим — для колбэков (aiohttp TraceConfig и т.п.)."""
+    if not TRACE_ENABLED:
+        return NOOP_SPAN
+    return _make_span(name, None, kind, attrs)
+
+
+def traced(name: str):
+    """Декоратор корутины: весь вызов — один спан."""
+    def decorator(fn):
+        if not TRACE_ENABLED:
+            return fn
+
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            with span(name):
+                return await fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def current_span() -> Optional[Span]:
+    return _current.get()
+
+
+def current_traceparent() -> Optional[str]:
+    """traceparent текущего спана — для заголовка/metadata; None, если трассировки нет."""
+    s = _current.get()
+    return s.traceparent() if s is not None else None
+
+
+def set_attrs(**attrs) -> None:
+    s = _current.get()
+    if s is not None:
+        s.set(**attrs)
+
+
+def join_trace(traceparent: Optional[str], **attrs) -> None:
+    """
+    Переносит текущую локальную трассу (например, апдейт бота) в трассу заказа из metadata платежа:
+    корень получает её trace id и родителя, атрибуты (order_id, ...) вешаются на корень.
+    """
+    s = _current.get()
+    if s is None:
+        return
+    root = s.root
+    if root.finished:
+        return
+    remote = parse_traceparent(traceparent)
+    if remote is not None:
+        root.trace_id, root.parent_id, root.sampled = remote
+    root.set(**attrs)
+
+
+def detach_scheduler(scheduler) -> None:
+    """
+    APScheduler запускает задачи из контекста того, кто последним его разбудил (add_job внутри
+    запроса), — без этого спаны задач цеплялись бы к чужой, давно завершённой трассе.
+    """
+    wakeup = scheduler.wakeup
+    scheduler.wakeup = lambda: contextvars.Context().run(wakeup)
+
+
+class TracingMiddleware:
+    """ASGI-middleware: спан на запрос, продолжает трассу из заголовка traceparent."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not TRACE_ENABLED:
+            return await self.app(scope, receive, send)
+
+        header = None
+        for key, value in scope.get("headers") or ():
+            if key == b"traceparent":
+                header = value.decode("latin-1")
+                break
+
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        with span(f"{scope['method']} {scope['path']}", parent=header, kind="SERVER") as s:
+            try:
+                await self.app(scope, receive, send_wrapper)
+            finally:
+                route = scope.get("route")
+                if route is not None:
+                    s.name = f"{scope['method']} {route.path}"
+                s.set(status=status, path=scope["path"])
+
+
+def instrument_engine(engine) -> None:
+    """Спан на каждый SQL-запрос движка (только внутри уже начатой трассы)."""
+    if not TRACE_ENABLED:
+        return
+    from sqlalchemy import event
+    sync_engine = getattr(engine, "sync_engine", engine)
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        if _current.get() is None:
+            return
+        s = Span("db.query", parent=_current.get(), kind="CLIENT", attrs={"db.statement": statement[:300]})
+        conn.info.setdefault("trace_spans", []).append(s)
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        spans = conn.info.get("trace_spans")
+        if spans:
+            s = spans.pop()
+            rowcount = getattr(cursor, "rowcount", -1)
+            if rowcount is not None and rowcount >= 0:
+                s.set(rows=rowcount)
+            s.end()
+
+    @event.listens_for(sync_engine, "handle_error")
+    def _error(exception_context):
+        conn = exception_context.connection
+        spans = conn.info.get("trace_spans") if conn is not None else None
+        if spans:
+            spans.pop().end(exception_context.original_exception)
+
+
+class _Exporter:
+    """Фоновый поток: пачки спанов -> JSONL-файл и/или POST в коллектор. Event loop не ждёт диск и сеть."""
+
+    def __init__(self):
+        self.queue: "queue.Queue[Optional[List[Span]]]" = queue.Queue(maxsize=TRACE_QUEUE_MAX)
+        self.dropped = 0
+        self.exported = 0
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def put(self, spans: List[Span]) -> None:
+        if self._thread is None:
+            self._start()
+        try:
+            self.queue.put_nowait(spans)
+        except queue.Full:
+            self.dropped += len(spans)
+
+    def _start(self) -> None:
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="trace-exporter", daemon=True)
+                self._thread.start()
+                atexit.register(self.flush)
+
+    def _run(self) -> None:
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            batch = list(item)
+            # добираем всё, что уже накопилось, — одна запись/запрос на пачку
+            while len(batch) < 1000:
+                try:
+                    item = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    self._write(batch)
+                    return
+                batch.extend(item)
+            self._write(batch)
+
+    def _write(self, batch: List[Span]) -> None:
+        records = [s.to_zipkin() for s in batch]
+        if TRACE_FILE:
+            try:
+                lines = "".join(json.dumps(r, ensure_ascii=False) + "\n" for r in records)
+                # O_APPEND + одна запись на пачку: бот и воркеры backend пишут в один файл
+                fd = os.open(TRACE_FILE, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o640)
+                try:
+                    os.write(fd, lines.encode("utf-8"))
+                finally:
+                    os.close(fd)
+            except OSError as e:
+                print(f"⚠️ Не удалось записать трассы в {TRACE_FILE}: {e}")
+        if TRACE_COLLECTOR_URL:
+            try:
+                req = urllib.request.Request(
+                    TRACE_COLLECTOR_URL, data=json.dumps(records).encode("utf-8"),
+                    headers={"Content-Type": "application/json"}, method="POST",
+                )
+                urllib.request.urlopen(req, timeout=2).close()
+            except Exception as e:
+                print(f"⚠️ Коллектор трасс недоступен ({len(records)} спанов потеряно): {e}")
+        self.exported += len(records)
+
+    def flush(self, timeout: float = 2.0) -> None:
+        if self._thread is None:
+            return
+        try:
+            self.queue.put(None, timeout=timeout)
+        except queue.Full:
+            return
+        self._thread.join(timeout)
+
+
+_exporter = _Exporter()
+
+
+# --- водопад из JSONL ---
+
+def load_spans(path: str) -> List[Dict[str, Any]]:
+    spans = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                try:
+                    spans.append(json.loads(line))
+                except ValueError:
+                    continue
+    return spans
+
+
+def render_waterfall(spans: List[Dict[str, Any]], width: int = 40) -> str:
+    """Спаны одной трассы -> дерево с отступами, смещением от начала и полосой длительности."""
+    if not spans:
+        return "(нет спанов)"
+    start = min(s["timestamp"] for s in spans)
+    end = max(s["timestamp"] + s.get("duration", 0) for s in spans)
+    total = max(end - start, 1)
+    ids = {s["id"] for s in spans}
+    children: Dict[Optional[str], List[Dict[str, Any]]] = {}
+    for s in spans:
+        parent = s.get("parentId") if s.get("parentId") in ids else None
+        children.setdefault(parent, []).append(s)
+    for items in children.values():
+        items.sort(key=lambda s: s["timestamp"])
+
+    lines = [f"trace {spans[0]['traceId']}: {len(spans)} спанов, {total / 1000:.1f} мс"]
+
+    def walk(parent, depth):
+        for s in children.get(parent, []):
+            offset, duration = s["timestamp"] - start, s.get("duration", 0)
+            a = int(offset / total * width)
+            b = max(int((offset + duration) / total * width), a + 1)
+            bar = " " * a + "█" * (b - a) + " " * (width - b)
+            tags = s.get("tags") or {}
+            note = " ❌" if "error" in tags else ""
+            lines.append(
+                f"{offset / 1000:>10.1f} мс {duration / 1000:>9.1f} мс |{bar}| "
+                f"{'  ' * depth}{s.get('localEndpoint', {}).get('serviceName', '?')}: {s['name']}{note}"
+            )
+            walk(s["id"], depth + 1)
+
+    walk(None, 0)
+    return "\n".join(lines)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    ap = argparse.ArgumentParser(description="Водопад трассы по order_id или trace id")
+    ap.add_argument("key", help="order_id (из metadata платежа) или trace id")
+    ap.add_argument("--file", default=TRACE_FILE or "traces.jsonl")
+    args = ap.parse_args(argv)
+
+    spans = load_spans(args.file)
+    trace_ids = {s["traceId"] for s in spans if s["traceId"] == args.key}
+    if not trace_ids:
+        trace_ids = {s["traceId"] for s in spans if (s.get("tags") or {}).get("order_id") == args.key}
+    if not trace_ids:
+        print(f"❌ Нет спанов для {args.key} в {args.file}")
+        sys.exit(1)
+    for trace_id in sorted(trace_ids):
+        print(render_waterfall([s for s in spans if s["traceId"] == trace_id]))
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,336 @@
+# wb_replay.py
+"""
+Запись и воспроизведение ответов WB для WBParser — бенчмарки и проверки парсера без сети.
+
+- Recorder: aiohttp.TraceConfig, который пишет каждый обмен с card.wb.ru / geobasket / wbbasket
+  (метод, URL, статус, заголовки, тело, задержка, ошибка соединения) в JSONL-фикстуру.
+- ReplayServer: локальный стенд (standin.StandInServer), отдающий записанное. Парсер ходит в него через
+  WBParser(upstream_url=...) или WB_UPSTREAM_URL: https://<host>/<path> -> {url}/<host>/<path>.
+  Задержка — записанная (× latency_scale) или фиксированная; можно подмешать 5xx, обрывы и 429.
+  Незаписанный URL -> miss_status (404, как у basket-хостов без такой картинки).
+  Пакетный card.wb.ru (nm=1;2;3) без точной записи собирается из одиночных ответов.
+- synthesize(): правдоподобные фикстуры для N артикулов, когда записи с реальным WB нет.
+
+Запуск из корня репозитория:
+    python -m wb_replay record https://www.wildberries.ru/catalog/123456789/detail.aspx --out fixtures/wb/sample.jsonl
+    python -m wb_replay synth --count 200 --out /tmp/wb_synth.jsonl
+    python -m wb_replay serve /tmp/wb_synth.jsonl --port 8900 --rate-429 0.02
+    WB_UPSTREAM_URL=http://127.0.0.1:8900 python main.py
+"""
+import os
+import re
+import glob
+import json
+import time
+import base64
+import random
+import asyncio
+import argparse
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional
+from urllib.parse import urlsplit
+
+import aiohttp
+from aiohttp import web
+
+from metrics import host_group
+from standin import StandInServer
+
+# Заголовки, которые имеет смысл воспроизводить (тело пишем уже распакованным)
+KEEP_HEADERS = ("Content-Type", "Retry-After", "Location")
+# Тела картинок не храним — парсеру важен только статус
+TEXT_TYPES = ("json", "text", "javascript", "xml")
+_NM_PARAM = re.compile(r"nm=([^&]*)")
+
+
+# --- фикстуры ---
+
+def _exchange(method: str, url: str, status: Optional[int], headers: Optional[Dict[str, str]] = None,
+              body: Optional[bytes] = None, latency_ms: float = 0.0, error: Optional[str] = None) -> Dict[str, Any]:
+    ex: Dict[str, Any] = {
+        "method": method.upper(), "url": url, "status": status,
+        "headers": {k: v for k, v in (headers or {}).items() if k in KEEP_HEADERS},
+        "latency_ms": round(latency_ms, 2), "error": error,
+    }
+    ctype = ex["headers"].get("Content-Type", "")
+    if body and any(t in ctype for t in TEXT_TYPES):
+        try:
+            ex["body"] = body.decode("utf-8")
+        except UnicodeDecodeError:
+            ex["body_b64"] = base64.b64encode(body).decode("ascii")
+    elif body:
+        ex["size"] = len(body)
+    return ex
+
+
+def _body(ex: Dict[str, Any]) -> bytes:
+    if "body" in ex:
+        return ex["body"].encode("utf-8")
+    if "body_b64" in ex:
+        return base64.b64decode(ex["body_b64"])
+    return b""
+
+
+def save_fixtures(exchanges: Iterable[Dict[str, Any]], path: str) -> int:
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    n = 0
+    with open(path, "w", encoding="utf-8") as f:
+        for ex in exchanges:
+            f.write(json.dumps(ex, ensure_ascii=False) + "\n")
+            n += 1
+    return n
+
+
+def load_fixtures(paths: Iterable[str]) -> List[Dict[str, Any]]:
+    """Файлы .jsonl или каталоги с ними."""
+    exchanges: List[Dict[str, Any]] = []
+    for path in paths:
+        files = sorted(glob.glob(os.path.join(path, "*.jsonl"))) if os.path.isdir(path) else [path]
+        for name in files:
+            with open(name, encoding="utf-8") as f:
+                exchanges.extend(json.loads(line) for line in f if line.strip())
+    return exchanges
+
+
+def fixture_articuls(exchanges: Iterable[Dict[str, Any]]) -> List[str]:
+    """Артикулы, для которых записан одиночный ответ card.wb.ru."""
+    found = []
+    for ex in exchanges:
+        if ex["method"] == "GET" and ex["url"].startswith("https://card.wb.ru/"):
+            m = _NM_PARAM.search(ex["url"])
+            if m and ";" not in m.group(1):
+                found.append(m.group(1))
+    return list(dict.fromkeys(found))
+
+
+class Recorder:
+    """Пишет обмены сессии aiohttp: WBParser(trace_configs=[recorder.trace_config()])."""
+
+    def __init__(self):
+        self.exchanges: List[Dict[str, Any]] = []
+
+    def trace_config(self) -> aiohttp.TraceConfig:
+        async def on_start(session, ctx, params):
+            # ключ — исходный URL (после редиректов params.url в on_end уже другой)
+            ctx.url = str(params.url)
+            ctx.started = time.perf_counter()
+
+        async def on_end(session, ctx, params):
+            resp = params.response
+            # тело кэшируется в ответе: вызывающий код потом прочитает его же
+            body = await resp.read()
+            self.exchanges.append(_exchange(
+                params.method, ctx.url, resp.status, dict(resp.headers), body,
+                (time.perf_counter() - ctx.started) * 1000,
+            ))
+
+        async def on_exception(session, ctx, params):
+            error = "timeout" if isinstance(params.exception, asyncio.TimeoutError) else type(params.exception).__name__
+            self.exchanges.append(_exchange(
+                params.method, ctx.url, None, latency_ms=(time.perf_counter() - ctx.started) * 1000, error=error,
+            ))
+
+        trace = aiohttp.TraceConfig()
+        trace.on_request_start.append(on_start)
+        trace.on_request_end.append(on_end)
+        trace.on_request_exception.append(on_exception)
+        return trace
+
+
+# --- стенд ---
+
+class ReplayServer(StandInServer):
+    def __init__(self, exchanges: Iterable[Dict[str, Any]], latency_scale: float = 1.0,
+                 latency_ms: Optional[float] = None, miss_latency_ms: float = 20.0, miss_status: int = 404,
+                 error_rate: float = 0.0, drop_rate: float = 0.0, rate_429: float = 0.0, seed: Optional[int] = None):
+        super().__init__(seed)
+        # (метод, url) -> записи; повторные запросы идут по кругу
+        self.index: Dict[tuple, List[Dict[str, Any]]] = {}
+        for ex in exchanges:
+            self.index.setdefault((ex["method"], ex["url"]), []).append(ex)
+        self.latency_scale = latency_scale
+        self.latency_ms = latency_ms
+        self.miss_latency_ms = miss_latency_ms
+        self.miss_status = miss_status
+        self.error_rate = error_rate
+        self.drop_rate = drop_rate
+        self.rate_429 = rate_429
+        self._turn: Counter = Counter()
+
+    def setup_routes(self, app: web.Application) -> None:
+        app.router.add_route("*", "/{tail:.*}", self._handle)
+
+    def _lookup(self, method: str, url: str) -> Optional[Dict[str, Any]]:
+        records = self.index.get((method, url))
+        if records is None and method == "HEAD":
+            records = self.index.get(("GET", url))
+        if records is None:
+            return self._compose_batch(url) if method == "GET" else None
+        key = (method, url)
+        ex = records[self._turn[key] % len(records)]
+        self._turn[key] += 1
+        return ex
+
+    def _compose_batch(self, url: str) -> Optional[Dict[str, Any]]:
+        """card.wb.ru/...&nm=1;2;3 без записи — склеиваем products из одиночных ответов."""
+        m = _NM_PARAM.search(url)
+        nms = m.group(1).split(";") if m else []
+        if urlsplit(url).netloc != "card.wb.ru" or len(nms) < 2:
+            return None
+        products, latency = [], 0.0
+        for nm in nms:
+            ex = self.index.get(("GET", _NM_PARAM.sub(f"nm={nm}", url)), [None])[0]
+            if ex is None or ex.get("status") != 200:
+                continue
+            products.extend(json.loads(_body(ex)).get("products") or [])
+            latency = max(latency, ex["latency_ms"])
+        body = json.dumps({"products": products}, ensure_ascii=False).encode("utf-8")
+        return _exchange("GET", url, 200, {"Content-Type": "application/json; charset=utf-8"}, body, latency)
+
+    async def _handle(self, request: web.Request) -> web.StreamResponse:
+        host, _, path = request.raw_path.lstrip("/").partition("/")
+        url = f"https://{host}/{path}"
+        group = host_group(url)
+        self.stats["requests"] += 1
+        self.stats[f"group:{group}"] += 1
+
+        ex = self._lookup(request.method, url)
+        if ex is None:
+            self.stats["misses"] += 1
+        delay = self.latency_ms if self.latency_ms is not None else (
+            ex["latency_ms"] * self.latency_scale if ex else self.miss_latency_ms)
+        await asyncio.sleep(delay * self.random.uniform(0.8, 1.2) / 1000)
+
+        roll = self.random.random()
+        if roll < self.drop_rate or (ex and ex.get("error")):
+            self.stats["dropped"] += 1
+            request.transport.abort()
+            raise web.HTTPServiceUnavailable()
+        if roll < self.drop_rate + self.error_rate:
+            self.stats["status:503"] += 1
+            return web.Response(status=503, text="injected")
+        if roll < self.drop_rate + self.error_rate + self.rate_429:
+            self.stats["status:429"] += 1
+            return web.Response(status=429, headers={"Retry-After": "1"}, text="Too Many Requests")
+        if ex is None:
+            self.stats[f"status:{self.miss_status}"] += 1
+            return web.Response(status=self.miss_status)
+
+        self.stats[f"status:{ex['status']}"] += 1
+        return web.Response(status=ex["status"], headers=ex["headers"], body=_body(ex) or None)
+
+
+# --- синтетические фикстуры ---
+
+DETAIL_URL = "https://card.wb.ru/cards/v4/detail?appType=1&curr=rub&dest=-1257786&spp=0&nm={}"
+CARD_URL = "https://sam-basket-cdn-01mt.geobasket.ru/vol{}/part{}/{}/info/ru/card.json"
+IMAGE_URL = "https://basket-{:02d}.wbbasket.ru/vol{}/part{}/{}/images/{}/1.{}"
+JSON_TYPE = {"Content-Type": "application/json; charset=utf-8"}
+
+
+def synthesize(articuls: Iterable[str], seed: int = 0) -> List[Dict[str, Any]]:
+    """card.json, card.wb.ru v4 и найденная картинка на одном из basket-хостов для каждого артикула."""
+    exchanges = []
+    for articul in articuls:
+        rnd = random.Random(f"{seed}:{articul}")
+        nm = int(articul)
+        price = rnd.randrange(300, 20000) * 100
+        sizes = [
+            {"name": name, "price": {"basic": price, "product": price * rnd.randrange(40, 95) // 100},
+             "stocks": [{"wh": rnd.randrange(1, 300), "qty": rnd.randrange(0, 50)} for _ in range(rnd.randrange(1, 4))]}
+            for name in rnd.sample(["XS", "S", "M", "L", "XL", "XXL"], rnd.randrange(1, 6))
+        ]
+        product = {
+            "id": nm, "name": f"Товар {articul}", "brand": rnd.choice(["Zara", "Nike", "Тефаль", "Lego"]),
+            "supplierName": f"ИП Продавец {rnd.randrange(1000)}", "reviewRating": round(rnd.uniform(3.5, 5), 1),
+            "feedbacks": rnd.randrange(0, 5000), "pics": rnd.randrange(1, 10), "sizes": sizes,
+        }
+        card = {
+            "imt_name": product["name"], "selling": {"brand_name": product["brand"]},
+            "description": "Описание товара. " * rnd.randrange(5, 40),
+            "options": [{"name": f"Характеристика {i}", "value": f"Значение {i}"} for i in range(rnd.randrange(3, 25))],
+        }
+        body = lambda obj: json.dumps(obj, ensure_ascii=False).encode("utf-8")
+        exchanges.append(_exchange("GET", CARD_URL.format(articul[:4], articul[:6], articul), 200, JSON_TYPE,
+                                   body(card), rnd.uniform(30, 120)))
+        exchanges.append(_exchange("GET", DETAIL_URL.format(articul), 200, JSON_TYPE,
+                                   body({"products": [product]}), rnd.uniform(60, 200)))
+        exchanges.append(_exchange("HEAD", IMAGE_URL.format(rnd.randrange(1, 33), nm // 100000, nm // 1000, nm, "big", "webp"),
+                                   200, {"Content-Type": "image/webp"}, latency_ms=rnd.uniform(15, 60)))
+    return exchanges
+
+
+def synthetic_articuls(count: int, seed: int = 0) -> List[str]:
+    rnd = random.Random(seed)
+    return [str(rnd.randrange(10_000_000, 400_000_000)) for _ in range(count)]
+
+
+# --- CLI ---
+
+async def _record(targets: List[str], out: str, batch: bool) -> None:
+    import shared_cache
+    from new_parser import WBParser
+
+    # без общего кэша, иначе запросы в WB не случатся и записывать будет нечего
+    shared_cache.PARSE_CACHE_ENABLED = False
+    recorder = Recorder()
+    parser = WBParser(upstream_url=None, trace_configs=[recorder.trace_config()])
+    try:
+        urls = [t if t.startswith("http") else f"https://www.wildberries.ru/catalog/{t}/detail.aspx" for t in targets]
+        for url in urls:
+            result = await parser.parse_product(url)
+            print(f"{'✅' if result.get('success') else '❌'} {url}")
+        if batch:
+            articuls = [WBParser.extract_articul(u) for u in urls]
+            found = await parser.parse_api_details_batch([a for a in articuls if a])
+            print(f"📦 Пакет: {len(found)}/{len(articuls)}")
+    finally:
+        await parser.close()
+    print(f"💾 {save_fixtures(recorder.exchanges, out)} обменов -> {out}")
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Запись/воспроизведение ответов WB")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+
+    rec = sub.add_parser("record", help="распарсить товары через реальный WB и записать обмены")
+    rec.add_argument("targets", nargs="+", help="URL товаров или артикулы")
+    rec.add_argument("--out", required=True)
+    rec.add_argument("--batch", action="store_true", help="записать и пакетный запрос цен/остатков")
+
+    syn = sub.add_parser("synth", help="синтетические фикстуры")
+    syn.add_argument("--count", type=int, default=100)
+    syn.add_argument("--seed", type=int, default=0)
+    syn.add_argument("--out", required=True)
+
+    srv = sub.add_parser("serve", help="поднять стенд")
+    srv.add_argument("fixtures", nargs="+")
+    srv.add_argument("--host", default="127.0.0.1")
+    srv.add_argument("--port", type=int, default=8900)
+    srv.add_argument("--latency-scale", type=float, default=1.0)
+    srv.add_argument("--latency-ms", type=float, default=None, help="фиксированная задержка вместо записанной")
+    srv.add_argument("--error-rate", type=float, default=0.0, help="доля ответов 503")
+    srv.add_argument("--drop-rate", type=float, default=0.0, help="доля оборванных соединений")
+    srv.add_argument("--rate-429", type=float, default=0.0, help="доля ответов 429")
+    args = ap.parse_args()
+
+    if args.cmd == "record":
+        asyncio.run(_record(args.targets, args.out, args.batch))
+    elif args.cmd == "synth":
+        n = save_fixtures(synthesize(synthetic_articuls(args.count, args.seed), args.seed), args.out)
+        print(f"💾 {n} обменов ({args.count} артикулов) -> {args.out}")
+    else:
+        server = ReplayServer(
+            load_fixtures(args.fixtures), latency_scale=args.latency_scale, latency_ms=args.latency_ms,
+            error_rate=args.error_rate, drop_rate=args.drop_rate, rate_429=args.rate_429,
+        )
+
+        print(f"🎭 Стенд WB: {len(server.index)} URL, WB_UPSTREAM_URL=http://{args.host}:{args.port}")
+        try:
+            asyncio.run(server.serve_forever(args.host, args.port))
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == "__main__":
+    main()